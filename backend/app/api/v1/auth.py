@@ -16,7 +16,7 @@ from domain.services.generate_google_auth_url_service import (
 from domain.services.handle_google_auth_callback_usecase_service import (
     HandleGoogleAuthCallbackService,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 router = APIRouter()
@@ -41,14 +41,14 @@ async def google_auth_login() -> Dict[str, str]:
 @router.get("/google/callback")
 async def google_auth_callback(
     code: str,
-    db: Session = Depends(get_db_connection),
+    db: AsyncSession = Depends(get_db_connection),
 ) -> RedirectResponse:
     """
     Google OAuth2認証のコールバックを処理し、アクセストークンを生成します。
 
     Args:
         code (str): Google認証から返されたauthorization code
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
 
     Returns:
         TokenResponse: 生成されたアクセストークンと種類を含むレスポンス
@@ -60,7 +60,7 @@ async def google_auth_callback(
         HandleGoogleAuthCallbackService(db=db)
     )
     try:
-        return google_auth_callback_service.execute(code)
+        return await google_auth_callback_service.execute(code)
     except Exception as e:
         logger.error(f"Failed to handle Google auth callback: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
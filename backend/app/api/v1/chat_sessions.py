@@ -1,7 +1,8 @@
 import logging
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from typing import Any, Dict, List
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
 from application.services.user import get_user_payload
 from infrastructure.database.connection import get_db_connection
 from utilities.dict import get_user_id_from_dict
@@ -17,16 +18,26 @@ logger = logging.getLogger(__name__)
 
 @router.get("/", response_model=List[ChatSessionResponse])
 async def get_chat_history(
+    before: Optional[datetime] = Query(default=None),
+    before_id: Optional[int] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=100),
     current_user: Dict[str, Any] = Depends(get_user_payload),
-    db: Session = Depends(get_db_connection),
+    db: AsyncSession = Depends(get_db_connection),
     redis: RedisRepository = Depends(get_redis_connection),
 ):
     """
-    指定されたユーザーのチャットセッション履歴を取得します。
+    指定されたユーザーのチャットセッション履歴を、(開始時刻, ID) の新しい順に1ページ分取得します。
+
+    カーソルがない場合は最新のページを返します。末尾のセッションの `startTime` を `before` に、
+    `id` を `before_id` に渡すと、その続きのページを取得できます（開始時刻が同じセッションも
+    読み飛ばさない）。`before` だけを渡した場合は、その時刻より前に開始したセッションを返します。
 
     Args:
+        before (Optional[datetime]): 前のページの末尾のセッションの開始時刻
+        before_id (Optional[int]): 前のページの末尾のセッションのID
+        limit (int): 1ページのセッションの数
         current_user (Dict[str, Any]): アクセストークンから取得したユーザーペイロード
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         redis (Redis): Redisクライアント
 
     Returns:
@@ -37,7 +48,9 @@ async def get_chat_history(
     """
     chat_session_service = ChatSessionService(db, redis)
     user_id = get_user_id_from_dict(current_user)
-    return await chat_session_service.get_chat_history(user_id)
+    return await chat_session_service.get_chat_history(
+        user_id, before=before, limit=limit, before_id=before_id
+    )
 
 
 # @router.post(
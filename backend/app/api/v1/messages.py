@@ -1,7 +1,7 @@
 import logging
-from fastapi import APIRouter, Depends
-from typing import Any, Dict, List
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query
+from typing import Any, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from application.services.user import get_user_payload
 from infrastructure.database.connection import get_db_connection
 from domain.services.message_service import MessageService
@@ -18,27 +18,38 @@ logger = logging.getLogger(__name__)
 @router.get("/{chat_session_id}", response_model=List[MessageResponse])
 async def get_messages_by_session_id(
     chat_session_id: ChatSessionID,
+    before: Optional[int] = Query(default=None, ge=1),
+    after: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(default=100, ge=1, le=100),
     current_user: Dict[str, Any] = Depends(get_user_payload),
-    db: Session = Depends(get_db_connection),
+    db: AsyncSession = Depends(get_db_connection),
     redis: RedisRepository = Depends(get_redis_connection),
 ):
     """
-    指定された `chat_session_id` に基づいてメッセージのリストを取得します。
+    指定された `chat_session_id` に基づいてメッセージを1ページ分、古い順に取得します。
+
+    カーソルがない場合は最新のページを返します。先頭のメッセージのIDを `before` に渡すと
+    それより古いページ、末尾のメッセージのIDを `after` に渡すとそれより新しいページを取得できます。
 
     Args:
         chat_session_id (int): メッセージを取得するスレッドのID
+        before (Optional[int]): このIDより古いメッセージのうち新しい `limit` 件を取得する
+        after (Optional[int]): このIDより新しいメッセージのうち古い `limit` 件を取得する
+        limit (int): 1ページのメッセージの数
         current_user (Dict[str, Any]): アクセストークンから取得したユーザーペイロード
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         redis (Redis): Redisクライアント
 
     Returns:
         List[MessageResponse]: 指定されたスレッドに含まれるメッセージのリスト
 
     Raises:
-        HTTPException: スレッドIDに関連するメッセージが見つからない場合
+        HTTPException: before と after を両方指定した場合、またはメッセージの取得に失敗した場合
     """
     message_service = MessageService(db, redis)
-    return await message_service.get_messages_by_session_id(chat_session_id)
+    return await message_service.get_messages_by_session_id(
+        chat_session_id, before=before, after=after, limit=limit
+    )
 
 
 # @router.post("/conversation", response_model=MessageResponse)
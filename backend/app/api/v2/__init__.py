@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 
 from .chat_sessions import router as chat_sessions_router
+from .conversations import router as conversations_router
 from .messages import router as messages_router
 
 router = APIRouter()
@@ -9,3 +10,6 @@ router.include_router(
     chat_sessions_router, prefix="/chat_sessions", tags=["chat_sessions"]
 )
 router.include_router(messages_router, prefix="/messages", tags=["messages"])
+router.include_router(
+    conversations_router, prefix="/conversations", tags=["conversations"]
+)
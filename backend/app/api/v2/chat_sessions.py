@@ -1,43 +1,76 @@
 import logging
+from contextlib import suppress
 from fastapi import (
     APIRouter,
     Depends,
     WebSocket,
     WebSocketDisconnect,
+    status,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from application.services.admission_controller import (
+    AdmissionTimeout,
+    admission_controller,
+)
+from application.services.resumable_stream import (
+    create_turn_stream,
+    resumable_streams,
+)
+from application.services.stream_flush_policy import (
+    AdaptiveFlushPolicy,
+    FlushPolicy,
+)
+from application.services.websocket_stream import stream_to_websocket
 from application.services.user_message import retrieve_user_message
 from infrastructure.database.connection import get_db_connection
-from infrastructure.cache.redis.redis_keys import get_sessions_list_key
 from domain.services.agent_service import AgentService
 from utilities.dict import get_user_id_from_dict
 from infrastructure.cache.connection import get_redis_connection
 from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.cache.redis.redis_single_flight import SingleFlightAbandoned
+from infrastructure.llm.connection import (
+    get_llm_client_registry,
+    get_prompt_chain_cache,
+)
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
 from utilities.access_token import verify_access_token
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def create_flush_policy() -> FlushPolicy:
+    """新規セッションの最初の回答は体感速度を優先し、細かめにフラッシュする"""
+    return AdaptiveFlushPolicy(min_size=8, max_size=1024, max_interval=0.15)
+
+
 @router.websocket("/create")
 async def websocket_create_chat_session(
     websocket: WebSocket,
     access_token: str,
-    db: Session = Depends(get_db_connection),
+    db: AsyncSession = Depends(get_db_connection),
     redis: RedisRepository = Depends(get_redis_connection),
+    llm_registry: LLMClientRegistry = Depends(get_llm_client_registry),
+    prompt_cache: PromptChainCache = Depends(get_prompt_chain_cache),
 ):
     """
     Args:
         websocket (WebSocket): WebSocket接続オブジェクト
         access_token (string): 認証用のトークン
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         redis (Redis): Redisクライアント
+        llm_registry (LLMClientRegistry): 共有LLMクライアントのレジストリ
+        prompt_cache (PromptChainCache): コンパイル済みプロンプトのキャッシュ
     """
-    agent_service = AgentService(db=db, redis=redis)
+    agent_service = AgentService(
+        db=db, redis=redis, llm_registry=llm_registry, prompt_cache=prompt_cache
+    )
 
     token_payload = verify_access_token(access_token)
     user_id = get_user_id_from_dict(token_payload)
     await websocket.accept()
+    close_code = status.WS_1000_NORMAL_CLOSURE
 
     try:
         raw_message = await websocket.receive_text()
@@ -46,22 +79,53 @@ async def websocket_create_chat_session(
         # AgentServiceを使用してチャットセッションを作成
         session_id = await agent_service.create_chat_session(user_id, message_content)
 
-        cache_key_pattern = get_sessions_list_key(user_id)
-        await agent_service.delete_cache(cache_key_pattern)
+        async def notify_queue_position(position: int) -> None:
+            # 切断しても生成は再接続を待って続くので、送信の失敗は無視する
+            with suppress(Exception):
+                await websocket.send_json(
+                    {"session_id": session_id, "queue_position": position}
+                )
 
         # 新規作成時はcontextがないので空にする
-        async for chunk in agent_service.process_message(
-            message_content, session_id, context=[]
-        ):
-            await websocket.send_json(
-                {
-                    "session_id": session_id,
-                    "content": chunk,
-                }
-            )
+        turn_stream = create_turn_stream(redis)
+        turn_id = await resumable_streams.start(
+            session_id,
+            agent_service.process_message(
+                message_content,
+                session_id,
+                context=[],
+                flush_policy=create_flush_policy(),
+            ),
+            store=turn_stream,
+            admission=admission_controller.admit(
+                user_id, redis=redis, on_queued=notify_queue_position
+            ),
+        )
+        await stream_to_websocket(
+            websocket,
+            resumable_streams.subscribe(turn_id, store=turn_stream),
+            lambda item: {
+                "session_id": session_id,
+                "turn_id": turn_id,
+                "seq": item[0],
+                "content": item[1],
+                "prompt_version": agent_service.prompt_version,
+            },
+        )
+
+    except AdmissionTimeout as e:
+        logger.warning(f"Admission timed out for session {session_id}: {str(e)}")
+        await websocket.send_json({"session_id": session_id, "error": str(e)})
+        close_code = status.WS_1013_TRY_AGAIN_LATER
+
+    except SingleFlightAbandoned as e:
+        logger.warning(f"Shared response abandoned for session {session_id}")
+        await websocket.send_json({"session_id": session_id, "error": str(e)})
+        close_code = status.WS_1013_TRY_AGAIN_LATER
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for session {session_id}")
+        close_code = None
 
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -70,4 +134,5 @@ async def websocket_create_chat_session(
         )
 
     finally:
-        await websocket.close()
+        if close_code is not None:
+            await websocket.close(code=close_code)
@@ -0,0 +1,81 @@
+import logging
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from application.services.conversation_socket import ConversationSocket
+from infrastructure.database.connection import get_db_connection
+from domain.services.agent_service import AgentService
+from infrastructure.cache.connection import get_redis_connection
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.llm.connection import (
+    get_llm_client_registry,
+    get_prompt_chain_cache,
+)
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
+from utilities.dict import get_user_id_from_dict
+from utilities.access_token import verify_access_token
+from .chat_sessions import create_flush_policy as create_first_flush_policy
+from .messages import create_flush_policy
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.websocket("/ws")
+async def websocket_conversation_session(
+    websocket: WebSocket,
+    access_token: str,
+    db: AsyncSession = Depends(get_db_connection),
+    redis: RedisRepository = Depends(get_redis_connection),
+    llm_registry: LLMClientRegistry = Depends(get_llm_client_registry),
+    prompt_cache: PromptChainCache = Depends(get_prompt_chain_cache),
+):
+    """
+    1つの接続で複数ターンの会話を扱う（/create と /conversation の両方を兼ねる）
+
+    認証やDB・Redisの準備は接続時に一度だけ行い、以降のターンでは使い回す。
+
+    Args:
+        websocket (WebSocket): WebSocket接続オブジェクト
+        access_token (string): 認証用のトークン
+        db (AsyncSession): データベースセッション
+        redis (Redis): Redisクライアント
+        llm_registry (LLMClientRegistry): 共有LLMクライアントのレジストリ
+        prompt_cache (PromptChainCache): コンパイル済みプロンプトのキャッシュ
+    """
+    agent_service = AgentService(
+        db=db, redis=redis, llm_registry=llm_registry, prompt_cache=prompt_cache
+    )
+
+    token_payload = verify_access_token(access_token)
+    user_id = get_user_id_from_dict(token_payload)
+    await websocket.accept()
+    close_code = None
+
+    try:
+        close_code = await ConversationSocket(
+            websocket,
+            db=db,
+            redis=redis,
+            agent_service=agent_service,
+            user_id=user_id,
+            create_flush_policy=create_flush_policy,
+            create_first_flush_policy=create_first_flush_policy,
+        ).run()
+
+    except WebSocketDisconnect:
+        logger.info(f"Conversation WebSocket disconnected for user {user_id}")
+
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+
+    finally:
+        if close_code is not None:
+            await websocket.close(code=close_code, reason="idle timeout")
@@ -1,68 +1,163 @@
 import logging
+from contextlib import suppress
 
 from fastapi import (
     APIRouter,
     Depends,
+    HTTPException,
     WebSocket,
     WebSocketDisconnect,
+    status,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from application.services.admission_controller import (
+    AdmissionTimeout,
+    admission_controller,
+)
+from application.services.resumable_stream import (
+    TurnNotFound,
+    create_turn_stream,
+    resumable_streams,
+)
+from application.services.stream_flush_policy import (
+    AdaptiveFlushPolicy,
+    FlushPolicy,
+)
+from application.services.websocket_stream import stream_to_websocket
 from application.services.user_message import (
+    retrieve_last_seq,
     retrieve_session_id,
+    retrieve_turn_id,
     retrieve_user_message,
 )
 from infrastructure.database.connection import get_db_connection
 from domain.services.agent_service import AgentService
 from infrastructure.cache.connection import get_redis_connection
 from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.cache.redis.redis_single_flight import SingleFlightAbandoned
+from infrastructure.llm.connection import (
+    get_llm_client_registry,
+    get_prompt_chain_cache,
+)
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
+from utilities.dict import get_user_id_from_dict
 from utilities.access_token import verify_access_token
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def create_flush_policy() -> FlushPolicy:
+    """会話の続きはまとめて送り、送信回数を抑える"""
+    return AdaptiveFlushPolicy(min_size=32, max_size=4096, max_interval=0.25)
+
+
 @router.websocket("/conversation")
 async def websocket_conversation(
     websocket: WebSocket,
     access_token: str,
     session_id: int = 0,
-    db: Session = Depends(get_db_connection),
+    db: AsyncSession = Depends(get_db_connection),
     redis: RedisRepository = Depends(get_redis_connection),
+    llm_registry: LLMClientRegistry = Depends(get_llm_client_registry),
+    prompt_cache: PromptChainCache = Depends(get_prompt_chain_cache),
 ):
     """
     Args:
         websocket (WebSocket): WebSocket接続オブジェクト
         access_token (string): 認証用のトークン
         session_id (int): ユーザーのセッションID
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         redis (Redis): Redisクライアント
+        llm_registry (LLMClientRegistry): 共有LLMクライアントのレジストリ
+        prompt_cache (PromptChainCache): コンパイル済みプロンプトのキャッシュ
     """
-    agent_service = AgentService(db=db, redis=redis)
+    agent_service = AgentService(
+        db=db, redis=redis, llm_registry=llm_registry, prompt_cache=prompt_cache
+    )
 
-    verify_access_token(access_token)
+    token_payload = verify_access_token(access_token)
+    user_id = get_user_id_from_dict(token_payload)
     await websocket.accept()
+    close_code = status.WS_1000_NORMAL_CLOSURE
 
     try:
         raw_message = await websocket.receive_text()
-        message_content = retrieve_user_message(raw_message)
         session_id = retrieve_session_id(raw_message)
+        last_seq = retrieve_last_seq(raw_message)
+        turn_stream = create_turn_stream(redis)
+
+        # 他のユーザーのセッションの回答を再生したり、続きを生成したりさせない
+        await agent_service.verify_session_owner(session_id, user_id)
+
+        if last_seq is not None:
+            # 再接続: 生成中（または直近）の回答を受信済みの seq の続きから再生する
+            turn_id = await resumable_streams.find_turn(
+                session_id, turn_stream, turn_id=retrieve_turn_id(raw_message) or None
+            )
+            if turn_id is None:
+                raise TurnNotFound(f"No resumable turn for session {session_id}")
+        else:
+            message_content = retrieve_user_message(raw_message)
+            context = await agent_service.get_conversation_history(session_id)
+
+            async def notify_queue_position(position: int) -> None:
+                # 切断しても生成は再接続を待って続くので、送信の失敗は無視する
+                with suppress(Exception):
+                    await websocket.send_json(
+                        {"session_id": session_id, "queue_position": position}
+                    )
 
-        context = await agent_service.get_conversation_history(session_id)
-
-        # Process LLM and stream the response
-        async for chunk in agent_service.process_message(
-            message_content, session_id, context
-        ):
-            await websocket.send_json(
-                {
-                    "session_id": session_id,
-                    "content": chunk,
-                }
+            # Process LLM in the background so that a reconnecting client can resume
+            turn_id = await resumable_streams.start(
+                session_id,
+                agent_service.process_message(
+                    message_content,
+                    session_id,
+                    context,
+                    flush_policy=create_flush_policy(),
+                ),
+                store=turn_stream,
+                admission=admission_controller.admit(
+                    user_id, redis=redis, on_queued=notify_queue_position
+                ),
             )
+            last_seq = 0
+
+        await stream_to_websocket(
+            websocket,
+            resumable_streams.subscribe(turn_id, last_seq, turn_stream),
+            lambda item: {
+                "session_id": session_id,
+                "turn_id": turn_id,
+                "seq": item[0],
+                "content": item[1],
+                "prompt_version": agent_service.prompt_version,
+            },
+        )
+
+    except TurnNotFound as e:
+        logger.info(f"Nothing to resume for session {session_id}: {str(e)}")
+        await websocket.send_json({"session_id": session_id, "error": str(e)})
+
+    except HTTPException as e:
+        await websocket.send_json({"session_id": session_id, "error": e.detail})
+
+    except AdmissionTimeout as e:
+        logger.warning(f"Admission timed out for session {session_id}: {str(e)}")
+        await websocket.send_json({"session_id": session_id, "error": str(e)})
+        close_code = status.WS_1013_TRY_AGAIN_LATER
+
+    except SingleFlightAbandoned as e:
+        logger.warning(f"Shared response abandoned for session {session_id}")
+        await websocket.send_json({"session_id": session_id, "error": str(e)})
+        close_code = status.WS_1013_TRY_AGAIN_LATER
 
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for session {session_id}")
+        close_code = None
 
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
@@ -71,4 +166,5 @@ async def websocket_conversation(
         )
 
     finally:
-        await websocket.close()
+        if close_code is not None:
+            await websocket.close(code=close_code)
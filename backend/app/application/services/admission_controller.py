@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from infrastructure.cache.redis.redis_admission_limiter import (
+    ACQUIRED,
+    GLOBAL_LIMIT_REACHED,
+    RedisAdmissionLimiter,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+QueuePositionCallback = Callable[[int], Awaitable[None]]
+
+
+class AdmissionTimeout(Exception):
+    """キューでの待ち時間が上限を超えた場合の例外"""
+
+
+class _Waiter:
+    """実行枠を待っているリクエスト"""
+
+    def __init__(
+        self,
+        user_id: str,
+        start_tag: float,
+        finish_tag: float,
+        sequence: int,
+        limiter: Optional[RedisAdmissionLimiter],
+    ):
+        self.user_id = user_id
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.sequence = sequence
+        self.limiter = limiter
+        self.lease_id = uuid.uuid4().hex
+        self.admitted = False
+        self.changed = asyncio.Event()
+
+
+class AdmissionController:
+    """
+    LLMストリームの開始前に実行枠を割り当てるクラス
+
+    プロセス全体の同時実行数とユーザーごとの同時実行数を制限し、
+    空きがない場合は重み付きの公平なキュー（ユーザーごとの仮想時間）で順番を待たせる。
+    Redisを使う場合はレプリカ全体の同時実行数もリースで制限する。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = config.ADMISSION_MAX_CONCURRENCY,
+        per_user_limit: int = config.ADMISSION_PER_USER_LIMIT,
+        queue_timeout: float = config.ADMISSION_QUEUE_TIMEOUT,
+        redis_enabled: bool = config.ADMISSION_REDIS_ENABLED,
+        redis_retry_interval: float = config.ADMISSION_REDIS_RETRY_INTERVAL,
+    ):
+        self._max_concurrency = max_concurrency
+        self._per_user_limit = per_user_limit
+        self._queue_timeout = queue_timeout
+        self._redis_enabled = redis_enabled
+        self._redis_retry_interval = redis_retry_interval
+        self._active = 0
+        self._active_by_user: Dict[str, int] = defaultdict(int)
+        self._waiters: List[_Waiter] = []
+        self._user_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._retry_handle: Optional[asyncio.TimerHandle] = None
+        # Redisのリースを待つ間も割り当ての順番が入れ替わらないように、1つずつ実行する
+        self._dispatch_lock = asyncio.Lock()
+        self._retries: Set[asyncio.Task] = set()
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        user_id: int | str,
+        weight: float = 1.0,
+        redis: Optional[RedisRepository] = None,
+        on_queued: Optional[QueuePositionCallback] = None,
+    ) -> AsyncIterator[None]:
+        """
+        実行枠を取得し、ブロックを抜けるときに解放する
+
+        Args:
+            user_id (int | str): ユーザーID
+            weight (float): キューでの重み（大きいほど多くの枠を割り当てる）
+            redis (RedisRepository): レプリカ間で制限する場合のRedis
+            on_queued (QueuePositionCallback): キューでの順番が変わるたびに呼ばれる
+
+        Raises:
+            AdmissionTimeout: 待ち時間の上限までに枠を取得できなかった場合
+        """
+        limiter = None
+        if self._redis_enabled and redis is not None:
+            limiter = RedisAdmissionLimiter(redis)
+        waiter = self._enqueue(str(user_id), weight, limiter)
+        renewal: Optional[asyncio.Task] = None
+        try:
+            await self._dispatch()
+            if not waiter.admitted:
+                await self._wait(waiter, on_queued)
+            if limiter is not None:
+                renewal = asyncio.create_task(self._renew(waiter))
+            yield
+        finally:
+            if renewal is not None:
+                renewal.cancel()
+                await asyncio.gather(renewal, return_exceptions=True)
+            if waiter.admitted:
+                await self._release(waiter)
+            else:
+                self._waiters.remove(waiter)
+                await self._dispatch()
+
+    def _enqueue(
+        self, user_id: str, weight: float, limiter: Optional[RedisAdmissionLimiter]
+    ) -> _Waiter:
+        start_tag = max(self._virtual_time, self._user_tags.get(user_id, 0.0))
+        finish_tag = start_tag + 1.0 / max(weight, 1e-6)
+        self._user_tags[user_id] = finish_tag
+        waiter = _Waiter(user_id, start_tag, finish_tag, next(self._sequence), limiter)
+        self._waiters.append(waiter)
+        self._waiters.sort(key=lambda w: (w.finish_tag, w.sequence))
+        return waiter
+
+    async def _wait(
+        self, waiter: _Waiter, on_queued: Optional[QueuePositionCallback]
+    ) -> None:
+        metrics.increment("admission_queued")
+        started = time.monotonic()
+        deadline = started + self._queue_timeout
+        position = None
+        while True:
+            waiter.changed.clear()
+            if waiter.admitted:
+                break
+            current = self._waiters.index(waiter) + 1
+            if on_queued is not None and current != position:
+                position = current
+                await on_queued(position)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.increment("admission_timeouts")
+                raise AdmissionTimeout(
+                    f"Timed out after waiting {self._queue_timeout}s for an LLM slot"
+                )
+            try:
+                await asyncio.wait_for(waiter.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        metrics.increment("admission_queue_wait_seconds", time.monotonic() - started)
+
+    async def _dispatch(self) -> None:
+        """空いている枠を仮想終了時刻の小さい順にキューへ割り当てる"""
+        async with self._dispatch_lock:
+            retry = False
+            for waiter in list(self._waiters):
+                if self._active >= self._max_concurrency:
+                    break
+                if self._active_by_user.get(waiter.user_id, 0) >= self._per_user_limit:
+                    continue
+                if waiter.limiter is not None:
+                    result = await waiter.limiter.acquire(
+                        waiter.user_id, waiter.lease_id
+                    )
+                    if waiter not in self._waiters:
+                        # リースを取得している間にタイムアウトなどでキューから抜けた
+                        if result == ACQUIRED:
+                            await waiter.limiter.release(
+                                waiter.user_id, waiter.lease_id
+                            )
+                        continue
+                    if result != ACQUIRED:
+                        retry = True
+                        if result == GLOBAL_LIMIT_REACHED:
+                            break
+                        continue
+
+                self._waiters.remove(waiter)
+                self._active += 1
+                self._active_by_user[waiter.user_id] += 1
+                self._virtual_time = max(self._virtual_time, waiter.start_tag)
+                if self._user_tags.get(waiter.user_id, 0.0) <= self._virtual_time:
+                    self._user_tags.pop(waiter.user_id, None)
+                waiter.admitted = True
+                waiter.changed.set()
+                metrics.increment("admission_admitted")
+
+            # キューの順番が変わった可能性があるので待機中のリクエストに知らせる
+            for waiter in self._waiters:
+                waiter.changed.set()
+            if retry and self._waiters:
+                self._schedule_retry()
+
+            metrics.set_gauge("admission_active", self._active)
+            metrics.set_gauge("admission_queue_length", len(self._waiters))
+
+    def _schedule_retry(self) -> None:
+        """他のレプリカのリースが解放されるのを一定間隔で確認する"""
+        if self._retry_handle is not None:
+            return
+
+        def retry() -> None:
+            self._retry_handle = None
+            task = asyncio.create_task(self._dispatch())
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+
+        self._retry_handle = asyncio.get_running_loop().call_later(
+            self._redis_retry_interval, retry
+        )
+
+    @staticmethod
+    async def _renew(waiter: _Waiter) -> None:
+        """ストリームが続いている間、Redisのリースが期限切れにならないように延ばし続ける"""
+        while True:
+            await asyncio.sleep(waiter.limiter.renew_interval)
+            if not await waiter.limiter.renew(waiter.user_id, waiter.lease_id):
+                # 期限切れで回収された（他のレプリカが枠を使っている可能性がある）
+                metrics.increment("admission_leases_lost")
+                logger.warning(
+                    f"Admission lease {waiter.lease_id} expired before renewal"
+                )
+                return
+
+    async def _release(self, waiter: _Waiter) -> None:
+        self._active -= 1
+        self._active_by_user[waiter.user_id] -= 1
+        if self._active_by_user[waiter.user_id] <= 0:
+            del self._active_by_user[waiter.user_id]
+        if waiter.limiter is not None:
+            await waiter.limiter.release(waiter.user_id, waiter.lease_id)
+        await self._dispatch()
+
+
+# プロセス内で共有するインスタンス
+admission_controller = AdmissionController()
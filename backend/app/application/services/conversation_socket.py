@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing, suppress
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, WebSocket, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from application.services.admission_controller import (
+    AdmissionTimeout,
+    admission_controller,
+)
+from application.services.resumable_stream import (
+    TurnNotFound,
+    create_turn_stream,
+    resumable_streams,
+)
+from application.services.stream_flush_policy import FlushPolicy
+from domain.services.agent_service import AgentService
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.cache.redis.redis_single_flight import SingleFlightAbandoned
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSocket:
+    """
+    1つのWebSocket接続で複数ターンの会話を扱うクラス
+
+    クライアントからは type 付きのJSONを受け取る。
+
+    - ping: pong を返す
+    - message: 回答を生成する（session_id がなければセッションを作成する）
+    - resume: 生成中（または直近）の回答を last_seq の続きから再生する
+
+    サーバーからのメッセージには、ターンを要求したメッセージの message_id を付ける。
+    一定時間ごとに ping を送って接続を維持し、ターンの要求がないまま
+    idle_timeout が過ぎた場合は接続を閉じる。同時に実行できるターンは1つまで。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        db: AsyncSession,
+        redis: RedisRepository,
+        agent_service: AgentService,
+        user_id: int,
+        create_flush_policy: Callable[[], FlushPolicy],
+        create_first_flush_policy: Callable[[], FlushPolicy],
+        ping_interval: float = config.WEBSOCKET_PING_INTERVAL,
+        idle_timeout: float = config.WEBSOCKET_IDLE_TIMEOUT,
+    ):
+        self._websocket = websocket
+        self._db = db
+        self._redis = redis
+        self._agent_service = agent_service
+        self._user_id = user_id
+        self._create_flush_policy = create_flush_policy
+        self._create_first_flush_policy = create_first_flush_policy
+        self._ping_interval = ping_interval
+        self._idle_timeout = idle_timeout
+        self._turn_stream = create_turn_stream(redis)
+        self._send_lock = asyncio.Lock()
+        self._turn: Optional[asyncio.Task] = None
+
+    async def run(self) -> Optional[int]:
+        """
+        クライアントが切断するか、アイドル状態が続くまでメッセージを処理する
+
+        Returns:
+            Optional[int]: サーバーから閉じる場合のクローズコード（クライアントが切断した場合は None）
+        """
+        last_activity = time.monotonic()
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        self._websocket.receive(), self._ping_interval
+                    )
+                except asyncio.TimeoutError:
+                    if self._turn_running:
+                        last_activity = time.monotonic()
+                    elif time.monotonic() - last_activity >= self._idle_timeout:
+                        metrics.increment("websocket_idle_timeouts")
+                        return status.WS_1000_NORMAL_CLOSURE
+                    await self._send({"type": "ping"})
+                    continue
+
+                if message["type"] == "websocket.disconnect":
+                    return None
+                if await self._handle(message.get("text")):
+                    last_activity = time.monotonic()
+        finally:
+            if self._turn is not None:
+                self._turn.cancel()
+                await asyncio.gather(self._turn, return_exceptions=True)
+
+    @property
+    def _turn_running(self) -> bool:
+        return self._turn is not None and not self._turn.done()
+
+    async def _send(self, data: Dict[str, Any]) -> None:
+        # ターンのチャンクと pong が同時に送られても混ざらないようにする
+        async with self._send_lock:
+            await self._websocket.send_json(data)
+
+    @staticmethod
+    def _error(message_id: Any, error: str, **fields: Any) -> Dict[str, Any]:
+        return {"type": "error", "message_id": message_id, "error": error, **fields}
+
+    async def _send_error(self, message_id: Any, error: str, **fields: Any) -> None:
+        with suppress(Exception):
+            await self._send(self._error(message_id, error, **fields))
+
+    async def _handle(self, text: Optional[str]) -> bool:
+        """受信したメッセージを処理し、ターンを開始した場合は True を返す"""
+        try:
+            request = json.loads(text or "")
+            if not isinstance(request, dict):
+                raise ValueError("message must be a JSON object")
+        except ValueError as e:
+            await self._send_error(None, f"Invalid message format: {str(e)}")
+            return False
+
+        message_id = request.get("message_id")
+        request_type = request.get("type")
+        if request_type == "ping":
+            await self._send({"type": "pong", "message_id": message_id})
+            return False
+        if request_type not in ("message", "resume"):
+            await self._send_error(message_id, f"Unknown message type: {request_type}")
+            return False
+        if self._turn_running:
+            await self._send_error(
+                message_id, "Another turn is still in progress on this connection"
+            )
+            return False
+
+        metrics.increment("websocket_turns")
+        self._turn = asyncio.create_task(self._run_turn(message_id, request))
+        return True
+
+    async def _run_turn(self, message_id: Any, request: Dict[str, Any]) -> None:
+        try:
+            reply = await self._play_turn(message_id, request)
+        finally:
+            # 長時間の接続でDBコネクションを占有しないように、ターンごとにプールへ返す
+            await self._db.close()
+        # 後片付けの後に送るので、done を受け取ったクライアントはすぐ次のターンを要求できる
+        with suppress(Exception):
+            await self._send(reply)
+
+    async def _play_turn(
+        self, message_id: Any, request: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """ターンのチャンクを送信し、最後に送る done / error のメッセージを返す"""
+        session_id = request.get("session_id")
+        try:
+            if request["type"] == "resume":
+                turn_id, last_seq = await self._find_turn(request, session_id)
+            else:
+                session_id, turn_id = await self._start_turn(
+                    message_id, request, session_id
+                )
+                last_seq = 0
+
+            async with aclosing(
+                resumable_streams.subscribe(turn_id, last_seq, self._turn_stream)
+            ) as chunks:
+                async for seq, content in chunks:
+                    last_seq = seq
+                    await self._send(
+                        {
+                            "type": "chunk",
+                            "message_id": message_id,
+                            "session_id": session_id,
+                            "turn_id": turn_id,
+                            "seq": seq,
+                            "content": content,
+                            "prompt_version": self._agent_service.prompt_version,
+                        }
+                    )
+            return {
+                "type": "done",
+                "message_id": message_id,
+                "session_id": session_id,
+                "turn_id": turn_id,
+                "seq": last_seq,
+            }
+
+        except AdmissionTimeout as e:
+            logger.warning(f"Admission timed out for session {session_id}: {str(e)}")
+            return self._error(message_id, str(e), retryable=True)
+
+        except SingleFlightAbandoned as e:
+            logger.warning(f"Shared response abandoned for session {session_id}")
+            return self._error(message_id, str(e), retryable=True)
+
+        except TurnNotFound as e:
+            logger.info(f"Nothing to resume for session {session_id}: {str(e)}")
+            return self._error(message_id, str(e))
+
+        except HTTPException as e:
+            return self._error(message_id, str(e.detail))
+
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return self._error(message_id, "Unexpected error occurred", details=str(e))
+
+    async def _find_turn(self, request: Dict[str, Any], session_id: Any):
+        last_seq = request.get("last_seq", 0)
+        if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="'last_seq' must be a non-negative integer.",
+            )
+        if not session_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid message format. 'session_id' field is required.",
+            )
+        await self._agent_service.verify_session_owner(session_id, self._user_id)
+        turn_id = await resumable_streams.find_turn(
+            session_id, self._turn_stream, turn_id=request.get("turn_id") or None
+        )
+        if turn_id is None:
+            raise TurnNotFound(f"No resumable turn for session {session_id}")
+        return turn_id, last_seq
+
+    async def _start_turn(
+        self, message_id: Any, request: Dict[str, Any], session_id: Any
+    ):
+        message_content = request.get("message")
+        if not message_content:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid message format. 'message' field is required.",
+            )
+
+        if session_id:
+            await self._agent_service.verify_session_owner(session_id, self._user_id)
+            context = await self._agent_service.get_conversation_history(session_id)
+            flush_policy = self._create_flush_policy()
+        else:
+            # session_id がなければ、最初のメッセージとしてセッションを作成する
+            session_id = await self._agent_service.create_chat_session(
+                self._user_id, message_content
+            )
+            await self._send(
+                {
+                    "type": "session_created",
+                    "message_id": message_id,
+                    "session_id": session_id,
+                }
+            )
+            context = []
+            flush_policy = self._create_first_flush_policy()
+
+        async def notify_queue_position(position: int) -> None:
+            with suppress(Exception):
+                await self._send(
+                    {
+                        "type": "queued",
+                        "message_id": message_id,
+                        "session_id": session_id,
+                        "queue_position": position,
+                    }
+                )
+
+        turn_id = await resumable_streams.start(
+            session_id,
+            self._agent_service.process_message(
+                message_content, session_id, context, flush_policy=flush_policy
+            ),
+            store=self._turn_stream,
+            admission=admission_controller.admit(
+                self._user_id, redis=self._redis, on_queued=notify_queue_position
+            ),
+        )
+        return session_id, turn_id
@@ -0,0 +1,427 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from infrastructure.cache.redis.redis_keys import (
+    WRITE_BEHIND_DEAD_LETTER_KEY,
+    WRITE_BEHIND_INSTANCES_KEY,
+    WRITE_BEHIND_SPILL_KEY,
+    get_write_behind_journal_key,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import SessionLocal
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# 停止したプロセスのジャーナルをスピルリストに移す（1つのプロセスだけが引き取る）
+ADOPT_JOURNAL_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then return 0 end
+local moved = 0
+while redis.call('LMOVE', KEYS[2], KEYS[3], 'LEFT', 'RIGHT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+# スピルリストから最大ARGV[1]件を自分のジャーナルに移して返す
+CLAIM_SPILL_SCRIPT = """
+local claimed = {}
+for i = 1, tonumber(ARGV[1]) do
+    local payload = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+    if not payload then break end
+    claimed[#claimed + 1] = payload
+end
+return claimed
+"""
+
+
+class _PendingTurn:
+    """保存待ちの1ターン分のメッセージ"""
+
+    def __init__(
+        self,
+        turn_id: str,
+        payload: str,
+        messages: List[Dict[str, Any]],
+        on_flushed: Optional[Callable[[], None]] = None,
+        attempts: int = 0,
+    ):
+        self.turn_id = turn_id
+        self.payload = payload
+        self.messages = messages
+        self.on_flushed = on_flushed
+        # スピルした回数（ジャーナルの payload にも記録する）
+        self.attempts = attempts
+        self.error: Optional[str] = None
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "_PendingTurn":
+        data = json.loads(payload)
+        return cls(
+            data["id"], payload, data["messages"], attempts=data.get("attempts", 0)
+        )
+
+    def retried_payload(self) -> str:
+        """スピルした回数と最後のエラーを記録した payload を返す"""
+        return json.dumps(
+            {**json.loads(self.payload), "attempts": self.attempts, "error": self.error}
+        )
+
+
+class MessageWriteBehind:
+    """
+    保存するメッセージをキューに溜め、複数行の INSERT ... RETURNING でまとめてDBに書き込むクラス
+
+    キューに入れたターンはプロセスごとのRedisのジャーナルにも記録し、保存できたら削除する。
+    リトライしても保存できなかったターンと、停止したプロセスのジャーナルに残ったターンは
+    Redisのスピルリストに移し、いずれかのプロセスが後から保存し直す。max_attempts 回スピルしても
+    保存できなかったターン（削除されたセッションのメッセージなど）は、デッドレターのリストに移して
+    それ以上保存し直さない。
+    メッセージにはターンのIDと位置を client_id として付けて保存するので、保存後にジャーナルから
+    削除する前に停止した場合や、生存中のプロセスのターンを引き取った場合も重複しない。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = config.WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = config.WRITE_BEHIND_FLUSH_INTERVAL,
+        max_pending: int = config.WRITE_BEHIND_MAX_PENDING,
+        max_retries: int = config.WRITE_BEHIND_MAX_RETRIES,
+        retry_backoff: float = config.WRITE_BEHIND_RETRY_BACKOFF,
+        max_attempts: int = config.WRITE_BEHIND_MAX_ATTEMPTS,
+        recovery_interval: float = config.WRITE_BEHIND_RECOVERY_INTERVAL,
+        instance_ttl: int = config.WRITE_BEHIND_INSTANCE_TTL,
+        session_factory: Callable[[], AsyncSession] = SessionLocal,
+    ):
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._max_attempts = max_attempts
+        self._recovery_interval = recovery_interval
+        self._instance_ttl = instance_ttl
+        self._session_factory = session_factory
+        self._instance_id = (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self._journal_key = get_write_behind_journal_key(self._instance_id)
+        self._redis: Optional[RedisRepository] = None
+        self._pending: List[_PendingTurn] = []
+        # このプロセスが受け付け、まだ保存を確認していないターン（スピルしたものを含む）
+        self._unsaved: Dict[str, _PendingTurn] = {}
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._next_recovery = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self, redis: Optional[RedisRepository] = None) -> None:
+        """書き込みループを開始する（Redisがない場合はジャーナルなしで動作する）"""
+        if self._task is not None:
+            return
+        self._redis = redis
+        self._stopping = False
+        if redis is not None:
+            # フラッシュがDBの障害で長引いても生存を通知し続けるよう、別のタスクで送る
+            await self._beat()
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """書き込みループを止め、残っているターンを保存する"""
+        if self._task is None:
+            return
+        # 保存中のバッチを中断しないように、ループが抜けるのを待つ
+        self._stopping = True
+        self._has_pending.set()
+        self._batch_full.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self._flush_pending()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self._redis is not None:
+            try:
+                client = self._redis.client
+                if not await client.llen(self._journal_key):
+                    await client.zrem(WRITE_BEHIND_INSTANCES_KEY, self._instance_id)
+            except Exception as e:
+                logger.warning(f"Failed to unregister write-behind instance: {str(e)}")
+
+    async def enqueue(
+        self,
+        messages: List[Dict[str, Any]],
+        on_flushed: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        1ターン分のメッセージを保存キューに入れる
+
+        Args:
+            messages (List[Dict[str, Any]]): session_id, content, is_user, interrupted を持つメッセージ
+            on_flushed (Callable[[], None]): DBに保存された後に呼ばれる
+        """
+        while len(self._pending) >= self._max_pending:
+            metrics.increment("write_behind_backpressure")
+            self._space.clear()
+            await self._space.wait()
+
+        # ターンのIDと位置を client_id として保存し、保存をやり直しても重複させない
+        turn_id = uuid.uuid4().hex
+        messages = [
+            {**message, "client_id": f"{turn_id}:{index}"}
+            for index, message in enumerate(messages)
+        ]
+        payload = json.dumps({"id": turn_id, "messages": messages})
+        if self._redis is not None:
+            try:
+                await self._redis.client.rpush(self._journal_key, payload)
+            except Exception as e:
+                logger.warning(f"Failed to journal pending messages: {str(e)}")
+        turn = _PendingTurn(turn_id, payload, messages, on_flushed)
+        self._unsaved[turn_id] = turn
+        self._pending.append(turn)
+        self._has_pending.set()
+        if len(self._pending) >= self._batch_size:
+            self._batch_full.set()
+        metrics.set_gauge("write_behind_pending", len(self._pending))
+
+    def unsaved_messages(self, session_id: int) -> List[Dict[str, Any]]:
+        """
+        セッションのメッセージのうち、このプロセスが受け付けてまだ保存を確認していないものを古い順に返す
+
+        キューにあるもの、保存中のもの、スピルしたものを含む。保存済みのものが混ざる場合があるので、
+        DBから読んだメッセージと client_id で突き合わせること。
+        """
+        return [
+            message
+            for turn in self._unsaved.values()
+            for message in turn.messages
+            if message["session_id"] == session_id
+        ]
+
+    def discard_saved(self, saved_client_ids: Set[str]) -> None:
+        """他のプロセスが保存し直したなど、全てのメッセージがDBにあることを確認したターンを忘れる"""
+        for turn_id in {client_id.split(":")[0] for client_id in saved_client_ids}:
+            turn = self._unsaved.get(turn_id)
+            if turn is not None and all(
+                message["client_id"] in saved_client_ids for message in turn.messages
+            ):
+                del self._unsaved[turn_id]
+
+    async def _run(self) -> None:
+        await self._recover()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(
+                    self._has_pending.wait(), self._recovery_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                break
+            # バッチが埋まるか、最初のターンから一定時間が経つまで待つ
+            if self._pending and len(self._pending) < self._batch_size:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_full.wait(), self._flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush_pending()
+            if time.monotonic() >= self._next_recovery:
+                await self._recover()
+
+    async def _flush_pending(self) -> None:
+        pending, self._pending = self._pending, []
+        self._has_pending.clear()
+        self._batch_full.clear()
+        self._space.set()
+        metrics.set_gauge("write_behind_pending", 0)
+        for index in range(0, len(pending), self._batch_size):
+            await self._flush(pending[index : index + self._batch_size])
+
+    async def _flush(self, batch: List[_PendingTurn]) -> None:
+        """バッチを1つのトランザクションで保存する（失敗したターンはスピルする）"""
+        messages = [message for turn in batch for message in turn.messages]
+        started = time.perf_counter()
+        for attempt in range(self._max_retries + 1):
+            try:
+                await self._insert(messages)
+                break
+            except Exception as e:
+                if attempt == self._max_retries:
+                    logger.error(
+                        f"Failed to flush {len(batch)} turns after retries: {str(e)}"
+                    )
+                    await self._flush_individually(batch)
+                    return
+                metrics.increment("write_behind_retries")
+                await asyncio.sleep(self._retry_backoff * 2**attempt)
+
+        metrics.increment("write_behind_flushes")
+        metrics.increment("write_behind_rows", len(messages))
+        metrics.increment("write_behind_flush_seconds", time.perf_counter() - started)
+        await self._after_flush(batch)
+
+    async def _flush_individually(self, batch: List[_PendingTurn]) -> None:
+        """一部のターンだけが原因で失敗した場合に備え、ターンごとに保存し直す"""
+        failed: List[_PendingTurn] = []
+        for turn in batch:
+            try:
+                await self._insert(turn.messages)
+                await self._after_flush([turn])
+            except Exception as e:
+                turn.error = str(e) or type(e).__name__
+                failed.append(turn)
+        if failed:
+            await self._spill(failed)
+
+    async def _insert(self, messages: List[Dict[str, Any]]) -> List[int]:
+        async with self._session_factory() as db:
+            return await MessageRepositoryImpl(
+                db=db, redis=self._redis
+            ).create_messages(messages)
+
+    async def _after_flush(self, batch: List[_PendingTurn]) -> None:
+        """ジャーナルから削除する（メッセージのキャッシュには保存時に追加済み）"""
+        if self._redis is not None:
+            try:
+                pipeline = self._redis.client.pipeline(transaction=False)
+                for turn in batch:
+                    pipeline.lrem(self._journal_key, 1, turn.payload)
+                await pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Failed to clean up after write-behind flush: {str(e)}")
+
+        for turn in batch:
+            self._unsaved.pop(turn.turn_id, None)
+            if turn.on_flushed is None:
+                continue
+            try:
+                turn.on_flushed()
+            except Exception as e:
+                logger.warning(f"Write-behind flush callback failed: {str(e)}")
+
+    async def _spill(self, turns: List[_PendingTurn]) -> None:
+        """
+        保存できなかったターンをスピルリストに移し、後から保存し直す
+
+        スピルした回数が max_attempts に達したターンはデッドレターのリストに移す。
+        """
+        retried: List[_PendingTurn] = []
+        dead: List[_PendingTurn] = []
+        for turn in turns:
+            turn.attempts += 1
+            (dead if turn.attempts >= self._max_attempts else retried).append(turn)
+        metrics.increment("write_behind_spilled_turns", len(retried))
+        for turn in dead:
+            self._unsaved.pop(turn.turn_id, None)
+            logger.error(
+                f"Giving up on a write-behind turn after {turn.attempts} attempts "
+                f"({turn.error}): {turn.retried_payload()}"
+            )
+        metrics.increment("write_behind_dead_lettered_turns", len(dead))
+
+        if self._redis is None:
+            # スピル先がない場合はメモリ上のキューに戻して次のフラッシュで再試行する
+            self._pending[:0] = retried
+            if retried:
+                self._has_pending.set()
+            return
+        try:
+            pipeline = self._redis.client.pipeline(transaction=True)
+            for turn in turns:
+                pipeline.lrem(self._journal_key, 1, turn.payload)
+                pipeline.rpush(
+                    (
+                        WRITE_BEHIND_DEAD_LETTER_KEY
+                        if turn in dead
+                        else WRITE_BEHIND_SPILL_KEY
+                    ),
+                    turn.retried_payload(),
+                )
+            await pipeline.execute()
+        except Exception as e:
+            # ジャーナルには残っているので、このプロセスが停止した後に回収される
+            logger.error(f"Failed to spill {len(turns)} turns: {str(e)}")
+
+    async def _heartbeat(self) -> None:
+        """TTLの間に何度か生存を通知する（1回失敗しても引き取られないように）"""
+        while True:
+            await asyncio.sleep(self._instance_ttl / 3)
+            await self._beat()
+
+    async def _beat(self) -> None:
+        try:
+            await self._redis.client.zadd(
+                WRITE_BEHIND_INSTANCES_KEY, {self._instance_id: time.time()}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to send write-behind heartbeat: {str(e)}")
+
+    async def _recover(self) -> None:
+        """
+        停止したプロセスのジャーナルとスピルリストのターンを保存し直す
+        """
+        self._next_recovery = time.monotonic() + self._recovery_interval
+        if self._redis is None:
+            return
+        client = self._redis.client
+        try:
+            now = time.time()
+            dead_instances = await client.zrangebyscore(
+                WRITE_BEHIND_INSTANCES_KEY, "-inf", now - self._instance_ttl
+            )
+            for instance_id in dead_instances:
+                adopted = await client.eval(
+                    ADOPT_JOURNAL_SCRIPT,
+                    3,
+                    WRITE_BEHIND_INSTANCES_KEY,
+                    get_write_behind_journal_key(instance_id),
+                    WRITE_BEHIND_SPILL_KEY,
+                    instance_id,
+                )
+                if adopted:
+                    logger.warning(
+                        f"Recovered {adopted} unsaved turns from {instance_id}"
+                    )
+                    metrics.increment("write_behind_recovered_turns", adopted)
+
+            # スピルしたターンは自分のジャーナルに移してから保存する
+            payloads = await client.eval(
+                CLAIM_SPILL_SCRIPT,
+                2,
+                WRITE_BEHIND_SPILL_KEY,
+                self._journal_key,
+                self._batch_size,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to recover write-behind turns: {str(e)}")
+            return
+
+        if payloads:
+            turns = [_PendingTurn.from_payload(payload) for payload in payloads]
+            await self._flush(turns)
+
+
+# プロセス内で共有するインスタンス
+message_write_behind = MessageWriteBehind()
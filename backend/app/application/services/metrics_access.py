@@ -0,0 +1,28 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+import utilities.config as config
+
+
+async def verify_metrics_token(authorization: Optional[str] = Header(default=None)):
+    """
+    メトリクスのエンドポイントへのアクセスを METRICS_TOKEN の Bearer トークンで制限します
+
+    SQLやスロークエリ、内部のカウンターを含むので、トークンを設定していない場合は 404 を返します。
+
+    Args:
+        authorization (Optional[str]): Authorization ヘッダー
+    """
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(
+        token.encode(), config.METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
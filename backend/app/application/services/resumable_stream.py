@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import aclosing, nullcontext
+from typing import AsyncContextManager, AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.cache.redis.redis_turn_stream import RedisTurnStream
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# (seq, チャンク)
+TurnChunk = Tuple[int, str]
+
+
+class TurnNotFound(Exception):
+    """再開できるターンが見つからない（終了して期限切れになった場合など）"""
+
+
+class _Turn:
+    """生成中の回答と、それまでに生成したチャンク"""
+
+    def __init__(self, turn_id: str, session_id: int, store: Optional[RedisTurnStream]):
+        self.turn_id = turn_id
+        self.session_id = session_id
+        self.store = store
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.idle_check: Optional[asyncio.TimerHandle] = None
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+def create_turn_stream(redis: Optional[RedisRepository]) -> Optional[RedisTurnStream]:
+    """再開可能なストリームが有効な場合に、ターンを記録するRedis Streamを返す"""
+    if not config.RESUMABLE_STREAM_ENABLED or redis is None:
+        return None
+    return RedisTurnStream(redis)
+
+
+class ResumableStreams:
+    """
+    回答の生成をWebSocketから切り離して実行し、再接続したクライアントが途中から受信できるようにするクラス
+
+    生成したチャンクには1から始まる連番（seq）を振り、プロセス内のバッファとターンごとの
+    Redis Streamの両方に追加する。同じプロセスに再接続した場合はバッファから、
+    別のプロセスに再接続した場合はRedis Streamから、受信済みの seq の続きを再生する。
+    受信中のクライアントが一定時間いなくなった場合は生成をキャンセルする。
+    """
+
+    def __init__(
+        self,
+        resume_grace: float = config.RESUMABLE_STREAM_RESUME_GRACE,
+        read_timeout: float = config.LLM_REQUEST_TIMEOUT,
+    ):
+        self._resume_grace = resume_grace if config.RESUMABLE_STREAM_ENABLED else 0
+        self._read_timeout = read_timeout
+        self._turns: Dict[str, _Turn] = {}
+        self._session_turns: Dict[int, str] = {}
+        self._idle_checks: Set[asyncio.Task] = set()
+
+    async def start(
+        self,
+        session_id: int,
+        chunks: AsyncGenerator[str, None],
+        store: Optional[RedisTurnStream] = None,
+        admission: Optional[AsyncContextManager] = None,
+    ) -> str:
+        """
+        回答の生成をバックグラウンドで開始し、ターンIDを返す
+
+        Args:
+            session_id (int): セッションID
+            chunks (AsyncGenerator[str, None]): 回答のチャンクを生成するジェネレーター
+            store (RedisTurnStream): チャンクを記録するRedis Stream（なければプロセス内のみ）
+            admission (AsyncContextManager): 生成している間だけ保持する実行枠
+        """
+        turn_id = uuid.uuid4().hex
+        if store is not None:
+            try:
+                await store.start(session_id, turn_id)
+            except Exception as e:
+                logger.warning(f"Failed to register resumable turn: {str(e)}")
+                store = None
+
+        turn = _Turn(turn_id, session_id, store)
+        self._turns[turn_id] = turn
+        self._session_turns[session_id] = turn_id
+        turn.task = asyncio.create_task(self._produce(turn, chunks, admission))
+        metrics.increment("resumable_turns_started")
+        return turn_id
+
+    async def find_turn(
+        self,
+        session_id: int,
+        store: Optional[RedisTurnStream] = None,
+        turn_id: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        セッションの直近のターンIDを返す
+
+        turn_id を指定した場合は、それがセッションの直近のターンである場合だけ返す
+        （他のセッションのターンを再生させない）
+        """
+        local_turn_id = self._session_turns.get(session_id)
+        if local_turn_id is not None and turn_id in (None, local_turn_id):
+            return local_turn_id
+        if store is None:
+            return None
+        try:
+            active_turn_id = await store.get_active_turn(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to look up resumable turn: {str(e)}")
+            return None
+        if turn_id is not None and active_turn_id != turn_id:
+            return None
+        return active_turn_id
+
+    async def subscribe(
+        self,
+        turn_id: str,
+        after_seq: int = 0,
+        store: Optional[RedisTurnStream] = None,
+    ) -> AsyncGenerator[TurnChunk, None]:
+        """
+        after_seq より後のチャンクを再生し、生成が終わるまで続きを受け取る
+
+        Raises:
+            TurnNotFound: ターンがこのプロセスにもRedisにも存在しない場合
+        """
+        turn = self._turns.get(turn_id)
+        if turn is not None:
+            async for item in self._follow_local(turn, after_seq):
+                yield item
+            return
+
+        if store is None or not await store.exists(turn_id):
+            raise TurnNotFound(f"Turn {turn_id} is not available for resuming")
+        metrics.increment("resumable_turns_resumed_from_redis")
+        async for item in self._follow_redis(store, turn_id, after_seq):
+            yield item
+
+    async def shutdown(self) -> None:
+        """生成中のターンをキャンセルし、途中までの回答が保存されるのを待つ"""
+        tasks = [turn.task for turn in self._turns.values() if turn.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _follow_local(
+        self, turn: _Turn, after_seq: int
+    ) -> AsyncGenerator[TurnChunk, None]:
+        turn.subscribers += 1
+        if turn.idle_check is not None:
+            turn.idle_check.cancel()
+            turn.idle_check = None
+        seq = max(after_seq, 0)
+        try:
+            while True:
+                while seq < len(turn.chunks):
+                    seq += 1
+                    yield seq, turn.chunks[seq - 1]
+                if turn.done:
+                    break
+                await turn.changed.wait()
+            if turn.error is not None:
+                raise turn.error
+        finally:
+            turn.subscribers -= 1
+            if turn.subscribers == 0 and not turn.done:
+                self._schedule_idle_check(turn)
+
+    async def _follow_redis(
+        self, store: RedisTurnStream, turn_id: str, after_seq: int
+    ) -> AsyncGenerator[TurnChunk, None]:
+        seq = max(after_seq, 0)
+        deadline = time.monotonic() + self._read_timeout
+        while True:
+            # 生成中のプロセスがキャンセルしないように、受信中であることを知らせる
+            await store.touch_subscriber(turn_id, self._resume_grace)
+            entries = await store.read(turn_id, seq)
+            if not entries:
+                if time.monotonic() > deadline or not await store.exists(turn_id):
+                    raise TurnNotFound(f"Turn {turn_id} stopped producing chunks")
+                continue
+
+            deadline = time.monotonic() + self._read_timeout
+            for entry_seq, fields in entries:
+                if "content" in fields:
+                    seq = entry_seq
+                    yield seq, fields["content"]
+                elif "done" in fields:
+                    return
+                elif "error" in fields:
+                    raise RuntimeError(fields["error"])
+
+    async def _produce(
+        self,
+        turn: _Turn,
+        chunks: AsyncGenerator[str, None],
+        admission: Optional[AsyncContextManager],
+    ) -> None:
+        error: Optional[str] = None
+        try:
+            async with admission or nullcontext():
+                async with aclosing(chunks):
+                    async for chunk in chunks:
+                        turn.chunks.append(chunk)
+                        turn.notify()
+                        await self._append(turn, chunk)
+        except asyncio.CancelledError:
+            error = "cancelled"
+        except Exception as e:
+            logger.warning(f"Resumable turn {turn.turn_id} failed: {str(e)}")
+            turn.error = e
+            error = str(e) or type(e).__name__
+        finally:
+            turn.done = True
+            turn.notify()
+            if turn.idle_check is not None:
+                turn.idle_check.cancel()
+            # 終了を記録し終えるまでは shutdown() が待てるように登録を残しておく
+            if turn.store is not None:
+                try:
+                    await turn.store.finish(turn.turn_id, len(turn.chunks), error)
+                except Exception as e:
+                    logger.warning(f"Failed to finish resumable turn: {str(e)}")
+            # 以降の再接続はRedis Streamから再生する
+            self._turns.pop(turn.turn_id, None)
+            if self._session_turns.get(turn.session_id) == turn.turn_id:
+                del self._session_turns[turn.session_id]
+
+    async def _append(self, turn: _Turn, chunk: str) -> None:
+        if turn.store is None:
+            return
+        try:
+            await turn.store.append(turn.turn_id, len(turn.chunks), chunk)
+        except Exception as e:
+            # 以降はこのプロセス内の購読者にだけ配信する
+            logger.warning(f"Failed to append to resumable turn: {str(e)}")
+            metrics.increment("resumable_turn_append_failures")
+            turn.store = None
+
+    def _schedule_idle_check(self, turn: _Turn) -> None:
+        if self._resume_grace <= 0:
+            self._abandon(turn)
+            return
+        turn.idle_check = asyncio.get_running_loop().call_later(
+            self._resume_grace, self._start_idle_check, turn
+        )
+
+    def _start_idle_check(self, turn: _Turn) -> None:
+        turn.idle_check = None
+        task = asyncio.create_task(self._cancel_if_idle(turn))
+        self._idle_checks.add(task)
+        task.add_done_callback(self._idle_checks.discard)
+
+    async def _cancel_if_idle(self, turn: _Turn) -> None:
+        """再接続を待つ時間が過ぎても受信中のクライアントがいなければ生成をキャンセルする"""
+        if turn.done or turn.subscribers:
+            return
+        if turn.store is not None:
+            try:
+                has_subscriber = await turn.store.has_subscriber(turn.turn_id)
+            except Exception as e:
+                logger.warning(f"Failed to check resumable turn subscribers: {str(e)}")
+                has_subscriber = False
+            # 確認している間に再接続された場合は何もしない
+            if turn.done or turn.subscribers or turn.idle_check is not None:
+                return
+            if has_subscriber:
+                self._schedule_idle_check(turn)
+                return
+        self._abandon(turn)
+
+    def _abandon(self, turn: _Turn) -> None:
+        metrics.increment("resumable_turns_abandoned")
+        turn.task.cancel()
+
+
+# プロセス内で共有するインスタンス
+resumable_streams = ResumableStreams()
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+TokenStreamFactory = Callable[[], AsyncIterator[str]]
+
+
+class _Flight:
+    """実行中の上流ストリームと、それまでに受け取ったトークン"""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    同じキーで同時に実行されたリクエストの上流ストリームを1本にまとめるクラス
+
+    最初のリクエストが上流のストリームを開始し、後から来たリクエストは
+    それまでのトークンを再生した上で、続きのトークンを受け取る。
+    購読者が全ていなくなった場合は上流のストリームをキャンセルする。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    async def stream(
+        self, key: str, factory: TokenStreamFactory
+    ) -> AsyncGenerator[str, None]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            metrics.increment("single_flight_leaders")
+        else:
+            metrics.increment("single_flight_coalesced")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.tokens):
+                    yield flight.tokens[index]
+                    index += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # キャンセル中のフライトに後から来たリクエストが合流しないようにする
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key: str, flight: _Flight, factory: TokenStreamFactory):
+        try:
+            async for token in factory():
+                flight.tokens.append(token)
+                flight.notify()
+        except asyncio.CancelledError:
+            # 購読者がいなくなった場合だけキャンセルするので、エラーとして渡さない
+            pass
+        except Exception as e:
+            logger.warning(f"Single-flight upstream failed for {key}: {str(e)}")
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+
+# プロセス内で共有するインスタンス
+single_flight = SingleFlight()
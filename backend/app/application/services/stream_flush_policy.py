@@ -0,0 +1,129 @@
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncGenerator, AsyncIterator, List
+
+
+class FlushPolicy(ABC):
+    """ストリーミング中にバッファした内容をクライアントへ送るタイミングを決めるポリシー"""
+
+    @abstractmethod
+    def should_flush(self, buffered_size: int, now: float) -> bool:
+        """
+        バッファの文字数と現在時刻から、今フラッシュすべきかを判定する
+        """
+        pass
+
+    def on_flush(self, now: float) -> None:
+        """
+        フラッシュした時刻を記録する
+        """
+        pass
+
+    def record_send_latency(self, latency: float) -> None:
+        """
+        フラッシュした内容の送信にかかった時間を記録する
+        """
+        pass
+
+
+class FixedFlushPolicy(FlushPolicy):
+    """一定の文字数または時間が経過したらフラッシュするポリシー"""
+
+    def __init__(self, chunk_size: int = 25, time_threshold: float = 1.0):
+        self._chunk_size = chunk_size
+        self._time_threshold = time_threshold
+        self._last_flush = time.monotonic()
+
+    def should_flush(self, buffered_size: int, now: float) -> bool:
+        return (
+            buffered_size >= self._chunk_size
+            or now - self._last_flush >= self._time_threshold
+        )
+
+    def on_flush(self, now: float) -> None:
+        self._last_flush = now
+
+
+class AdaptiveFlushPolicy(FlushPolicy):
+    """
+    最初のトークンは即座に送り、以降はWebSocketの送信レイテンシに合わせて間隔を調整するポリシー
+
+    送信が遅い（バックプレッシャーがかかっている）ほど、まとめて送る間隔を伸ばす。
+    バッファが max_size に達するか max_interval が経過した場合は必ずフラッシュする。
+    """
+
+    def __init__(
+        self,
+        min_size: int = 16,
+        max_size: int = 2048,
+        min_interval: float = 0.02,
+        max_interval: float = 0.25,
+        latency_multiplier: float = 4.0,
+        smoothing: float = 0.2,
+    ):
+        self._min_size = min_size
+        self._max_size = max_size
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._latency_multiplier = latency_multiplier
+        self._smoothing = smoothing
+        self._send_latency = 0.0
+        self._interval = min_interval
+        self._last_flush = 0.0
+        self._flushed = False
+
+    def should_flush(self, buffered_size: int, now: float) -> bool:
+        if not self._flushed or buffered_size >= self._max_size:
+            return True
+        elapsed = now - self._last_flush
+        return (
+            elapsed >= self._interval and buffered_size >= self._min_size
+        ) or elapsed >= self._max_interval
+
+    def on_flush(self, now: float) -> None:
+        self._flushed = True
+        self._last_flush = now
+
+    def record_send_latency(self, latency: float) -> None:
+        # 送信レイテンシの指数移動平均からフラッシュ間隔を決める
+        self._send_latency += self._smoothing * (latency - self._send_latency)
+        self._interval = min(
+            self._max_interval,
+            max(self._min_interval, self._send_latency * self._latency_multiplier),
+        )
+
+
+async def flush_chunks(
+    contents: AsyncIterator[str], policy: FlushPolicy, collected: List[str]
+) -> AsyncGenerator[str, None]:
+    """
+    トークン列をポリシーに従ってまとめて返す
+
+    受け取ったトークンは全て collected に追加する。
+    yield から再開されるまでの時間を送信レイテンシとしてポリシーに記録する。
+    """
+    clock = time.monotonic
+    buffer: List[str] = []
+    buffered_size = 0
+    error = None
+    try:
+        async for content in contents:
+            if not content:
+                continue
+            collected.append(content)
+            buffer.append(content)
+            buffered_size += len(content)
+            now = clock()
+            if policy.should_flush(buffered_size, now):
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_size = 0
+                policy.on_flush(now)
+                policy.record_send_latency(clock() - now)
+    except Exception as e:
+        error = e
+
+    if buffer:
+        yield "".join(buffer)
+    if error is not None:
+        raise error
@@ -23,3 +23,25 @@ def retrieve_session_id(user_message: str):
     client_message = json.loads(user_message)
     session_id = client_message.get("session_id")
     return session_id
+
+
+def retrieve_last_seq(user_message: str):
+    """再接続したクライアントが受信済みのチャンクの seq を取り出す（新しいメッセージの場合は None）"""
+    client_message = json.loads(user_message)
+    last_seq = client_message.get("last_seq")
+    if last_seq is None:
+        return None
+    if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+        logger.error("Received 'last_seq' is not a non-negative integer")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid message format. 'last_seq' must be a non-negative integer.",
+        )
+
+    return last_seq
+
+
+def retrieve_turn_id(user_message: str):
+    client_message = json.loads(user_message)
+    turn_id = client_message.get("turn_id")
+    return turn_id
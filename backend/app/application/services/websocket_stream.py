@@ -0,0 +1,61 @@
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Dict, TypeVar
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import utilities.metrics as metrics
+
+T = TypeVar("T")
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> int:
+    """クライアントが切断するまで受信を続け、切断時のコードを返す"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return message.get("code", 1000)
+
+
+async def stream_to_websocket(
+    websocket: WebSocket,
+    chunks: AsyncGenerator[T, None],
+    to_payload: Callable[[T], Dict[str, Any]],
+) -> None:
+    """
+    チャンクをWebSocketに送信しながら、並行してクライアントの切断を監視する
+
+    切断を検知した時点で送信中のストリームを閉じ、WebSocketDisconnect を送出する。
+    """
+
+    closing = False
+
+    async def send_all() -> None:
+        nonlocal closing
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                try:
+                    await websocket.send_json(to_payload(chunk))
+                except BaseException:
+                    closing = True
+                    raise
+
+    sender = asyncio.create_task(send_all())
+    watcher = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        done, _ = await asyncio.wait(
+            {sender, watcher}, return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        watcher.cancel()
+        # ストリームを閉じている最中にキャンセルすると上流の後片付けが中断されるので待つ
+        if not closing:
+            sender.cancel()
+        await asyncio.gather(sender, watcher, return_exceptions=True)
+
+    if sender in done:
+        sender.result()
+        return
+
+    metrics.increment("websocket_disconnects_during_stream")
+    raise WebSocketDisconnect(code=watcher.result())
@@ -1,18 +1,46 @@
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, List, Dict
-from sqlalchemy.orm import Session
+from typing import AsyncGenerator, List, Dict, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from application.services.stream_flush_policy import FlushPolicy
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
 from infrastructure.repositories.message import MessageRepositoryImpl
 from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.cache.redis.response_cache import ResponseCache
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
 from infrastructure.database.models.chat_session import ChatSession
+from domain.services.conversation_summary_service import (
+    ConversationSummaryService,
+)
 from domain.value_objects.user import UserID
+import utilities.config as config
 
 
 class AgentUseCase(ABC):
 
-    def __init__(self, db: Session, redis: RedisRepository):
+    def __init__(
+        self,
+        db: AsyncSession,
+        redis: RedisRepository,
+        llm_registry: LLMClientRegistry,
+        prompt_cache: PromptChainCache,
+    ):
         self._db = db
         self._redis = redis
+        self._llm_registry = llm_registry
+        self._prompt_cache = prompt_cache
+        self.prompt_version: Optional[str] = prompt_cache.version
         self.message_repository = MessageRepositoryImpl(db=self._db, redis=self._redis)
+        self.chat_session_repository = ChatSessionRepositoryImpl(
+            db=self._db, redis=self._redis
+        )
+        self.response_cache = ResponseCache(redis=self._redis)
+        self.summary_service = ConversationSummaryService(
+            llm=llm_registry.get(
+                model=config.SUMMARY_MODEL, temperature=0, streaming=False
+            ),
+            redis=self._redis,
+        )
 
     @abstractmethod
     async def delete_cache(self, redis_key: str) -> None:
@@ -21,6 +49,13 @@ class AgentUseCase(ABC):
         """
         pass
 
+    @abstractmethod
+    async def invalidate_cache(self, tags: List[str]) -> None:
+        """
+        Deletes every cache entry registered under the given tags in Redis.
+        """
+        pass
+
     @abstractmethod
     async def create_chat_session(
         self, user_id: UserID, message_content: str
@@ -30,12 +65,19 @@ class AgentUseCase(ABC):
         """
         pass
 
+    @abstractmethod
+    async def verify_session_owner(self, session_id: int, user_id: UserID) -> None:
+        """
+        Ensures the chat session exists and belongs to the user.
+        """
+        pass
+
     @abstractmethod
     async def get_conversation_history(
-        self, session_id: int, limit: int
+        self, session_id: int, token_budget: int
     ) -> List[Dict[str, str]]:
         """
-        Fetches the conversation history for a given session.
+        Fetches the newest conversation history that fits in the token budget.
         """
         pass
 
@@ -45,6 +87,7 @@ class AgentUseCase(ABC):
         message_content: str,
         session_id: int,
         context: List[Dict[str, str]],
+        flush_policy: Optional[FlushPolicy] = None,
     ) -> AsyncGenerator[str, None]:
         """
         Processes a message and streams responses from the LLM.
@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from domain.value_objects.user import UserID
 from infrastructure.cache.redis.redis_repository import RedisRepository
 from infrastructure.repositories.chat_session import (
     ChatSessionRepositoryImpl,
@@ -12,7 +14,7 @@ from schemas.v1.chat_session import (
 
 
 class ChatSessionUseCase(ABC):
-    def __init__(self, db: Session, redis: RedisRepository):
+    def __init__(self, db: AsyncSession, redis: RedisRepository):
         self._db = db
         self._redis = redis
         self.chat_session_repository = ChatSessionRepositoryImpl(
@@ -21,15 +23,20 @@ class ChatSessionUseCase(ABC):
 
     @abstractmethod
     async def get_chat_history(
-        self, current_user: Dict[str, Any]
+        self,
+        user_id: UserID,
+        before: Optional[datetime] = None,
+        limit: int = 100,
+        before_id: Optional[int] = None,
     ) -> List[ChatSessionResponse]:
         """
-        指定されたユーザーのチャットセッション履歴を取得します。
+        指定されたユーザーのチャットセッション履歴を、(開始時刻, ID) の新しい順に1ページ分取得します。
 
         Args:
-            current_user (Dict[str, Any]): アクセストークンから取得したユーザーペイロード
-            db (Session): データベースセッション
-            redis (Redis): Redisクライアント
+            user_id (UserID): ユーザーID
+            before (Optional[datetime]): 前のページの最後のセッションの開始時刻（これより前のセッションを返す）
+            limit (int): 1ページの件数
+            before_id (Optional[int]): 前のページの最後のセッションのID（開始時刻が同じセッションを読み飛ばさない）
 
         Returns:
             List[ChatSessionResponse]: チャットセッションのリスト
@@ -1,12 +1,12 @@
 from abc import ABC, abstractmethod
 from typing import Any
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from infrastructure.repositories.user import UserRepositoryImpl
 import utilities.config as config
 
 
 class HandleGoogleAuthCallbackUseCase(ABC):
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self._db = db
         self._client_id = config.GOOGLE_CLIENT_ID
         self._client_secret = config.GOOGLE_CLIENT_SECRET
@@ -14,7 +14,7 @@ class HandleGoogleAuthCallbackUseCase(ABC):
         self._user_repository = UserRepositoryImpl(self._db)
 
     @abstractmethod
-    def execute(self, code: str) -> Any:
+    async def execute(self, code: str) -> Any:
         """
         Google OAuth2認証のコールバックを処理し、アクセストークンを生成する。
         """
@@ -1,26 +1,33 @@
 from abc import ABC, abstractmethod
-from typing import List
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from infrastructure.cache.redis.redis_repository import RedisRepository
 from infrastructure.repositories.message import MessageRepositoryImpl
 from schemas.v1.message import MessageResponse
 
 
 class MessageUseCase(ABC):
-    def __init__(self, db: Session, redis: RedisRepository):
+    def __init__(self, db: AsyncSession, redis: RedisRepository):
         self._db = db
         self._redis = redis
         self.message_repository = MessageRepositoryImpl(db=db, redis=redis)
 
     @abstractmethod
     async def get_messages_by_session_id(
-        self, session_id: int
+        self,
+        session_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 100,
     ) -> List[MessageResponse]:
         """
-        指定された `chat_session_id` に基づいてメッセージのリストを取得します。
+        指定された `chat_session_id` に基づいてメッセージを1ページ分、古い順に取得します。
 
         Args:
             chat_session_id (int): メッセージを取得するスレッドのID
+            before (Optional[int]): このIDより古いメッセージのうち新しいものを取得する
+            after (Optional[int]): このIDより新しいメッセージのうち古いものを取得する
+            limit (int): 1ページのメッセージの数
             current_user (Dict[str, Any]): アクセストークンから取得したユーザーペイロード
             redis (Redis): Redisクライアント
 
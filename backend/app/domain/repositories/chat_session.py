@@ -1,31 +1,62 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from infrastructure.cache.redis.redis_repository import RedisRepository
 from infrastructure.database.models.chat_session import ChatSession
 
 
 class ChatSessionRepository(ABC):
-    def __init__(self, db: Session, redis: RedisRepository):
+    def __init__(self, db: AsyncSession, redis: RedisRepository):
         self._db = db
         self._redis = redis
 
     @abstractmethod
-    def get_chat_session_by_user_id(
-        self, db: Session, user_id: int, skip: int = 0, limit: int = 100
+    async def get_chat_session_by_user_id(
+        self,
+        user_id: int,
+        before: Optional[datetime] = None,
+        limit: int = 100,
+        before_id: Optional[int] = None,
     ) -> Optional[List[ChatSession]]:
         """
-        指定された user_idに基づいてチャットセッションを取得します
+        指定された user_idに基づいて、有効なチャットセッションを (開始時刻, ID) の新しい順に1ページ分取得します
         """
         pass
 
     @abstractmethod
-    def create_chat_session(
-        self, db: Session, user_id: int, start_time: datetime = None
+    async def create_chat_session(
+        self, user_id: int, start_time: datetime = None
     ) -> Optional[ChatSession]:
         """
         新しいチャットセッションを作成します
         """
         pass
+
+    @abstractmethod
+    async def add_to_session_index(self, chat_session: ChatSession) -> None:
+        """
+        作成したセッションをユーザーのセッションのインデックスに追加します
+        """
+        pass
+
+    @abstractmethod
+    async def get_chat_session(self, session_id: int) -> Optional[ChatSession]:
+        """
+        指定された session_id のチャットセッションを取得します
+        """
+        pass
+
+    @abstractmethod
+    async def update_context_summary(
+        self,
+        session_id: int,
+        context_summary: str,
+        summarized_until_message_id: int,
+        previous_message_id: Optional[int],
+    ) -> bool:
+        """
+        要約済みのメッセージIDが previous_message_id のままであれば、コンテキストの要約を更新します
+        """
+        pass
@@ -1,30 +1,63 @@
 # repositories/message_repository.py
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from infrastructure.cache.redis.redis_repository import RedisRepository
 from infrastructure.database.models.message import Message
 
 
 class MessageRepository(ABC):
-    def __init__(self, db: Session, redis: RedisRepository):
+    def __init__(self, db: AsyncSession, redis: RedisRepository):
         self._db = db
         self._redis = redis
 
     @abstractmethod
-    def get_messages_by_session_id(
-        self, session_id: int, skip: int = 0, limit: int = 100
+    async def get_messages_by_session_id(
+        self,
+        session_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 100,
     ) -> Optional[List[Message]]:
         """
-        指定された session_id に基づいてメッセージを取得します。
+        指定された session_id のメッセージを1ページ分、古い順に取得します（before / after はメッセージIDのカーソル）。
         """
         pass
 
     @abstractmethod
-    def create_message(
-        self, session_id: int, content: str, is_user: bool
+    async def get_recent_messages_within_budget(
+        self, session_id: int, token_budget: int
+    ) -> List[Message]:
+        """
+        指定された session_id の新しいメッセージから、トークン数の合計が予算内に収まる分を古い順に取得します。
+        """
+        pass
+
+    @abstractmethod
+    async def get_messages_in_range(
+        self,
+        session_id: int,
+        after_id: int,
+        before_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[Message]:
+        """
+        指定された session_id のうち、IDが after_id より大きく before_id より小さいメッセージを古い順に取得します。
+        """
+        pass
+
+    @abstractmethod
+    async def create_messages(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """
+        複数のメッセージを1つのトランザクションでまとめて作成し、作成したIDを返します。
+        """
+        pass
+
+    @abstractmethod
+    async def create_message(
+        self, session_id: int, content: str, is_user: bool, interrupted: bool = False
     ) -> Optional[Message]:
         """
         新しいメッセージを作成します。
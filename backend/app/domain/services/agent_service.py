@@ -1,36 +1,56 @@
-import asyncio
 import json
 import logging
-from pathlib import Path
+from contextlib import aclosing
+from functools import partial
 from sqlalchemy.exc import SQLAlchemyError
-from typing import AsyncGenerator, List, Dict
+from typing import AsyncGenerator, AsyncIterator, List, Dict, Optional
 from fastapi import HTTPException, status
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
 from datetime import datetime, timedelta
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain.prompts.chat import (
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
+from application.services.stream_flush_policy import (
+    AdaptiveFlushPolicy,
+    FlushPolicy,
+    flush_chunks,
 )
+from application.services.message_write_behind import message_write_behind
+from application.services.single_flight import single_flight
 from application.usecase.agent_usecase import AgentUseCase
+from infrastructure.database.connection import SessionLocal
 from infrastructure.database.models.chat_session import ChatSession
-from infrastructure.database.models.message import Message
-from infrastructure.cache.redis.redis_keys import (
-    get_messages_list_key,
-    get_sessions_list_key,
+from infrastructure.repositories.message import MessageRepositoryImpl
+from infrastructure.cache.redis.redis_single_flight import (
+    RedisSingleFlight,
+    SingleFlightAbandoned,
 )
 import utilities.config as config
+import utilities.metrics as metrics
+from utilities.prompt_digest import get_prompt_digest
+from utilities.token_counter import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# キャッシュした回答を再生する際の1チャンクあたりの文字数
+REPLAY_CHUNK_SIZE = 64
+
 
 class AgentService(AgentUseCase):
     async def delete_cache(self, redis_key: str) -> None:
         try:
-            self._redis.delete([redis_key])
+            await self._redis.delete([redis_key])
         except Exception as e:
             logger.warning(f"Failed to delete cache for key {redis_key}: {str(e)}")
 
+    async def invalidate_cache(self, tags: List[str]) -> None:
+        try:
+            await self._redis.invalidate_tags(tags)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cache for tags {tags}: {str(e)}")
+
     async def create_chat_session(self, user_id: int, message_content: str) -> int:
         try:
             new_chat_session = ChatSession(
@@ -41,34 +61,101 @@ class AgentService(AgentUseCase):
                 + timedelta(days=int(config.DEFAULT_SESSION_EXPIRATION_DAY)),
             )
             self._db.add(new_chat_session)
-            self._db.commit()
-            self._db.refresh(new_chat_session)
-            return new_chat_session.id
+            await self._db.commit()
+            await self._db.refresh(new_chat_session)
         except Exception as e:
             logger.error(f"Error creating chat session: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error creating chat session.",
             )
+        # Adds the session to the cached session index instead of dropping the
+        # user's cached session list.
+        await self.chat_session_repository.add_to_session_index(new_chat_session)
+        return new_chat_session.id
+
+    async def verify_session_owner(self, session_id: int, user_id: int) -> None:
+        """
+        Ensures the chat session exists and belongs to the user, so that a
+        client cannot read or resume another user's conversation.
+
+        Raises:
+            HTTPException: 404 if the session does not exist or belongs to
+                another user (the two cases are not distinguished).
+        """
+        chat_session = (
+            await self.chat_session_repository.get_chat_session(session_id)
+            if session_id
+            else None
+        )
+        # Ends the read transaction so the connection is not held while streaming
+        await self._db.commit()
+        if chat_session is None or chat_session.user_id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found.",
+            )
 
     async def get_conversation_history(
-        self, session_id: int, limit: int = 10
+        self, session_id: int, token_budget: int = config.CONTEXT_TOKEN_BUDGET
     ) -> List[Dict[str, str]]:
+        """
+        Fetches the newest turns of a session that fit in the token budget,
+        preceded by the running summary of the older turns if there is one.
+        Turns still waiting in the write-behind queue (or spilled by it) are
+        appended, so the next turn does not lose the previous one.
+
+        Args:
+            session_id (int): The session ID.
+            token_budget (int): Maximum total tokens of the returned turns.
+
+        Returns:
+            List[Dict[str, str]]: Summary and messages in chronological order.
+        """
+        # DBを読む前に取得する（読む間に保存されたものは client_id で除く）
+        unsaved_messages = message_write_behind.unsaved_messages(session_id)
+        unsaved_tokens = sum(
+            count_tokens(message["content"]) for message in unsaved_messages
+        )
         try:
+            chat_session = await self.chat_session_repository.get_chat_session(
+                session_id
+            )
+            summarized_until = (
+                chat_session.summarized_until_message_id if chat_session else None
+            ) or 0
             conversation_histories = (
-                self._db.query(Message)
-                .filter(Message.session_id == session_id)
-                .order_by(Message.id.desc())
-                .limit(limit)
-                .all()
+                await self.message_repository.get_recent_messages_within_budget(
+                    session_id, max(0, token_budget - unsaved_tokens)
+                )
             )
-            return [
+            # LLMのストリーミング中にコネクションを保持しないように、読み取りのトランザクションを終える
+            await self._db.commit()
+            history = [
                 {
                     "role": "user" if msg.is_user else "agent",
                     "content": msg.content,
                 }
                 for msg in conversation_histories
+                if msg.id > summarized_until
             ]
+            saved_client_ids = {
+                msg.client_id for msg in conversation_histories if msg.client_id
+            }
+            message_write_behind.discard_saved(saved_client_ids)
+            history.extend(
+                {
+                    "role": "user" if message["is_user"] else "agent",
+                    "content": message["content"],
+                }
+                for message in unsaved_messages
+                if message["client_id"] not in saved_client_ids
+            )
+            if chat_session and chat_session.context_summary:
+                history.insert(
+                    0, {"role": "summary", "content": chat_session.context_summary}
+                )
+            return history
         except Exception as e:
             logger.error(f"Error fetching conversation history: {str(e)}")
             raise HTTPException(
@@ -81,10 +168,16 @@ class AgentService(AgentUseCase):
         message_content: str,
         session_id: int,
         context: List[Dict[str, str]],
+        flush_policy: Optional[FlushPolicy] = None,
     ) -> AsyncGenerator[str, None]:
         try:
-            async for chunk in self._process_llm(message_content, session_id, context):
-                yield chunk
+            async with aclosing(
+                self._process_llm(message_content, session_id, context, flush_policy)
+            ) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        except SingleFlightAbandoned:
+            raise
         except Exception as e:
             logger.error(f"Error processing message: {str(e)}")
             raise HTTPException(
@@ -92,100 +185,265 @@ class AgentService(AgentUseCase):
                 detail="Error processing message.",
             )
 
-    async def _process_llm(
-        self, prompt: str, session_id: int, context: List[Dict[str, str]] = []
+    async def _stream_llm_tokens(
+        self, prompt: str, context: List[Dict[str, str]]
     ) -> AsyncGenerator[str, None]:
         """
-        Processes the LLM request and streams the response in chunks.
+        Streams the raw tokens of the LLM response.
 
         Args:
             prompt (str): The user's message.
-            session_id (int): The session ID.
             context (List[Dict[str, str]]): Conversation history.
 
         Yields:
-            str: Chunks of the response from the LLM.
+            str: Tokens from the LLM.
         """
-        llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.5,
+        llm = self._llm_registry.get(
+            model=config.LLM_MODEL,
+            temperature=config.LLM_TEMPERATURE,
             streaming=True,
-            openai_api_key=config.OPENAI_API_KEY,
         )
 
-        # System prompt loaded from the file
-        system_prompt = self._load_system_prompt()
-        system_template = ChatPromptTemplate.from_messages(
-            [
-                SystemMessagePromptTemplate.from_template(system_prompt),
-                HumanMessagePromptTemplate.from_template(
-                    "User's question: {prompt}"
-                ),
-            ]
+        # コンパイル済みのチェーンをプロンプトのバージョンと共に取得する
+        self.prompt_version, chain = self._prompt_cache.get_chain(llm)
+
+        stream = chain.astream(
+            {"prompt": prompt, "history": self._to_chat_messages(context)}
+        )
+        # 途中で閉じられた場合も上流のリクエストをすぐに終了させる
+        async with aclosing(self._llm_registry.cancellable_stream(stream)) as stream:
+            async for chunk in stream:
+                yield chunk.content if hasattr(chunk, "content") else str(chunk)
+
+    async def _stream_response_tokens(
+        self, prompt: str, context: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams the response tokens. Context-free first turns are served from
+        the response cache when it is enabled, and identical concurrent ones
+        share a single upstream stream.
+
+        Args:
+            prompt (str): The user's message.
+            context (List[Dict[str, str]]): Conversation history.
+
+        Yields:
+            str: Tokens of the response.
+        """
+        if context:
+            async with aclosing(self._stream_llm_tokens(prompt, context)) as tokens:
+                async for token in tokens:
+                    yield token
+            return
+
+        self.prompt_version = self._prompt_cache.version
+        digest = get_prompt_digest(
+            prompt, config.LLM_MODEL, config.LLM_TEMPERATURE, self.prompt_version
         )
+        if self.response_cache.enabled:
+            cached_response = await self.response_cache.get(digest)
+            if cached_response is not None:
+                # キャッシュした回答も通常と同じチャンク単位で再生する
+                for index in range(0, len(cached_response), REPLAY_CHUNK_SIZE):
+                    yield cached_response[index : index + REPLAY_CHUNK_SIZE]
+                return
 
-        chain = system_template | llm
+        def upstream() -> AsyncIterator[str]:
+            if config.SINGLE_FLIGHT_REDIS_ENABLED:
+                return RedisSingleFlight(self._redis).stream(
+                    digest, lambda: self._stream_and_cache(prompt, digest)
+                )
+            return self._stream_and_cache(prompt, digest)
 
-        res = chain.astream({"prompt": prompt, "context": context})
-        full_response = ""
-        accumulated_content = ""
-        chunk_size = 25
-        last_send_time = asyncio.get_event_loop().time()
-        time_threshold = 1.0
+        if config.SINGLE_FLIGHT_ENABLED:
+            tokens = single_flight.stream(digest, upstream)
+        else:
+            tokens = upstream()
+        async with aclosing(tokens):
+            async for token in tokens:
+                yield token
 
+    async def _stream_and_cache(
+        self, prompt: str, digest: str
+    ) -> AsyncGenerator[str, None]:
+        """
+        Streams a context-free response from the LLM and stores it in the
+        response cache once it completes.
+        """
+        response_parts: List[str] = []
+        async for token in self._stream_llm_tokens(prompt, []):
+            response_parts.append(token)
+            yield token
+
+        if self.response_cache.enabled:
+            await self.response_cache.set(digest, "".join(response_parts))
+
+    async def _process_llm(
+        self,
+        prompt: str,
+        session_id: int,
+        context: List[Dict[str, str]] = [],
+        flush_policy: Optional[FlushPolicy] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Processes the LLM request and streams the response in chunks.
+
+        Args:
+            prompt (str): The user's message.
+            session_id (int): The session ID.
+            context (List[Dict[str, str]]): Conversation history.
+            flush_policy (Optional[FlushPolicy]): Decides when buffered tokens
+                are sent. Defaults to AdaptiveFlushPolicy.
+
+        Yields:
+            str: Chunks of the response from the LLM.
+
+        If the consumer closes the generator or its task is cancelled (e.g. the
+        client disconnected), the upstream stream is closed immediately and the
+        partial response is saved with the interrupted flag set. The same
+        happens when another worker sharing the upstream stream abandons it
+        midway, after which SingleFlightAbandoned is raised so that the caller
+        can retry.
+        """
+        response_parts: List[str] = []
+        interrupted = True
         try:
-            async for chunk in res:
-                content = chunk.content if hasattr(chunk, "content") else str(chunk)
-                full_response += content
-                accumulated_content += content
-
-                current_time = asyncio.get_event_loop().time()
-                if (
-                    len(accumulated_content) >= chunk_size
-                    or (current_time - last_send_time) >= time_threshold
-                ):
-                    yield accumulated_content
-                    accumulated_content = ""
-                    last_send_time = current_time
+            tokens = self._stream_response_tokens(prompt, context)
+            async with aclosing(tokens), aclosing(
+                flush_chunks(
+                    tokens, flush_policy or AdaptiveFlushPolicy(), response_parts
+                )
+            ) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            interrupted = False
+
+        except SingleFlightAbandoned:
+            # 受け取った途中までの回答は中断として保存し、リクエストのやり直しを促す
+            raise
 
         except Exception as e:
+            interrupted = False
             logger.error(f"Error during LLM processing: {str(e)}")
             yield f"Error: {str(e)}"
 
-        if accumulated_content:
-            yield accumulated_content
+        finally:
+            await self._complete_response(
+                prompt, session_id, "".join(response_parts), interrupted
+            )
 
-        logger.info(f"LLM full response: {full_response}")
+    async def _complete_response(
+        self, prompt: str, session_id: int, full_response: str, interrupted: bool
+    ) -> None:
+        """
+        Records metrics for the finished response and persists the turn.
+
+        Args:
+            prompt (str): The user's message.
+            session_id (int): The session ID.
+            full_response (str): The response received from the LLM.
+            interrupted (bool): Whether the stream was cut off by the client.
+        """
+        response_tokens = count_tokens(full_response)
+        if interrupted:
+            self._record_interruption(response_tokens)
+        else:
+            metrics.increment("llm_responses_completed")
+            metrics.increment("llm_response_tokens_completed", response_tokens)
+
+        logger.info(
+            f"LLM full response (prompt version {self.prompt_version}, "
+            f"interrupted={interrupted}): {full_response}"
+        )
 
         # MEMO: 本当はこの時点でfull_responseをapplication層に返し、application層のサービスとかでDB保存は行うべき
-        if full_response:
-            await self._save_messages_to_db(session_id, prompt, full_response)
+        if not full_response:
+            return
+        try:
+            await self._save_messages_to_db(
+                session_id, prompt, full_response, interrupted=interrupted
+            )
+        except HTTPException:
+            if not interrupted:
+                raise
+            # 切断後の保存失敗は呼び出し元に返せないのでログだけ残す
+
+    @staticmethod
+    def _record_interruption(partial_tokens: int) -> None:
+        """
+        Records an interrupted stream and estimates how many completion tokens
+        were not generated, based on the mean length of completed responses.
+        """
+        metrics.increment("llm_streams_interrupted")
+        metrics.increment("llm_interrupted_tokens_received", partial_tokens)
+        counters = metrics.snapshot()["counters"]
+        completed = counters.get("llm_responses_completed", 0)
+        if completed:
+            mean_tokens = counters.get("llm_response_tokens_completed", 0) / completed
+            metrics.increment(
+                "llm_tokens_saved_estimate", max(0.0, mean_tokens - partial_tokens)
+            )
 
     async def _save_messages_to_db(
-        self, session_id: int, user_message_content: str, agent_message_content: str
+        self,
+        session_id: int,
+        user_message_content: str,
+        agent_message_content: str,
+        interrupted: bool = False,
     ) -> None:
         """
-        Saves user and agent messages to the database using the MessageRepository.
+        Saves user and agent messages to the database. When the write-behind
+        queue is running the turn is queued and inserted in a batch; otherwise
+        it falls back to the MessageRepository one row at a time, using its
+        own database session rather than the request's. Once the turn is
+        stored, summarization of aged-out turns is scheduled.
 
         Args:
             session_id (int): Session ID.
             user_message_content (str): The user's message.
             agent_message_content (str): The agent's message.
+            interrupted (bool): Whether the agent's message is a partial response.
         """
-        cache_key_pattern = get_messages_list_key(session_id)
-        await self.delete_cache(cache_key_pattern)
+        # ウィンドウから外れたターンはバックグラウンドで要約に畳み込む
+        schedule_summary = partial(self.summary_service.schedule, session_id)
 
-        try:
-            user_message = self.message_repository.create_message(
-                session_id=session_id,
-                content=user_message_content,
-                is_user=True,
-            )
-            agent_message = self.message_repository.create_message(
-                session_id=session_id,
-                content=agent_message_content,
-                is_user=False,
+        if message_write_behind.running:
+            # キャッシュにはバッチの保存後に追加される
+            await message_write_behind.enqueue(
+                [
+                    {
+                        "session_id": session_id,
+                        "content": user_message_content,
+                        "is_user": True,
+                    },
+                    {
+                        "session_id": session_id,
+                        "content": agent_message_content,
+                        "is_user": False,
+                        "interrupted": interrupted,
+                    },
+                ],
+                on_flushed=schedule_summary,
             )
+            return
+
+        try:
+            # The producer outlives the request, and the request's session may
+            # already be serving the next turn, so the turn is saved through
+            # a session of its own.
+            async with SessionLocal() as db:
+                message_repository = MessageRepositoryImpl(db=db, redis=self._redis)
+                user_message = await message_repository.create_message(
+                    session_id=session_id,
+                    content=user_message_content,
+                    is_user=True,
+                )
+                agent_message = await message_repository.create_message(
+                    session_id=session_id,
+                    content=agent_message_content,
+                    is_user=False,
+                    interrupted=interrupted,
+                )
 
             if user_message is None or agent_message is None:
                 logger.error("Failed to save messages to the database.")
@@ -203,22 +461,23 @@ class AgentService(AgentUseCase):
                 detail=f"Unexpected error while saving messages for session {session_id}: {str(e)}",
             )
 
+        schedule_summary()
+
     @staticmethod
-    def _load_system_prompt() -> str:
+    def _to_chat_messages(context: List[Dict[str, str]]) -> List[BaseMessage]:
         """
-        Loads the system prompt from a file in the assets directory.
-
-        Args:
-            filename (str): Filename of the system prompt.
-
-        Returns:
-            str: The system prompt content.
-
-        Raises:
-            HTTPException: If the file is not found or cannot be read.
+        Converts the conversation history into chat messages for the prompt.
         """
-        project_root = Path(__file__).resolve().parents[2]
-        system_prompt_path = project_root / "assets" / "system_prompt.txt"
-
-        with system_prompt_path.open("r", encoding="utf-8") as file:
-            return file.read()
+        messages: List[BaseMessage] = []
+        for item in context:
+            if item["role"] == "summary":
+                messages.append(
+                    SystemMessage(
+                        content=f"Summary of the earlier conversation:\n{item['content']}"
+                    )
+                )
+            elif item["role"] == "user":
+                messages.append(HumanMessage(content=item["content"]))
+            else:
+                messages.append(AIMessage(content=item["content"]))
+        return messages
@@ -1,5 +1,6 @@
 import logging
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 from fastapi import HTTPException, status
 
@@ -11,12 +12,21 @@ logger = logging.getLogger(__name__)
 
 
 class ChatSessionService(ChatSessionUseCase):
-    async def get_chat_history(self, user_id: UserID) -> List[ChatSessionResponse]:
+    async def get_chat_history(
+        self,
+        user_id: UserID,
+        before: Optional[datetime] = None,
+        limit: int = 100,
+        before_id: Optional[int] = None,
+    ) -> List[ChatSessionResponse]:
         """
-        指定されたユーザーのチャットセッション履歴を取得します。
+        指定されたユーザーのチャットセッション履歴を、(開始時刻, ID) の新しい順に1ページ分取得します。
 
         Args:
-            current_user (Dict[str, Any]): アクセストークンから取得したユーザーペイロード
+            user_id (UserID): ユーザーID
+            before (Optional[datetime]): 前のページの最後のセッションの開始時刻（これより前のセッションを返す）
+            limit (int): 1ページの件数
+            before_id (Optional[int]): 前のページの最後のセッションのID（開始時刻が同じセッションを読み飛ばさない）
 
         Returns:
             List[ChatSessionResponse]: チャットセッションのリスト
@@ -25,8 +35,10 @@ class ChatSessionService(ChatSessionUseCase):
             HTTPException: データ取得中にエラーが発生した場合
         """
         try:
-            chat_sessions = self.chat_session_repository.get_chat_session_by_user_id(
-                user_id
+            chat_sessions = (
+                await self.chat_session_repository.get_chat_session_by_user_id(
+                    user_id, before=before, limit=limit, before_id=before_id
+                )
             )
             if chat_sessions is None:
                 return []
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import SessionLocal
+from infrastructure.database.models.message import Message
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You maintain a running summary of a conversation between a user and "
+            "an AI assistant. Update the current summary with the new turns. Keep "
+            "facts, decisions, code identifiers and open questions that later turns "
+            "may refer to. Reply with the updated summary only.",
+        ),
+        ("human", "Current summary:\n{summary}\n\nNew turns:\n{turns}"),
+    ]
+)
+
+
+class ConversationSummaryService:
+    """
+    コンテキストウィンドウから外れたターンを、チャットセッション毎の要約に逐次畳み込むクラス
+
+    新しく外れたターンと既存の要約だけをLLMに渡すため、履歴全体を再要約することはない。
+    llm に決定的なフェイクモデルを渡せばLLMなしで動作を確認できる。
+    """
+
+    # 同じセッションの要約が同時に走らないように、プロセス内で実行中のセッションを管理する
+    _running: Set[int] = set()
+    _tasks: Set[asyncio.Task] = set()
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        redis: RedisRepository,
+        token_budget: int = config.CONTEXT_TOKEN_BUDGET,
+        batch_size: int = config.SUMMARY_BATCH_SIZE,
+    ):
+        self._chain = SUMMARY_PROMPT | llm | StrOutputParser()
+        self._redis = redis
+        self._token_budget = token_budget
+        self._batch_size = batch_size
+
+    async def summarize(self, summary: Optional[str], turns: List[Message]) -> str:
+        """
+        既存の要約に新しいターンを畳み込んだ要約を生成する
+        """
+        formatted_turns = "\n".join(
+            f"{'User' if turn.is_user else 'Assistant'}: {turn.content}"
+            for turn in turns
+        )
+        return await self._chain.ainvoke(
+            {"summary": summary or "(none)", "turns": formatted_turns}
+        )
+
+    async def fold_aged_out_turns(self, session_id: int) -> bool:
+        """
+        コンテキストウィンドウから外れた未要約のターンを要約に畳み込む
+
+        Returns:
+            bool: 要約を更新した場合はTrue
+        """
+        # LLMの呼び出し中にコネクションを保持しないように、読み込みと書き込みを別のセッションで行う
+        async with SessionLocal() as db:
+            chat_session = await ChatSessionRepositoryImpl(
+                db=db, redis=self._redis
+            ).get_chat_session(session_id)
+            if chat_session is None:
+                return False
+
+            message_repository = MessageRepositoryImpl(db=db, redis=self._redis)
+            window = await message_repository.get_recent_messages_within_budget(
+                session_id, self._token_budget
+            )
+            window_start = window[0].id if window else None
+            previous_message_id = chat_session.summarized_until_message_id
+            aged_out = await message_repository.get_messages_in_range(
+                session_id,
+                after_id=previous_message_id or 0,
+                before_id=window_start,
+                limit=self._batch_size,
+            )
+        if not aged_out:
+            return False
+
+        summary = await self.summarize(chat_session.context_summary, aged_out)
+        # 要約中に他のプロセスが更新していた場合は、要約済みのメッセージIDの比較で上書きしない
+        async with SessionLocal() as db:
+            return await ChatSessionRepositoryImpl(
+                db=db, redis=self._redis
+            ).update_context_summary(
+                session_id, summary, aged_out[-1].id, previous_message_id
+            )
+
+    def schedule(self, session_id: int) -> None:
+        """
+        バックグラウンドで要約の更新を開始する（実行中のセッションは無視する）
+        """
+        if session_id in self._running:
+            return
+        self._running.add(session_id)
+        task = asyncio.create_task(self._run(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, session_id: int) -> None:
+        try:
+            while await self.fold_aged_out_turns(session_id):
+                pass
+        except Exception as e:
+            logger.warning(f"Failed to summarize session {session_id}: {str(e)}")
+        finally:
+            self._running.discard(session_id)
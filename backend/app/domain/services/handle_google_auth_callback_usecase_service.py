@@ -17,7 +17,7 @@ logger = logging.getLogger(__name__)
 
 class HandleGoogleAuthCallbackService(HandleGoogleAuthCallbackUseCase):
 
-    def execute(self, code: str) -> RedirectResponse:
+    async def execute(self, code: str) -> RedirectResponse:
         TOKEN_URL = "https://oauth2.googleapis.com/token"
         token_data = {
             "code": code,
@@ -72,7 +72,9 @@ class HandleGoogleAuthCallbackService(HandleGoogleAuthCallbackUseCase):
             )
 
         try:
-            user = self._user_repository.get_or_create_user(username=name, email=email)
+            user = await self._user_repository.get_or_create_user(
+                username=name, email=email
+            )
             logger.info(f"User {user.email} retrieved or created successfully")
         except Exception as e:
             logger.error(f"Failed to retrieve or create user: {str(e)}")
@@ -1,32 +1,47 @@
 import logging
-from typing import List
+from typing import List, Optional
 
 from fastapi import HTTPException, status
 
 from application.usecase.message_usecase import MessageUseCase
 from schemas.v1.message import MessageResponse
 
-
 logger = logging.getLogger(__name__)
 
 
 class MessageService(MessageUseCase):
 
-    async def get_messages_by_session_id(self, session_id: int) -> List[MessageResponse]:
+    async def get_messages_by_session_id(
+        self,
+        session_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[MessageResponse]:
         """
-        指定された `chat_session_id` に基づいてメッセージのリストを取得します。
+        指定された `chat_session_id` に基づいてメッセージを1ページ分、古い順に取得します。
 
         Args:
             chat_session_id (int): メッセージを取得するスレッドのID
+            before (Optional[int]): このIDより古いメッセージのうち新しいものを取得する
+            after (Optional[int]): このIDより新しいメッセージのうち古いものを取得する
+            limit (int): 1ページのメッセージの数
 
         Returns:
             List[MessageResponse]: 指定されたスレッドに含まれるメッセージのリスト
 
         Raises:
-            HTTPException: スレッドIDに関連するメッセージが見つからない場合
+            HTTPException: before と after を両方指定した場合、またはメッセージの取得に失敗した場合
         """
+        if before is not None and after is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Specify either before or after, not both.",
+            )
         try:
-            messages = self.message_repository.get_messages_by_session_id(session_id)
+            messages = await self.message_repository.get_messages_by_session_id(
+                session_id, before=before, after=after, limit=limit
+            )
             if messages is None:
                 return []
             return messages
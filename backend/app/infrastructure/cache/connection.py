@@ -1,12 +1,8 @@
-from typing import Generator
+from fastapi.requests import HTTPConnection
+
 from infrastructure.cache.redis.redis_repository import RedisRepository
-from infrastructure.cache.redis.redis_client import RedisClient
 
 
-def get_redis_connection() -> RedisRepository:
-    redis_client = RedisClient()
-    try:
-        redis_repository = RedisRepository(redis_client.get_client())
-        return redis_repository
-    finally:
-        redis_client.close()
+def get_redis_connection(connection: HTTPConnection) -> RedisRepository:
+    # lifespan で作成したコネクションプールを共有する
+    return RedisRepository(connection.app.state.redis_client.get_client())
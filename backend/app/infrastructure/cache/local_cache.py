@@ -0,0 +1,147 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+import utilities.config as config
+import utilities.metrics as metrics
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires_at: float
+
+
+def estimate_size(value: Any) -> int:
+    """値のおおよそのメモリ使用量（バイト）を見積もる"""
+    if isinstance(value, (str, bytes)):
+        return 49 + len(value)
+    if isinstance(value, BaseModel):
+        return 64 + estimate_size(value.__dict__)
+    if isinstance(value, dict):
+        return 64 + sum(
+            estimate_size(key) + estimate_size(item) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(estimate_size(item) for item in value)
+    return 32
+
+
+class LocalCache:
+    """
+    Redisの手前に置く、プロセス内のサイズ上限付きTTL LRUキャッシュ
+
+    Redisのキーと、同じキーから作った値の種類（ページの範囲など）の組で、デコードと
+    バリデーションが済んだ値を保持する。他のワーカーの書き込みは、Redis Pub/Subで
+    届く無効化のメッセージで削除する。購読できていない間（active が False）は使わない。
+
+    読み込みの前に token を取得して set に渡すと、読み込みの途中でそのキーが
+    無効化された場合は保存しない（無効化の前に読んだ古い値を残さない）。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.L1_CACHE_ENABLED,
+        max_bytes: int = config.L1_CACHE_MAX_BYTES,
+        max_entries: int = config.L1_CACHE_MAX_ENTRIES,
+        ttl: float = config.L1_CACHE_TTL,
+    ):
+        self.enabled = enabled
+        self.active = False
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, Hashable], _Entry]" = OrderedDict()
+        self._variants: Dict[str, Set[Hashable]] = {}
+        self._bytes = 0
+        # 無効化の通し番号と、キーごとの最後に無効化された番号（古いものから忘れる）
+        self._sequence = 0
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._forgotten_sequence = 0
+
+    @property
+    def usable(self) -> bool:
+        return self.enabled and self.active
+
+    def token(self) -> int:
+        """読み込みを始める前に取得し、set に渡す"""
+        return self._sequence
+
+    def get(self, key: str, variant: Hashable = None) -> Optional[Any]:
+        if not self.usable:
+            return None
+        entry = self._entries.get((key, variant))
+        if entry is None or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                self._remove((key, variant))
+            metrics.increment("l1_cache_misses")
+            return None
+        self._entries.move_to_end((key, variant))
+        metrics.increment("l1_cache_hits")
+        # 呼び出し元がリストを変更してもキャッシュに影響しないようにする
+        return list(entry.value) if isinstance(entry.value, list) else entry.value
+
+    def set(self, key: str, variant: Hashable, value: Any, token: int) -> None:
+        if not self.usable:
+            return
+        last_invalidated = self._invalidated.get(key, self._forgotten_sequence)
+        if last_invalidated > token:
+            metrics.increment("l1_cache_stale_fills")
+            return
+        size = estimate_size(value)
+        if size > self._max_bytes:
+            return
+        entry_key = (key, variant)
+        if entry_key in self._entries:
+            self._remove(entry_key)
+        self._entries[entry_key] = _Entry(value, size, time.monotonic() + self._ttl)
+        self._variants.setdefault(key, set()).add(variant)
+        self._bytes += size
+        while self._bytes > self._max_bytes or len(self._entries) > self._max_entries:
+            self._remove(next(iter(self._entries)))
+            metrics.increment("l1_cache_evictions")
+        self._report()
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        """キーから作ったすべての値を削除する（Redisへの書き込みの完了後に呼ぶ）"""
+        for key in keys:
+            self._sequence += 1
+            self._invalidated[key] = self._sequence
+            self._invalidated.move_to_end(key)
+            for variant in self._variants.get(key, set()).copy():
+                self._remove((key, variant))
+                metrics.increment("l1_cache_invalidations")
+        while len(self._invalidated) > self._max_entries:
+            _, sequence = self._invalidated.popitem(last=False)
+            self._forgotten_sequence = max(self._forgotten_sequence, sequence)
+        self._report()
+
+    def clear(self) -> None:
+        """すべて削除し、実行中の読み込みの結果も保存しない（無効化のメッセージを取りこぼした場合）"""
+        self._entries.clear()
+        self._variants.clear()
+        self._invalidated.clear()
+        self._bytes = 0
+        self._sequence += 1
+        self._forgotten_sequence = self._sequence
+        self._report()
+
+    def _remove(self, entry_key: Tuple[str, Hashable]) -> None:
+        entry = self._entries.pop(entry_key)
+        self._bytes -= entry.size
+        key, variant = entry_key
+        variants = self._variants.get(key)
+        if variants is not None:
+            variants.discard(variant)
+            if not variants:
+                del self._variants[key]
+
+    def _report(self) -> None:
+        metrics.set_gauge("l1_cache_bytes", self._bytes)
+        metrics.set_gauge("l1_cache_entries", len(self._entries))
+
+
+# プロセス内で共有するインスタンス
+local_cache = LocalCache()
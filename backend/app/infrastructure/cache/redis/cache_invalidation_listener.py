@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Optional
+
+import redis.asyncio as redis
+
+from infrastructure.cache.local_cache import LocalCache, local_cache
+from infrastructure.cache.redis.redis_keys import CACHE_INVALIDATION_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# 購読が切れた場合に再接続するまでの待ち時間の上限（秒）
+MAX_RECONNECT_INTERVAL = 30.0
+
+
+class CacheInvalidationListener:
+    """
+    Redis Pub/Subで届くキャッシュの無効化を購読し、L1キャッシュから削除するクラス
+
+    購読している間だけL1キャッシュを有効にする。接続が切れた場合は、その間の無効化を
+    取りこぼしているかもしれないので、L1キャッシュを空にしてから再接続する。
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        cache: LocalCache = local_cache,
+        reconnect_interval: float = 1.0,
+        poll_timeout: float = 1.0,
+    ):
+        self._client = client
+        self._cache = cache
+        self._reconnect_interval = reconnect_interval
+        self._poll_timeout = poll_timeout
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._cache.enabled:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        interval = self._reconnect_interval
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                self._cache.active = True
+                interval = self._reconnect_interval
+                while True:
+                    # ソケットのタイムアウトで切断しないよう、短い間隔でメッセージを待つ
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=self._poll_timeout
+                    )
+                    if message is not None:
+                        self._cache.invalidate(message["data"].split("\n"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation subscription failed: {str(e)}")
+            finally:
+                self._cache.active = False
+                self._cache.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, MAX_RECONNECT_INTERVAL)
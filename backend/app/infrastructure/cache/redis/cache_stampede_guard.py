@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from infrastructure.cache.redis.redis_keys import get_cache_lease_key
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# キャッシュの値と残りのTTL（秒）。キャッシュがない場合は None
+CachedValue = Optional[Tuple[T, float]]
+
+# 自分が取得したリースだけを解放する
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+# 再計算の時間の移動平均の重み
+DELTA_SMOOTHING = 0.2
+MAX_POLL_INTERVAL = 0.1
+
+
+class CacheStampedeGuard:
+    """
+    リードスルーキャッシュのミス時に、同じキーのDBクエリを1つにまとめるクラス
+
+    - 同じプロセス内の呼び出しは、先に来た呼び出しの再計算の完了を待つ
+    - プロセス間ではRedisのリース（SET NX PX）を取得したワーカーだけが再計算し、
+      他のワーカーはキャッシュが作られるまでポーリングして待つ
+    - TTLが切れる前に、XFetch（再計算にかかる時間と残りのTTLから確率的に決める）で
+      1つの呼び出しだけが早めに再計算する
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.CACHE_STAMPEDE_PROTECTION_ENABLED,
+        lease_ttl_ms: int = config.CACHE_LEASE_TTL_MS,
+        wait_timeout: float = config.CACHE_LEASE_WAIT_TIMEOUT,
+        poll_interval: float = config.CACHE_LEASE_POLL_INTERVAL,
+        beta: float = config.CACHE_XFETCH_BETA,
+    ):
+        self.enabled = enabled
+        # 無効にすると、プロセス内の呼び出しもリースで待つ（ワーカーごとに1呼び出しの状態を再現する）
+        self.coalesce_locally = True
+        self._lease_ttl_ms = lease_ttl_ms
+        self._wait_timeout = wait_timeout
+        self._poll_interval = poll_interval
+        self._beta = beta
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 種類ごとの再計算にかかった時間（秒）の移動平均
+        self._deltas: Dict[str, float] = {}
+
+    async def load(
+        self,
+        redis: RedisRepository,
+        key: str,
+        kind: str,
+        read: Callable[[], Awaitable[CachedValue]],
+        compute: Callable[[], Awaitable[Optional[T]]],
+    ) -> Optional[T]:
+        """
+        キャッシュを読み、なければ（またはXFetchで選ばれたら）compute で再計算する
+
+        compute はDBから読み込んでキャッシュに保存し、呼び出し元に返す値を返す。
+        待っていた呼び出しは、再計算の完了後に read でキャッシュを読み直す。
+        """
+        cached = await self._read(read)
+        if not self.enabled:
+            return cached[0] if cached is not None else await compute()
+        if cached is not None:
+            value, ttl = cached
+            if not self._should_recompute_early(kind, ttl):
+                return value
+            return await self._recompute_early(redis, key, kind, compute, value)
+
+        if self.coalesce_locally:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                metrics.increment("cache_stampede_coalesced")
+                await asyncio.shield(inflight)
+                return await self._read_or_compute(kind, read, compute)
+            self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            return await self._lead(redis, key, kind, read, compute)
+        finally:
+            if self.coalesce_locally:
+                self._inflight.pop(key).set_result(None)
+
+    async def _lead(
+        self,
+        redis: RedisRepository,
+        key: str,
+        kind: str,
+        read: Callable[[], Awaitable[CachedValue]],
+        compute: Callable[[], Awaitable[Optional[T]]],
+    ) -> Optional[T]:
+        lease_key = get_cache_lease_key(key)
+        deadline = time.monotonic() + self._wait_timeout
+        interval = self._poll_interval
+        while True:
+            token = await self._acquire(redis, lease_key)
+            if token is None:
+                # Redisに接続できない場合はそのまま再計算する
+                return await self._compute(kind, compute)
+            if token:
+                try:
+                    return await self._compute(kind, compute)
+                finally:
+                    await self._release(redis, lease_key, token)
+
+            metrics.increment("cache_lease_waits")
+            while time.monotonic() < deadline:
+                await asyncio.sleep(interval * random.uniform(0.5, 1.5))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                cached = await self._read(read)
+                if cached is not None:
+                    return cached[0]
+                if not await self._lease_exists(redis, lease_key):
+                    # リースの持ち主がキャッシュを作らずに終わった場合は、リースを取り直す
+                    break
+            else:
+                metrics.increment("cache_lease_timeouts")
+                return await self._compute(kind, compute)
+
+    async def _recompute_early(
+        self,
+        redis: RedisRepository,
+        key: str,
+        kind: str,
+        compute: Callable[[], Awaitable[Optional[T]]],
+        value: T,
+    ) -> T:
+        """TTLが切れる前に再計算する（他のワーカーが再計算中の場合はキャッシュの値を返す）"""
+        lease_key = get_cache_lease_key(key)
+        token = await self._acquire(redis, lease_key)
+        if not token:
+            return value
+        metrics.increment("cache_early_recomputes")
+        try:
+            recomputed = await self._compute(kind, compute)
+        finally:
+            await self._release(redis, lease_key, token)
+        return recomputed if recomputed is not None else value
+
+    def _should_recompute_early(self, kind: str, ttl: float) -> bool:
+        """XFetch: 残りのTTLが、再計算の時間 × beta × -log(乱数) を下回ったら再計算する"""
+        delta = self._deltas.get(kind)
+        if delta is None or ttl < 0:
+            return False
+        return ttl <= -delta * self._beta * math.log(1.0 - random.random())
+
+    async def _compute(
+        self, kind: str, compute: Callable[[], Awaitable[Optional[T]]]
+    ) -> Optional[T]:
+        started = time.perf_counter()
+        value = await compute()
+        elapsed = time.perf_counter() - started
+        previous = self._deltas.get(kind)
+        self._deltas[kind] = (
+            elapsed
+            if previous is None
+            else previous + DELTA_SMOOTHING * (elapsed - previous)
+        )
+        metrics.increment("cache_recomputes")
+        return value
+
+    async def _read_or_compute(
+        self,
+        kind: str,
+        read: Callable[[], Awaitable[CachedValue]],
+        compute: Callable[[], Awaitable[Optional[T]]],
+    ) -> Optional[T]:
+        cached = await self._read(read)
+        return cached[0] if cached is not None else await self._compute(kind, compute)
+
+    @staticmethod
+    async def _read(read: Callable[[], Awaitable[CachedValue]]) -> CachedValue:
+        try:
+            return await read()
+        except Exception as e:
+            logger.info(f"Failed to read cache: {str(e)}")
+            return None
+
+    async def _acquire(self, redis: RedisRepository, lease_key: str) -> Optional[str]:
+        """リースを取得する（取得できた場合はトークン、他が保持している場合は空文字、エラーの場合は None）"""
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis.client.set(
+                lease_key, token, nx=True, px=self._lease_ttl_ms
+            )
+        except Exception as e:
+            logger.warning(f"Failed to acquire cache lease {lease_key}: {str(e)}")
+            return None
+        return token if acquired else ""
+
+    @staticmethod
+    async def _release(redis: RedisRepository, lease_key: str, token: str) -> None:
+        try:
+            await redis.client.eval(RELEASE_LEASE_SCRIPT, 1, lease_key, token)
+        except Exception as e:
+            logger.warning(f"Failed to release cache lease {lease_key}: {str(e)}")
+
+    @staticmethod
+    async def _lease_exists(redis: RedisRepository, lease_key: str) -> bool:
+        try:
+            return bool(await redis.client.exists(lease_key))
+        except Exception:
+            return False
+
+
+# プロセス内で共有するインスタンス
+cache_stampede_guard = CacheStampedeGuard()
@@ -0,0 +1,291 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from domain.value_objects.user import UserID
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.redis_keys import (
+    CACHE_DURATION_WEEK,
+    CACHE_INVALIDATION_CHANNEL,
+    get_cache_tag_key,
+    get_chat_session_key,
+    get_sessions_expiry_key,
+    get_sessions_index_key,
+    get_sessions_index_meta_key,
+    get_user_cache_tag,
+)
+from infrastructure.cache.redis.redis_repository import TAG_ENTRY, RedisRepository
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# 期限切れのセッションを取り除いてから、カーソルより前のセッションを新しい順に返す
+# ARGV[6] がある場合は (開始時刻, ID) のカーソルとして、開始時刻が ARGV[2] と同じでIDが小さいセッションも返す
+# （メンバーはIDを桁揃えしているので、同じスコアでは辞書順がIDの順になり、DBの並びと一致する）
+# インデックスをDBから作成していない場合や、セッションのハッシュがない場合は nil を返してキャッシュミスにする
+# インデックスが新しい方の一部だけの場合（partial）に limit 件に満たなければ、続きがDBにあるのでキャッシュミスにする
+READ_SCRIPT = """
+if redis.call('HGET', KEYS[3], 'loaded') ~= '1' then return false end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for i = 1, #expired, 1000 do
+    local chunk = {unpack(expired, i, math.min(i + 999, #expired))}
+    redis.call('ZREM', KEYS[1], unpack(chunk))
+    for _, id in ipairs(chunk) do redis.call('UNLINK', ARGV[4] .. id) end
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    if ARGV[5] ~= '' then redis.call('PUBLISH', ARGV[5], KEYS[1]) end
+end
+local limit = tonumber(ARGV[3])
+local ids = {}
+local max = ARGV[2]
+if ARGV[6] ~= '' then
+    for _, id in ipairs(redis.call('ZREVRANGEBYSCORE', KEYS[1], max, max)) do
+        if id < ARGV[6] and #ids < limit then table.insert(ids, id) end
+    end
+    max = '(' .. max
+end
+if #ids < limit then
+    local older = redis.call('ZREVRANGEBYSCORE', KEYS[1], max, '-inf', 'LIMIT', 0, limit - #ids)
+    for _, id in ipairs(older) do table.insert(ids, id) end
+end
+if #ids < limit and redis.call('HGET', KEYS[3], 'partial') == '1' then return false end
+local sessions = {}
+for i, id in ipairs(ids) do
+    sessions[i] = redis.call('HGETALL', ARGV[4] .. id)
+    if #sessions[i] == 0 then return false end
+end
+return {redis.call('PTTL', KEYS[3]), sessions, #expired}
+"""
+
+# 読み込みを始めてから書き込みがなかった場合だけ、DBから読んだセッションでインデックスを作る
+# ARGV[4] はDBから新しい方の一部だけを読んだかどうか（'1' / '0'）
+# ARGV[5] 以降はセッションごとに ID、開始時刻、終了時刻、フィールドの数、フィールドと値の順に並べる
+# セッションのハッシュはユーザーのタグ（KEYS[4]）にも登録する（タグで削除されると読み込みがキャッシュミスになる）
+FILL_SCRIPT = TAG_ENTRY + """
+if (redis.call('HGET', KEYS[3], 'generation') or '0') ~= ARGV[1] then return 0 end
+local ttl = tonumber(ARGV[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+local i = 5
+while i <= #ARGV do
+    local session_key = ARGV[3] .. ARGV[i]
+    local n = tonumber(ARGV[i + 3])
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    redis.call('ZADD', KEYS[2], ARGV[i + 2], ARGV[i])
+    redis.call('DEL', session_key)
+    redis.call('HSET', session_key, unpack(ARGV, i + 4, i + 3 + n))
+    redis.call('EXPIRE', session_key, ttl)
+    tag_entry(KEYS[4], session_key, ttl * 1000)
+    i = i + 4 + n
+end
+redis.call('HSET', KEYS[3], 'loaded', '1', 'partial', ARGV[4])
+for k = 1, 3 do redis.call('EXPIRE', KEYS[k], ttl) end
+return 1
+"""
+
+# 書き込みの世代を進めてインデックスを削除し、読み込み中の fill も保存させない
+# （メタデータは削除しないので、世代が巻き戻らない）
+DISCARD_SCRIPT = """
+redis.call('HINCRBY', KEYS[3], 'generation', 1)
+redis.call('HDEL', KEYS[3], 'loaded', 'partial')
+redis.call('UNLINK', KEYS[1], KEYS[2])
+if ARGV[1] ~= '' then redis.call('PUBLISH', ARGV[1], KEYS[1]) end
+"""
+
+# 書き込みの世代を進め、インデックスがあれば作成したセッションを追加する（TTLはインデックスに合わせる）
+ADD_SCRIPT = TAG_ENTRY + """
+redis.call('HINCRBY', KEYS[3], 'generation', 1)
+if redis.call('TTL', KEYS[3]) == -1 then redis.call('EXPIRE', KEYS[3], ARGV[5]) end
+if redis.call('HGET', KEYS[3], 'loaded') ~= '1' then return 0 end
+local session_key = ARGV[4] .. ARGV[1]
+local ttl = redis.call('PTTL', KEYS[3])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('DEL', session_key)
+redis.call('HSET', session_key, unpack(ARGV, 7))
+for _, key in ipairs({KEYS[1], KEYS[2], session_key}) do
+    redis.call('PEXPIRE', key, ttl)
+end
+tag_entry(KEYS[4], session_key, ttl)
+if ARGV[6] ~= '' then redis.call('PUBLISH', ARGV[6], KEYS[1]) end
+return 1
+"""
+
+
+def to_member(session_id: int | str) -> str:
+    """セッションIDをソート済みセットのメンバーにする（同じスコアのメンバーが辞書順でIDの順に並ぶように桁を揃える）"""
+    return f"{int(session_id):019d}"
+
+
+def to_score(value: Optional[datetime]) -> int:
+    """日時をソート済みセットのスコア（UNIX時間のマイクロ秒）にする（None は期限切れとして扱う 0）"""
+    if value is None:
+        return 0
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+class ChatSessionIndexCache:
+    """
+    ユーザーのセッション一覧を、Redisのソート済みセットとセッションごとのハッシュでキャッシュするクラス
+
+    開始時刻のソート済みセットから新しい順に範囲を読み、終了時刻のソート済みセットで期限切れの
+    セッションを ZREMRANGEBYSCORE で取り除く。セッションを作成したら add でインデックスに追加する
+    ので、一覧をDBから読み直さない。メタデータには書き込みの世代を保持し、DBから読んでいる間に
+    作成があった場合は fill しない（作成前の内容でインデックスを作らない）。インデックスには新しい方から
+    最大 CACHE_SESSION_INDEX_MAX_SIZE 件だけを載せ、それより古いページはDBから読む。
+    ページのカーソルは (開始時刻, ID) で、開始時刻が同じセッションもDBと同じIDの降順で読む。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        ttl: int = int(CACHE_DURATION_WEEK.total_seconds()),
+    ):
+        self._redis = redis
+        self._ttl = ttl
+
+    async def read(
+        self,
+        user_id: UserID,
+        before: Optional[datetime],
+        limit: int,
+        before_id: Optional[int] = None,
+    ) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        (before, before_id) より前のセッションを新しい順に limit 件と、残りのTTL（秒）を読み込む
+
+        before_id を省略した場合は、開始時刻が before より前のセッションを返す
+        """
+        index_key = get_sessions_index_key(user_id)
+        if before is None:
+            max_score = "+inf"
+        elif before_id is None:
+            max_score = f"({to_score(before)}"
+        else:
+            max_score = str(to_score(before))
+        cached = await self._redis.client.eval(
+            READ_SCRIPT,
+            3,
+            index_key,
+            get_sessions_expiry_key(user_id),
+            get_sessions_index_meta_key(user_id),
+            to_score(datetime.utcnow()),
+            max_score,
+            limit,
+            get_chat_session_key(),
+            self._invalidation_channel(),
+            "" if before is None or before_id is None else to_member(before_id),
+        )
+        if cached is None:
+            metrics.increment("chat_sessions_index_misses")
+            return None
+        metrics.increment("chat_sessions_index_hits")
+        ttl, sessions, pruned = cached
+        if pruned:
+            metrics.increment("chat_sessions_index_pruned", pruned)
+            local_cache.invalidate([index_key])
+        return [dict(zip(fields[::2], fields[1::2])) for fields in sessions], ttl / 1000
+
+    async def generation(self, user_id: UserID) -> str:
+        """書き込みの世代を取得する（DBから読み込む前に取得して fill に渡す）"""
+        generation = await self._redis.client.hget(
+            get_sessions_index_meta_key(user_id), "generation"
+        )
+        return generation or "0"
+
+    async def fill(
+        self,
+        user_id: UserID,
+        sessions: List[Dict[str, Any]],
+        generation: str,
+        partial: bool = False,
+    ) -> bool:
+        """
+        DBから読み込んだユーザーの有効なセッションでインデックスを作る
+
+        partial は新しい方の一部だけを読んだ場合に指定する（それより古いページの読み込みはキャッシュミスになる）
+        """
+        items: List[Any] = []
+        for session in sessions:
+            fields = self._to_fields(session)
+            items.extend(
+                [
+                    to_member(session["id"]),
+                    to_score(session["start_time"]),
+                    to_score(session["end_time"]),
+                    len(fields),
+                    *fields,
+                ]
+            )
+        # DBの内容を載せるだけなので、L1キャッシュは無効化しない
+        stored = await self._redis.client.eval(
+            FILL_SCRIPT,
+            4,
+            get_sessions_index_key(user_id),
+            get_sessions_expiry_key(user_id),
+            get_sessions_index_meta_key(user_id),
+            get_cache_tag_key(get_user_cache_tag(user_id)),
+            generation,
+            self._ttl,
+            get_chat_session_key(),
+            "1" if partial else "0",
+            *items,
+        )
+        return bool(stored)
+
+    async def add(self, session: Dict[str, Any]) -> bool:
+        """作成したセッションをインデックスに追加する（インデックスがない場合は何もしない）"""
+        user_id = session["user_id"]
+        index_key = get_sessions_index_key(user_id)
+        added = await self._redis.client.eval(
+            ADD_SCRIPT,
+            4,
+            index_key,
+            get_sessions_expiry_key(user_id),
+            get_sessions_index_meta_key(user_id),
+            get_cache_tag_key(get_user_cache_tag(user_id)),
+            to_member(session["id"]),
+            to_score(session["start_time"]),
+            to_score(session["end_time"]),
+            get_chat_session_key(),
+            self._ttl,
+            self._invalidation_channel(),
+            *self._to_fields(session),
+        )
+        local_cache.invalidate([index_key])
+        if added:
+            metrics.increment("chat_sessions_index_adds")
+        return bool(added)
+
+    async def discard(self, user_id: UserID) -> None:
+        """ユーザーのインデックスを削除する（次の読み込みでDBから作り直す）"""
+        index_key = get_sessions_index_key(user_id)
+        await self._redis.client.eval(
+            DISCARD_SCRIPT,
+            3,
+            index_key,
+            get_sessions_expiry_key(user_id),
+            get_sessions_index_meta_key(user_id),
+            self._invalidation_channel(),
+        )
+        local_cache.invalidate([index_key])
+
+    @staticmethod
+    def _to_fields(session: Dict[str, Any]) -> List[str]:
+        """セッションをハッシュのフィールドと値の並びにする（None のフィールドは保存しない）"""
+        fields: List[str] = []
+        for name, value in session.items():
+            if value is None:
+                continue
+            fields.extend(
+                [name, value.isoformat() if isinstance(value, datetime) else str(value)]
+            )
+        return fields
+
+    @staticmethod
+    def _invalidation_channel() -> str:
+        return CACHE_INVALIDATION_CHANNEL if local_cache.enabled else ""
@@ -0,0 +1,333 @@
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.client import NEVER_DECODE
+
+from domain.value_objects.chat_session import ChatSessionID
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.redis_keys import (
+    CACHE_DURATION_DAY,
+    CACHE_INVALIDATION_CHANNEL,
+    get_cache_tag_key,
+    get_messages_page_key,
+    get_messages_pages_meta_key,
+    get_messages_pending_writes_key,
+    get_session_cache_tag,
+)
+from infrastructure.cache.redis.redis_repository import TAG_ENTRY, RedisRepository
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# スレッドのすべてのページを削除し、読み込み中の fill も保存させない（KEYS[1] はメタデータ）
+DISCARD_PAGES = """
+local function discard_pages(meta_key, page_prefix, channel)
+    redis.call('HINCRBY', meta_key, 'generation', 1)
+    local changed = {}
+    for _, field in ipairs(redis.call('HKEYS', meta_key)) do
+        if field ~= 'generation' then
+            redis.call('UNLINK', page_prefix .. field)
+            redis.call('HDEL', meta_key, field)
+            table.insert(changed, page_prefix .. field)
+        end
+    end
+    if channel ~= '' and #changed > 0 then
+        redis.call('PUBLISH', channel, table.concat(changed, '\\n'))
+    end
+    return changed
+end
+"""
+
+# ページがある場合だけ残りのTTL（ミリ秒）とメッセージを返す（ない場合は nil を返してキャッシュミスにする）
+# 期限までにページに追加されなかった書き込みがあれば、そのプロセスはコミットの後に落ちているので、
+# 抜けのあるページをすべて削除してキャッシュミスにする
+READ_SCRIPT = DISCARD_PAGES + """
+if #redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, 1) > 0 then
+    discard_pages(KEYS[2], ARGV[2], ARGV[3])
+    redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+    return -1
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local ttl = redis.call('PTTL', KEYS[1])
+if redis.call('LINDEX', KEYS[1], 0) == '' then return {ttl, {}} end
+return {ttl, redis.call('LRANGE', KEYS[1], 0, -1)}
+"""
+
+# 読み込みを始めてから書き込みがなかった場合だけ、DBから読んだメッセージでページを作る
+# （世代を保持するメタデータは、どのページよりも先に期限切れにしない）
+# ページはスレッドのタグ（KEYS[3]）にも登録する
+FILL_SCRIPT = TAG_ENTRY + """
+if (redis.call('HGET', KEYS[2], 'generation') or '0') ~= ARGV[1] then return 0 end
+local ttl = tonumber(ARGV[4])
+redis.call('DEL', KEYS[1])
+for i = 5, #ARGV, 1000 do
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+if redis.call('TTL', KEYS[2]) < ttl then redis.call('EXPIRE', KEYS[2], ttl) end
+tag_entry(KEYS[3], KEYS[1], ttl * 1000)
+return 1
+"""
+
+# 書き込みの世代を進め、保存したメッセージが入るページだけを更新する
+# - latest: 末尾に追加して最新の limit 件に切り詰める
+# - after: 満杯でなければ limit 件まで末尾に追加する（満杯のページは変わらない）
+# - before: カーソルより新しいメッセージは入らないので変えない
+# 既にあるメッセージより古いIDが入る場合（保存の順番が前後した場合など）はページを削除する。
+# 更新・削除したページのキーを返し、ARGV[3] のチャンネルがあればL1キャッシュの無効化を送る
+# TTLを延ばしたページはスレッドのタグ（KEYS[2]）に登録し直す
+APPEND_SCRIPT = TAG_ENTRY + """
+local ttl = tonumber(ARGV[2])
+redis.call('HINCRBY', KEYS[1], 'generation', 1)
+if redis.call('TTL', KEYS[1]) < ttl then redis.call('EXPIRE', KEYS[1], ttl) end
+local n = tonumber(ARGV[4])
+local first_id = tonumber(ARGV[5])
+local updated, dropped, changed = 0, 0, {}
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local kind, cursor, limit = string.match(fields[i], '^(%a+)_(%d+)_(%d+)$')
+    if kind then
+        local page_key = ARGV[1] .. fields[i]
+        cursor, limit = tonumber(cursor), tonumber(limit)
+        local last_id = tonumber(fields[i + 1])
+        if redis.call('EXISTS', page_key) == 0 then
+            redis.call('HDEL', KEYS[1], fields[i])
+        elseif (kind == 'before' and first_id < cursor)
+            or (kind ~= 'before' and first_id <= last_id) then
+            redis.call('DEL', page_key)
+            redis.call('HDEL', KEYS[1], fields[i])
+            dropped = dropped + 1
+            table.insert(changed, page_key)
+        elseif kind ~= 'before' then
+            local count = redis.call('LLEN', page_key)
+            if redis.call('LINDEX', page_key, 0) == '' then
+                redis.call('LPOP', page_key)
+                count = 0
+            end
+            local take = n
+            if kind == 'after' then take = math.min(n, limit - count) end
+            if take > 0 then
+                redis.call('RPUSH', page_key, unpack(ARGV, 5 + n, 4 + n + take))
+                if kind == 'latest' then redis.call('LTRIM', page_key, -limit, -1) end
+                redis.call('HSET', KEYS[1], fields[i], ARGV[4 + take])
+                redis.call('EXPIRE', page_key, ttl)
+                tag_entry(KEYS[2], page_key, ttl * 1000)
+                updated = updated + 1
+                table.insert(changed, page_key)
+            end
+        end
+    end
+end
+if ARGV[3] ~= '' and #changed > 0 then
+    redis.call('PUBLISH', ARGV[3], table.concat(changed, '\\n'))
+end
+return {updated, dropped, changed}
+"""
+
+# スレッドのすべてのページを削除し、読み込み中の fill も保存させない
+DISCARD_SCRIPT = DISCARD_PAGES + "return discard_pages(KEYS[1], ARGV[1], ARGV[2])"
+
+# メッセージをコミットする前に、書き込みを期限付きで登録する
+BEGIN_WRITE_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+if redis.call('PTTL', KEYS[1]) < tonumber(ARGV[3]) then redis.call('PEXPIRE', KEYS[1], ARGV[3]) end
+"""
+
+
+def page_window(before: Optional[int], after: Optional[int], limit: int) -> str:
+    """
+    ページの範囲を表す文字列（キャッシュのキーに使う）
+
+    - latest_0_{limit}: 最新の limit 件
+    - before_{id}_{limit}: id より古いメッセージのうち新しい limit 件
+    - after_{id}_{limit}: id より新しいメッセージのうち古い limit 件
+    """
+    if before is not None:
+        return f"before_{before}_{limit}"
+    if after is not None:
+        return f"after_{after}_{limit}"
+    return f"latest_0_{limit}"
+
+
+class MessagePageCache:
+    """
+    スレッドのメッセージを、カーソルで区切ったページごとにRedisリストとしてキャッシュするクラス
+
+    ページはエンコードしたメッセージを古い順に並べたリストで、スレッドごとのメタデータのハッシュに
+    ページの範囲と最後のメッセージIDを登録する。メッセージを保存したら append でそのメッセージが
+    入るページだけを更新し、影響のないページ（古いページや満杯のページ）はそのまま残す。
+    メタデータには書き込みの世代も保持し、DBから読んでいる間に書き込みがあった場合は fill しない
+    （書き込み前の内容でページを作らない）。メッセージのないページは、空文字の目印だけの
+    リストを empty_ttl の間キャッシュする。
+
+    ページへの追加はDBのコミットの後になるので、コミットの前に begin_write で書き込みを期限付きで
+    登録し、append で登録を外す。その間にプロセスが落ちると、コミットしたメッセージがページから
+    抜けたままになるので、期限を過ぎた登録が残っていれば次の読み込みでページをすべて削除する。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        ttl: int = int(CACHE_DURATION_DAY.total_seconds()),
+        empty_ttl: int = config.CACHE_EMPTY_TTL,
+        pending_write_ttl_ms: int = config.CACHE_PENDING_WRITE_TTL_MS,
+    ):
+        self._redis = redis
+        self._ttl = ttl
+        self._empty_ttl = empty_ttl
+        self._pending_write_ttl_ms = pending_write_ttl_ms
+
+    async def read(
+        self, session_id: ChatSessionID, window: str
+    ) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """キャッシュからページと残りのTTL（秒）を読み込む（キャッシュがない場合は None を返す）"""
+        cached = await self._redis.client.execute_command(
+            "EVAL",
+            READ_SCRIPT,
+            3,
+            get_messages_page_key(session_id, window),
+            get_messages_pages_meta_key(session_id),
+            get_messages_pending_writes_key(session_id),
+            int(time.time() * 1000),
+            get_messages_page_key(session_id),
+            self._invalidation_channel(),
+            **{NEVER_DECODE: True},
+        )
+        if cached == -1:
+            # 抜けのあるページを削除したので、キャッシュミスとしてDBから読み直させる
+            metrics.increment("messages_cache_healed")
+            metrics.increment("messages_cache_misses")
+            return None
+        if cached is None:
+            metrics.increment("messages_cache_misses")
+            return None
+        metrics.increment("messages_cache_hits")
+        ttl, items = cached
+        return [self._redis.codec.decode(item) for item in items], ttl / 1000
+
+    async def generation(self, session_id: ChatSessionID) -> str:
+        """書き込みの世代を取得する（DBから読み込む前に取得して fill に渡す）"""
+        generation = await self._redis.client.hget(
+            get_messages_pages_meta_key(session_id), "generation"
+        )
+        return generation or "0"
+
+    async def fill(
+        self,
+        session_id: ChatSessionID,
+        window: str,
+        messages: List[Dict[str, Any]],
+        generation: str,
+    ) -> bool:
+        """DBから読み込んだページをキャッシュする"""
+        if messages:
+            last_id, ttl = messages[-1]["id"], self._ttl
+            items = [self._redis.codec.encode(message) for message in messages]
+        else:
+            # 空の after ページは、カーソルより新しいメッセージが保存されたら追加できるようにする
+            kind, cursor, _ = window.split("_")
+            last_id = cursor if kind == "after" else 0
+            ttl, items = self._empty_ttl, [""]
+        # DBの内容を載せるだけなので、L1キャッシュは無効化しない
+        stored = await self._redis.client.eval(
+            FILL_SCRIPT,
+            3,
+            get_messages_page_key(session_id, window),
+            get_messages_pages_meta_key(session_id),
+            get_cache_tag_key(get_session_cache_tag(session_id)),
+            generation,
+            window,
+            last_id,
+            ttl,
+            *items,
+        )
+        return bool(stored)
+
+    async def begin_write(self, session_ids: List[ChatSessionID]) -> str:
+        """メッセージをコミットする前に書き込みを登録し、append に渡すトークンを返す"""
+        token = uuid.uuid4().hex
+        deadline = int(time.time() * 1000) + self._pending_write_ttl_ms
+        pipeline = self._redis.client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipeline.eval(
+                BEGIN_WRITE_SCRIPT,
+                1,
+                get_messages_pending_writes_key(session_id),
+                token,
+                deadline,
+                self._ttl * 1000,
+            )
+        await pipeline.execute()
+        return token
+
+    async def cancel_write(self, session_ids: List[ChatSessionID], token: str) -> None:
+        """コミットしなかった書き込みの登録を外す"""
+        pipeline = self._redis.client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipeline.zrem(get_messages_pending_writes_key(session_id), token)
+        await pipeline.execute()
+
+    async def append(
+        self, messages: List[Dict[str, Any]], token: Optional[str] = None
+    ) -> None:
+        """
+        保存したメッセージを、スレッドごとにそのメッセージが入るページに追加する
+
+        token には begin_write が返したトークンを渡し、追加と同時に書き込みの登録を外す
+        """
+        by_session: Dict[ChatSessionID, List[Dict[str, Any]]] = defaultdict(list)
+        for message in messages:
+            by_session[message["session_id"]].append(message)
+
+        pipeline = self._redis.client.pipeline(transaction=False)
+        for session_id, session_messages in by_session.items():
+            session_messages.sort(key=lambda message: message["id"])
+            pipeline.eval(
+                APPEND_SCRIPT,
+                2,
+                get_messages_pages_meta_key(session_id),
+                get_cache_tag_key(get_session_cache_tag(session_id)),
+                get_messages_page_key(session_id),
+                self._ttl,
+                self._invalidation_channel(),
+                len(session_messages),
+                *[message["id"] for message in session_messages],
+                *[self._redis.codec.encode(message) for message in session_messages],
+            )
+            if token is not None:
+                pipeline.zrem(get_messages_pending_writes_key(session_id), token)
+        results = await pipeline.execute()
+        if token is not None:
+            results = results[::2]
+        local_cache.invalidate(key for _, _, keys in results for key in keys)
+        metrics.increment(
+            "messages_cache_appends", sum(result[0] for result in results)
+        )
+        dropped = sum(result[1] for result in results)
+        if dropped:
+            metrics.increment("messages_cache_resets", dropped)
+
+    async def discard(self, session_ids: List[ChatSessionID]) -> None:
+        """スレッドのすべてのページを削除する（次の読み込みでDBから作り直す）"""
+        if not session_ids:
+            return
+        pipeline = self._redis.client.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipeline.eval(
+                DISCARD_SCRIPT,
+                1,
+                get_messages_pages_meta_key(session_id),
+                get_messages_page_key(session_id),
+                self._invalidation_channel(),
+            )
+        results = await pipeline.execute()
+        local_cache.invalidate(key for keys in results for key in keys)
+
+    @staticmethod
+    def _invalidation_channel() -> str:
+        return CACHE_INVALIDATION_CHANNEL if local_cache.enabled else ""
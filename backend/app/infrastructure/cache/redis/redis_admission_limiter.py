@@ -0,0 +1,120 @@
+import logging
+import time
+
+from infrastructure.cache.redis.redis_keys import (
+    ADMISSION_LEASES_KEY,
+    get_admission_user_leases_key,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+ACQUIRED = 0
+GLOBAL_LIMIT_REACHED = 1
+USER_LIMIT_REACHED = 2
+
+# 期限切れのリースを掃除した上で、全体とユーザーごとの上限に空きがあればリースを追加する
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then return 1 end
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then return 2 end
+local expires_at = now + tonumber(ARGV[3])
+redis.call('ZADD', KEYS[1], expires_at, ARGV[1])
+redis.call('ZADD', KEYS[2], expires_at, ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+redis.call('PEXPIRE', KEYS[2], ARGV[3])
+return 0
+"""
+
+# まだ保持しているリースの有効期限を延ばす（期限切れで回収されたリースは追加し直さない）
+RENEW_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+local expires_at = tonumber(ARGV[2]) + tonumber(ARGV[3])
+redis.call('ZADD', KEYS[1], 'XX', expires_at, ARGV[1])
+redis.call('ZADD', KEYS[2], 'XX', expires_at, ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+redis.call('PEXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+
+class RedisAdmissionLimiter:
+    """
+    Redisのsorted setでLLMストリームのリースを管理し、レプリカ全体の同時実行数を制限するクラス
+
+    リースの有効期限は短くし、保持している間は renew で延ばし続ける。プロセスが落ちて
+    解放されなかったリースは期限切れですぐに回収される。Redisに接続できない場合は制限せずに通す。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        max_concurrency: int = config.ADMISSION_REDIS_MAX_CONCURRENCY,
+        per_user_limit: int = config.ADMISSION_PER_USER_LIMIT,
+        lease_ttl_ms: int = config.ADMISSION_LEASE_TTL_MS,
+    ):
+        self._redis = redis
+        self._max_concurrency = max_concurrency
+        self._per_user_limit = per_user_limit
+        self._lease_ttl_ms = lease_ttl_ms
+
+    async def acquire(self, user_id: str, lease_id: str) -> int:
+        """
+        リースを取得する
+
+        Returns:
+            int: ACQUIRED / GLOBAL_LIMIT_REACHED / USER_LIMIT_REACHED のいずれか
+        """
+        try:
+            return int(
+                await self._redis.client.eval(
+                    ACQUIRE_SCRIPT,
+                    2,
+                    ADMISSION_LEASES_KEY,
+                    get_admission_user_leases_key(user_id),
+                    lease_id,
+                    int(time.time() * 1000),
+                    self._lease_ttl_ms,
+                    self._max_concurrency,
+                    self._per_user_limit,
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Failed to acquire admission lease: {str(e)}")
+            return ACQUIRED
+
+    @property
+    def renew_interval(self) -> float:
+        """リースを延ばす間隔（秒）。Redisへの書き込みが一度失敗しても期限が切れないようにする"""
+        return self._lease_ttl_ms / 3000
+
+    async def renew(self, user_id: str, lease_id: str) -> bool:
+        """リースの有効期限を延ばす（リースが既に回収されていた場合は False を返す）"""
+        try:
+            return bool(
+                await self._redis.client.eval(
+                    RENEW_SCRIPT,
+                    2,
+                    ADMISSION_LEASES_KEY,
+                    get_admission_user_leases_key(user_id),
+                    lease_id,
+                    int(time.time() * 1000),
+                    self._lease_ttl_ms,
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Failed to renew admission lease {lease_id}: {str(e)}")
+            return True
+
+    async def release(self, user_id: str, lease_id: str) -> None:
+        """リースを解放する"""
+        try:
+            pipeline = self._redis.client.pipeline(transaction=False)
+            pipeline.zrem(ADMISSION_LEASES_KEY, lease_id)
+            pipeline.zrem(get_admission_user_leases_key(user_id), lease_id)
+            await pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to release admission lease {lease_id}: {str(e)}")
@@ -1,44 +1,50 @@
 import logging
 import utilities.config as config
 
-import redis
+import redis.asyncio as redis
 
 logger = logging.getLogger(__name__)
 
 
 class RedisClient:
-    """Redisクライアントを管理するクラス"""
-
-    def __init__(self):
-        self._host = config.REDIS_HOST
-        self._port = config.REDIS_PORT
-        self._db = config.REDIS_DB
-        self._password = config.REDIS_PASSWORD
-        self._client = None
-
-    def connect(self):
-        """Redisに接続"""
-        try:
-            self._client = redis.Redis(
-                host=self._host,
-                port=self._port,
-                password=self._password,
-                decode_responses=True,  # Unicode文字列を返すように設定
-            )
-            self._client.ping()
-            logger.debug("Connected to Redis")
-        except ConnectionError as e:
-            logger.error(f"Failed to connect to Redis: {str(e)}")
-            raise ConnectionError(f"Failed to connect to Redis: {str(e)}")
+    """
+    Redisクライアントを管理するクラス
+
+    アプリケーション全体で1つのコネクションプールを共有する。コネクションは
+    使うときに張り、切れた場合も次に使うときに張り直すので、起動時や
+    リクエストごとに接続・PINGはしない。redis.asyncio のクライアントなので、
+    コマンドの応答を待つ間もイベントループを止めない。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = config.REDIS_MAX_CONNECTIONS,
+        socket_timeout: float = config.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout: float = config.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval: int = config.REDIS_HEALTH_CHECK_INTERVAL,
+    ):
+        # 上限に達した場合はエラーにせず、コネクションが空くまで待つ
+        self._pool = redis.BlockingConnectionPool(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            password=config.REDIS_PASSWORD,
+            decode_responses=True,  # Unicode文字列を返すように設定
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            # 一定時間使っていないコネクションは使う前にPINGで確認する
+            health_check_interval=health_check_interval,
+            timeout=socket_timeout,
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
 
     def get_client(self) -> redis.Redis:
-        """Redisクライアントを取得"""
-        if self._client is None:
-            self.connect()
+        """Redisクライアント（redis.asyncio）を取得"""
         return self._client
 
-    def close(self):
-        """Redisの接続を切断する"""
-        if self._client:
-            self._client.connection_pool.disconnect()
-            logger.debug("Redis connection closes")
+    async def close(self):
+        """プールのコネクションをすべて切断する"""
+        await self._client.aclose()
+        await self._pool.disconnect()
+        logger.debug("Redis connection pool closed")
@@ -0,0 +1,157 @@
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Callable, Dict, NamedTuple
+
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# ヘッダーの先頭のバイト（UTF-8の文字列には現れないので、ヘッダーのない旧形式のJSONと区別できる）
+MAGIC = 0xFF
+FORMAT_VERSION = 1
+HEADER_SIZE = 4
+
+
+def json_default(obj: Any) -> Any:
+    """JSONシリアライズ可能な形式に変換"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()  # ISO 8601形式の文字列に変換
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+class Serializer(NamedTuple):
+    id: int
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+class Compressor(NamedTuple):
+    id: int
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def available_serializers() -> Dict[str, Serializer]:
+    serializers = {
+        "json": Serializer(
+            1,
+            lambda value: json.dumps(
+                value, default=json_default, ensure_ascii=False
+            ).encode(),
+            json.loads,
+        ),
+    }
+    if orjson is not None:
+        serializers["orjson"] = Serializer(
+            2,
+            lambda value: orjson.dumps(
+                value, default=json_default, option=orjson.OPT_NON_STR_KEYS
+            ),
+            orjson.loads,
+        )
+    if msgpack is not None:
+        serializers["msgpack"] = Serializer(
+            3,
+            lambda value: msgpack.packb(value, default=json_default),
+            lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+        )
+    return serializers
+
+
+def available_compressors(zstd_level: int) -> Dict[str, Compressor]:
+    compressors = {"none": Compressor(0, bytes, bytes)}
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=zstd_level)
+        decompressor = zstandard.ZstdDecompressor()
+        compressors["zstd"] = Compressor(
+            1, compressor.compress, decompressor.decompress
+        )
+    if lz4_frame is not None:
+        compressors["lz4"] = Compressor(2, lz4_frame.compress, lz4_frame.decompress)
+    return compressors
+
+
+class CacheCodec:
+    """
+    キャッシュの値をRedisに保存するバイト列に変換するクラス
+
+    値は serializer でシリアライズし、compression_threshold バイト以上の場合は圧縮する。
+    先頭の4バイトのヘッダー（マジックバイト、フォーマットのバージョン、シリアライザー、圧縮方式）から
+    読み込み方を決めるので、設定を変えても既存のキャッシュはそのまま読める。
+    ヘッダーのない値は、コーデックを導入する前のJSON文字列として読む。
+    """
+
+    def __init__(
+        self,
+        serializer: str = config.CACHE_SERIALIZER,
+        compression: str = config.CACHE_COMPRESSION,
+        compression_threshold: int = config.CACHE_COMPRESSION_THRESHOLD,
+        zstd_level: int = config.CACHE_ZSTD_LEVEL,
+    ):
+        serializers = available_serializers()
+        compressors = available_compressors(zstd_level)
+        if serializer not in serializers:
+            logger.warning(f"Cache serializer {serializer} is unavailable, using json")
+            serializer = "json"
+        if compression not in compressors:
+            logger.warning(
+                f"Cache compression {compression} is unavailable, storing uncompressed"
+            )
+            compression = "none"
+        self._serializer = serializers[serializer]
+        self._compressor = compressors[compression]
+        self._compression_threshold = compression_threshold
+        self._serializers = {item.id: item for item in serializers.values()}
+        self._compressors = {item.id: item for item in compressors.values()}
+
+    def encode(self, value: Any) -> bytes:
+        """値をヘッダー付きのバイト列に変換する"""
+        data = self._serializer.dumps(value)
+        compressor = self._compressors[0]
+        if self._compressor.id and len(data) >= self._compression_threshold:
+            compressed = self._compressor.compress(data)
+            # 圧縮しても小さくならない場合はそのまま保存する
+            if len(compressed) < len(data):
+                data, compressor = compressed, self._compressor
+        header = bytes((MAGIC, FORMAT_VERSION, self._serializer.id, compressor.id))
+        return header + data
+
+    def decode(self, data: bytes | str) -> Any:
+        """encode で変換したバイト列（またはヘッダーのない旧形式のJSON）を値に戻す"""
+        if isinstance(data, str) or not data or data[0] != MAGIC:
+            return json.loads(data)
+        if len(data) < HEADER_SIZE or data[1] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported cache format version: {data[1:2].hex()}")
+        serializer = self._serializers.get(data[2])
+        compressor = self._compressors.get(data[3])
+        if serializer is None or compressor is None:
+            raise ValueError(
+                f"Unsupported cache encoding: serializer={data[2]}, compression={data[3]}"
+            )
+        return serializer.loads(compressor.decompress(data[HEADER_SIZE:]))
+
+
+# プロセス内で共有するインスタンス
+default_codec = CacheCodec()
@@ -9,15 +9,126 @@ CACHE_DURATION_DAY = timedelta(days=1)
 CACHE_DURATION_HALF_DAY = timedelta(hours=12)
 CACHE_DURATION_HOUR = timedelta(hours=1)
 
-CHAT_SESSIONS_LIST_KEY = "chat_sessions_list_{user_id}"
-MESSAGES_LIST_KEY = "messages_list_{chat_session_id}"
+CHAT_SESSIONS_INDEX_KEY = "chat_sessions_index_{user_id}"
+CHAT_SESSIONS_EXPIRY_KEY = "chat_sessions_expiry_{user_id}"
+CHAT_SESSIONS_INDEX_META_KEY = "chat_sessions_index_meta_{user_id}"
+CHAT_SESSION_KEY = "chat_session_{chat_session_id}"
+MESSAGES_PAGE_KEY = "messages_page_{chat_session_id}_{window}"
+MESSAGES_PAGES_META_KEY = "messages_pages_meta_{chat_session_id}"
+MESSAGES_PENDING_WRITES_KEY = "messages_pending_writes_{chat_session_id}"
+RESPONSE_CACHE_KEY = "response_cache_{digest}"
+RESPONSE_CACHE_INDEX_KEY = "response_cache_index"
+RESPONSE_CACHE_SIZES_KEY = "response_cache_sizes"
+RESPONSE_CACHE_TOTAL_SIZE_KEY = "response_cache_total_size"
+SINGLE_FLIGHT_LOCK_KEY = "single_flight_lock_{digest}"
+SINGLE_FLIGHT_STREAM_KEY = "single_flight_stream_{flight_id}"
+ADMISSION_LEASES_KEY = "admission_leases"
+ADMISSION_USER_LEASES_KEY = "admission_leases_{user_id}"
+WRITE_BEHIND_INSTANCES_KEY = "write_behind_instances"
+WRITE_BEHIND_JOURNAL_KEY = "write_behind_journal_{instance_id}"
+WRITE_BEHIND_SPILL_KEY = "write_behind_spill"
+WRITE_BEHIND_DEAD_LETTER_KEY = "write_behind_dead_letter"
+ACTIVE_TURN_KEY = "active_turn_{chat_session_id}"
+TURN_STREAM_KEY = "turn_stream_{turn_id}"
+TURN_SUBSCRIBER_KEY = "turn_subscriber_{turn_id}"
+CACHE_TAG_KEY = "cache_tag_{tag}"
+CACHE_LEASE_KEY = "cache_lease_{key}"
+USER_CACHE_TAG = "user:{user_id}"
+SESSION_CACHE_TAG = "session:{chat_session_id}"
+# 書き込んだキャッシュのキーを改行区切りで送り、各ワーカーのL1キャッシュから削除する
+CACHE_INVALIDATION_CHANNEL = "cache_invalidation"
 
 
-def get_sessions_list_key(user_id: UserID):
-    """特定のユーザーに紐づくセッションリストを取得するためのRedisキーを生成する関数"""
-    return CHAT_SESSIONS_LIST_KEY.format(user_id=user_id)
+def get_sessions_index_key(user_id: UserID):
+    """特定のユーザーのセッションを開始時刻の順に並べるソート済みセットのRedisキーを生成する関数"""
+    return CHAT_SESSIONS_INDEX_KEY.format(user_id=user_id)
 
 
-def get_messages_list_key(chat_session_id: ChatSessionID):
-    """特定のスレッドに紐づくメッセージリストを取得するためのRedisキーを生成する関数"""
-    return MESSAGES_LIST_KEY.format(chat_session_id=chat_session_id)
+def get_sessions_expiry_key(user_id: UserID):
+    """特定のユーザーのセッションを終了時刻の順に並べるソート済みセットのRedisキーを生成する関数"""
+    return CHAT_SESSIONS_EXPIRY_KEY.format(user_id=user_id)
+
+
+def get_sessions_index_meta_key(user_id: UserID):
+    """セッションのインデックスの書き込みの世代と、DBから作成済みかどうかを保持するRedisキーを生成する関数"""
+    return CHAT_SESSIONS_INDEX_META_KEY.format(user_id=user_id)
+
+
+def get_chat_session_key(chat_session_id: ChatSessionID | str = ""):
+    """セッションの情報を保持するハッシュのRedisキーを生成する関数（ID を省略するとキーの接頭辞）"""
+    return CHAT_SESSION_KEY.format(chat_session_id=chat_session_id)
+
+
+def get_messages_page_key(chat_session_id: ChatSessionID, window: str = ""):
+    """特定のスレッドのメッセージの1ページを取得するためのRedisキーを生成する関数（window を省略するとキーの接頭辞）"""
+    return MESSAGES_PAGE_KEY.format(chat_session_id=chat_session_id, window=window)
+
+
+def get_messages_pages_meta_key(chat_session_id: ChatSessionID):
+    """メッセージのページのキャッシュの書き込みの世代と、各ページの最後のメッセージIDを保持するRedisキーを生成する関数"""
+    return MESSAGES_PAGES_META_KEY.format(chat_session_id=chat_session_id)
+
+
+def get_messages_pending_writes_key(chat_session_id: ChatSessionID):
+    """コミットしたがページにまだ追加していない書き込みを、期限付きで保持するRedisキーを生成する関数"""
+    return MESSAGES_PENDING_WRITES_KEY.format(chat_session_id=chat_session_id)
+
+
+def get_response_cache_key(digest: str):
+    """プロンプトなどのハッシュからLLMの回答キャッシュのRedisキーを生成する関数"""
+    return RESPONSE_CACHE_KEY.format(digest=digest)
+
+
+def get_single_flight_lock_key(digest: str):
+    """同一リクエストの上流ストリームを実行するワーカーを決めるロックのRedisキーを生成する関数"""
+    return SINGLE_FLIGHT_LOCK_KEY.format(digest=digest)
+
+
+def get_single_flight_stream_key(flight_id: str):
+    """上流ストリームの実行ごとに、トークンを共有するRedisキーを生成する関数"""
+    return SINGLE_FLIGHT_STREAM_KEY.format(flight_id=flight_id)
+
+
+def get_admission_user_leases_key(user_id: UserID):
+    """特定のユーザーが実行中のLLMストリームを管理するRedisキーを生成する関数"""
+    return ADMISSION_USER_LEASES_KEY.format(user_id=user_id)
+
+
+def get_write_behind_journal_key(instance_id: str):
+    """プロセスごとの未保存のメッセージを記録するRedisキーを生成する関数"""
+    return WRITE_BEHIND_JOURNAL_KEY.format(instance_id=instance_id)
+
+
+def get_active_turn_key(chat_session_id: ChatSessionID):
+    """特定のスレッドで直近に生成した回答のターンIDを保持するRedisキーを生成する関数"""
+    return ACTIVE_TURN_KEY.format(chat_session_id=chat_session_id)
+
+
+def get_turn_stream_key(turn_id: str):
+    """生成中の回答のチャンクを順番に記録するRedisキーを生成する関数"""
+    return TURN_STREAM_KEY.format(turn_id=turn_id)
+
+
+def get_turn_subscriber_key(turn_id: str):
+    """他のプロセスで回答を受信中のクライアントがいることを示すRedisキーを生成する関数"""
+    return TURN_SUBSCRIBER_KEY.format(turn_id=turn_id)
+
+
+def get_cache_tag_key(tag: str):
+    """タグに紐づくキャッシュのキーを有効期限と共に保持するRedisキーを生成する関数"""
+    return CACHE_TAG_KEY.format(tag=tag)
+
+
+def get_cache_lease_key(key: str):
+    """キャッシュを作り直すワーカーを1つに絞るためのリースのRedisキーを生成する関数"""
+    return CACHE_LEASE_KEY.format(key=key)
+
+
+def get_user_cache_tag(user_id: UserID):
+    """特定のユーザーに紐づくキャッシュをまとめて削除するためのタグを生成する関数"""
+    return USER_CACHE_TAG.format(user_id=user_id)
+
+
+def get_session_cache_tag(chat_session_id: ChatSessionID):
+    """特定のスレッドに紐づくキャッシュをまとめて削除するためのタグを生成する関数"""
+    return SESSION_CACHE_TAG.format(chat_session_id=chat_session_id)
@@ -1,57 +1,166 @@
-from datetime import datetime, date
-from typing import List, Literal
-import json
+from typing import Iterable, List, Literal, Optional, Tuple
 import logging
+import re
 from typing import Any
 
-from infrastructure.cache.redis.redis_client import RedisClient
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.client import NEVER_DECODE
+
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.redis_codec import CacheCodec, default_codec
+from infrastructure.cache.redis.redis_keys import (
+    CACHE_INVALIDATION_CHANNEL,
+    get_cache_tag_key,
+)
 
 logger = logging.getLogger(__name__)
 
+# パターンに一致するキーを探す場合に、1回のSCAN・UNLINKで扱うキーの数
+SCAN_BATCH_SIZE = 500
+
+_GLOB_CHARACTERS = re.compile(r"[*?\[]")
+
+# タグのインデックス（ソート済みセット）に、キーを有効期限の時刻をスコアにして登録する
+# 登録のたびに期限切れのキーを取り除くので、インデックスは生きているエントリの数より大きくならない
+# （TTLを延ばしたエントリは登録し直す。インデックス自体はどのエントリよりも先に期限切れにしない）
+TAG_ENTRY = """
+local function tag_entry(tag_key, key, ttl_ms)
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    redis.call('ZREMRANGEBYSCORE', tag_key, '-inf', now)
+    local expires_at = now + ttl_ms
+    if expires_at > tonumber(redis.call('ZSCORE', tag_key, key) or 0) then
+        redis.call('ZADD', tag_key, expires_at, key)
+    end
+    if redis.call('PTTL', tag_key) < ttl_ms then redis.call('PEXPIRE', tag_key, ttl_ms) end
+end
+"""
+
+# 値を保存し、タグごとのインデックスにキーを登録する
+SET_WITH_TAGS_SCRIPT = TAG_ENTRY + """
+local ttl = tonumber(ARGV[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+for i = 2, #KEYS do tag_entry(KEYS[i], KEYS[1], ttl * 1000) end
+return 1
+"""
+
+# タグに登録されたキーとタグのインデックスを削除する（キースペース全体ではなくタグのキーの数に比例する）
+# 登録されたキーはKEYSで渡していないので、Redis Clusterではなく単一のRedisを前提とする
+# 削除した数と登録されていたキーを返し、ARGV[1] のチャンネルがあればL1キャッシュの無効化を送る
+INVALIDATE_TAGS_SCRIPT = """
+local removed = 0
+local all_members = {}
+for _, tag_key in ipairs(KEYS) do
+    local members = redis.call('ZRANGE', tag_key, 0, -1)
+    for i = 1, #members, 1000 do
+        removed = removed + redis.call(
+            'UNLINK', unpack(members, i, math.min(i + 999, #members))
+        )
+    end
+    for _, member in ipairs(members) do table.insert(all_members, member) end
+    redis.call('UNLINK', tag_key)
+end
+if ARGV[1] ~= '' and #all_members > 0 then
+    redis.call('PUBLISH', ARGV[1], table.concat(all_members, '\\n'))
+end
+return {removed, all_members}
+"""
+
 
 class RedisRepository:
-    """Redisを用いたキャッシュ操作を提供するクラス"""
+    """
+    Redisを用いたキャッシュ操作を提供するクラス（redis.asyncio のクライアントを使う）
 
-    def __init__(self, redis_client: RedisClient):
+    キャッシュを書き換えたら、このプロセスのL1キャッシュから削除し、Pub/Subで他のワーカーにも知らせる。
+    """
+
+    def __init__(self, redis_client: redis.Redis, codec: CacheCodec = default_codec):
         self.client = redis_client
+        self.codec = codec
 
-    @staticmethod
-    def json_serializer(obj):
-        """JSONシリアライズ可能な形式に変換"""
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()  # ISO 8601形式の文字列に変換
-        raise TypeError(f"Type {type(obj)} not serializable")
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        expiration: int | float,
+        tags: Iterable[str] = (),
+        invalidate: bool = True,
+    ):
+        """
+        データをRedisにセットする
 
-    def set(self, key: str, value: Any, expiration: int | float):
-        """データをRedisにセットする"""
+        tags を指定した場合は、invalidate_tags でまとめて削除できるようにタグにキーを登録する。
+        DBから読んだ値をキャッシュに載せるだけの場合は invalidate を False にする
+        （値は変わっていないので、各ワーカーのL1キャッシュは無効化しない）。
+        """
         if isinstance(expiration, float):
             expiration = int(expiration)
+        tag_keys = [get_cache_tag_key(tag) for tag in tags]
         try:
-            data = json.dumps(value, default=self.json_serializer)
-            self.client.set(key, data, ex=expiration)
+            data = self.codec.encode(value)
+            pipeline = self.client.pipeline(transaction=False)
+            if tag_keys:
+                pipeline.eval(
+                    SET_WITH_TAGS_SCRIPT,
+                    1 + len(tag_keys),
+                    key,
+                    *tag_keys,
+                    data,
+                    expiration,
+                )
+            else:
+                pipeline.set(key, data, ex=expiration)
+            await self.execute_with_invalidation(pipeline, [key] if invalidate else [])
         except Exception as e:
             logger.info(f"Failed to set key to Redis: {str(e)}")
             raise Exception(f"Failed to set key to Redis: {str(e)}")
 
-    def get(self, key: str) -> Any:
+    async def get(self, key: str) -> Any:
         """Redisからデータを取得する"""
         try:
-            data = self.client.get(key)
+            # 圧縮した値はUTF-8の文字列ではないので、デコードせずにバイト列で受け取る
+            data = await self.client.execute_command("GET", key, **{NEVER_DECODE: True})
             if data is None:
                 raise KeyError(f"{key} not found in Redis")
-            return json.loads(data)
+            return self.codec.decode(data)
         except Exception as e:
             logger.info(f"Failed to get key from Redis: {str(e)}")
             raise Exception(f"Failed to get key from Redis: {str(e)}")
 
-    def delete(self, patterns: List[str]):
-        """指定したパターンに一致するキーを削除する"""
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Redisからデータと残りのTTL（秒）を取得する（キーがない場合は None を返す）"""
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.execute_command("GET", key, **{NEVER_DECODE: True})
+        pipeline.pttl(key)
+        data, ttl = await pipeline.execute()
+        if data is None:
+            return None
+        return self.codec.decode(data), ttl / 1000
+
+    async def delete(self, patterns: List[str]):
+        """
+        指定したキーを削除する
+
+        ワイルドカードを含まないキーは1回のUNLINKでまとめて削除し、
+        ワイルドカードを含むパターンだけ一致するキーをSCANで探して削除する。
+        """
+        keys = [pattern for pattern in patterns if not _GLOB_CHARACTERS.search(pattern)]
         errors = []
+        if keys:
+            try:
+                await self._unlink(keys)
+            except Exception as e:
+                logger.warning(f"Failed to delete keys {keys} from Redis: {str(e)}")
+                errors.extend(
+                    f"Failed to delete key of {key} from Redis: {str(e)}"
+                    for key in keys
+                )
         for pattern in patterns:
+            if pattern in keys:
+                continue
             try:
-                keys = self.client.scan_iter(match=pattern)
-                for key in keys:
-                    self.client.delete(key)
+                await self._delete_matching(pattern)
             except Exception as e:
                 logger.warning(
                     f"Failed to delete key of {pattern} from Redis: {str(e)}"
@@ -59,3 +168,60 @@ class RedisRepository:
                 errors.append(f"Failed to delete key of {pattern} from Redis: {str(e)}")
         if errors and len(errors) == len(patterns):
             raise Exception(", ".join(errors))
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        """
+        タグに登録されたキャッシュをまとめて削除する
+
+        Returns:
+            int: 削除したキーの数
+        """
+        tag_keys = [get_cache_tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return 0
+        channel = CACHE_INVALIDATION_CHANNEL if local_cache.enabled else ""
+        try:
+            removed, keys = await self.client.eval(
+                INVALIDATE_TAGS_SCRIPT, len(tag_keys), *tag_keys, channel
+            )
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cache tags {tags}: {str(e)}")
+            raise Exception(f"Failed to invalidate cache tags: {str(e)}")
+        local_cache.invalidate(keys)
+        return int(removed)
+
+    async def execute_with_invalidation(
+        self, pipeline: Pipeline, keys: List[str]
+    ) -> list:
+        """
+        キャッシュを書き換えるパイプラインを実行し、キーをL1キャッシュから削除する
+
+        無効化のPUBLISHは書き込みと同じパイプラインの最後に送る。このプロセスのL1キャッシュからは
+        書き込みの完了後に削除する（書き込み前の値を読んでいた読み込みの結果を保存させない）。
+
+        Returns:
+            list: PUBLISHを除いた各コマンドの結果
+        """
+        publish = local_cache.enabled and bool(keys)
+        if publish:
+            pipeline.publish(CACHE_INVALIDATION_CHANNEL, "\n".join(keys))
+        try:
+            results = await pipeline.execute()
+        finally:
+            local_cache.invalidate(keys)
+        return results[:-1] if publish else results
+
+    async def _delete_matching(self, pattern: str) -> None:
+        batch: List[str] = []
+        async for key in self.client.scan_iter(match=pattern, count=SCAN_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= SCAN_BATCH_SIZE:
+                await self._unlink(batch)
+                batch = []
+        if batch:
+            await self._unlink(batch)
+
+    async def _unlink(self, keys: List[str]) -> None:
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.unlink(*keys)
+        await self.execute_with_invalidation(pipeline, keys)
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import AsyncGenerator, AsyncIterator, Callable
+
+from infrastructure.cache.redis.cache_stampede_guard import RELEASE_LEASE_SCRIPT
+from infrastructure.cache.redis.redis_keys import (
+    get_single_flight_lock_key,
+    get_single_flight_stream_key,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightAbandoned(Exception):
+    """先行するワーカーが回答の途中でいなくなった場合の例外（リクエストをやり直せば新しい回答を受け取れる）"""
+
+
+class _LeaderGone(Exception):
+    """トークンを受け取る前に先行するワーカーがいなくなった場合の例外"""
+
+
+class RedisSingleFlight:
+    """
+    Redisを使い、ワーカー間で同じリクエストの上流ストリームを共有するクラス
+
+    ロックを取得したワーカーが上流のストリームを実行してトークンをRedis Streamに追加し、
+    他のワーカーはそのStreamを読んでトークンを受け取る。Streamのキーは実行ごとに作り、
+    ロックの値から引く（前の実行のStreamを読まないようにする）。
+
+    先行するワーカーのクライアントが切断して上流がキャンセルされた場合は、エラーではなく
+    abandoned をStreamに追加する。先行するワーカーがいなくなった時点でトークンを受け取って
+    いなければ、最初からやり直して自分が先行するワーカーになる。受け取っていた場合は、
+    別の回答の続きをつなげないように SingleFlightAbandoned で失敗させる。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        lock_ttl_ms: int = config.SINGLE_FLIGHT_LOCK_TTL_MS,
+        stream_ttl: int = config.SINGLE_FLIGHT_STREAM_TTL,
+        read_timeout: float = config.SINGLE_FLIGHT_READ_TIMEOUT,
+    ):
+        self._redis = redis
+        self._lock_ttl_ms = lock_ttl_ms
+        self._stream_ttl = stream_ttl
+        self._read_timeout = read_timeout
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def stream(
+        self, digest: str, factory: Callable[[], AsyncIterator[str]]
+    ) -> AsyncGenerator[str, None]:
+        client = self._redis.client
+        lock_key = get_single_flight_lock_key(digest)
+
+        while True:
+            # 実行ごとのIDをロックの値にし、Streamのキーにも使う
+            flight_id = f"{self._owner}:{uuid.uuid4().hex}"
+            if await client.set(lock_key, flight_id, nx=True, px=self._lock_ttl_ms):
+                async for token in self._lead(lock_key, flight_id, factory):
+                    yield token
+                return
+
+            leader_id = await client.get(lock_key)
+            if leader_id is None:
+                # 先行するワーカーが終わった直後なので、ロックの取得からやり直す
+                continue
+            metrics.increment("single_flight_redis_followers")
+            try:
+                async for token in self._follow(lock_key, leader_id):
+                    yield token
+                return
+            except _LeaderGone:
+                metrics.increment("single_flight_redis_takeovers")
+
+    async def _lead(
+        self,
+        lock_key: str,
+        flight_id: str,
+        factory: Callable[[], AsyncIterator[str]],
+    ) -> AsyncGenerator[str, None]:
+        client = self._redis.client
+        stream_key = get_single_flight_stream_key(flight_id)
+        try:
+            async for token in factory():
+                pipeline = client.pipeline(transaction=False)
+                pipeline.xadd(stream_key, {"token": token})
+                pipeline.expire(stream_key, self._stream_ttl)
+                pipeline.pexpire(lock_key, self._lock_ttl_ms)
+                await pipeline.execute()
+                yield token
+            await client.xadd(stream_key, {"done": "1"})
+        except (asyncio.CancelledError, GeneratorExit):
+            # 上流のエラーではないので、他のワーカーには引き継がせる
+            await client.xadd(stream_key, {"abandoned": "1"})
+            raise
+        except Exception as e:
+            await client.xadd(stream_key, {"error": str(e) or type(e).__name__})
+            raise
+        finally:
+            await client.expire(stream_key, self._stream_ttl)
+            await client.eval(RELEASE_LEASE_SCRIPT, 1, lock_key, flight_id)
+
+    async def _follow(self, lock_key: str, flight_id: str) -> AsyncGenerator[str, None]:
+        client = self._redis.client
+        stream_key = get_single_flight_stream_key(flight_id)
+        last_id = "0-0"
+        received = False
+        deadline = time.monotonic() + self._read_timeout
+        leader_alive = True
+        while True:
+            # 先行するワーカーがいなくなった後も、それまでに追加されたエントリは読み切る
+            response = await client.xread(
+                {stream_key: last_id}, None, 1000 if leader_alive else None
+            )
+            if not response:
+                if not leader_alive:
+                    break
+                leader_alive = await client.get(lock_key) == flight_id
+                if leader_alive and time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"No tokens from the leading worker in {self._read_timeout}s"
+                    )
+                continue
+
+            deadline = time.monotonic() + self._read_timeout
+            for entry_id, fields in response[0][1]:
+                last_id = entry_id
+                if "token" in fields:
+                    received = True
+                    yield fields["token"]
+                elif "done" in fields:
+                    return
+                elif "error" in fields:
+                    raise RuntimeError(fields["error"])
+                elif "abandoned" in fields:
+                    leader_alive = False
+                    break
+            else:
+                continue
+            break
+
+        if not received:
+            raise _LeaderGone()
+        raise SingleFlightAbandoned(
+            "The shared response was abandoned before it finished. "
+            "Retry the request."
+        )
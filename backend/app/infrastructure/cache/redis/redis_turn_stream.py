@@ -0,0 +1,83 @@
+from typing import Dict, List, Optional, Tuple
+
+from infrastructure.cache.redis.redis_keys import (
+    get_active_turn_key,
+    get_turn_stream_key,
+    get_turn_subscriber_key,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+
+
+class RedisTurnStream:
+    """
+    生成中の回答のチャンクをターンごとのRedis Streamに連番付きで記録するクラス
+
+    エントリーのIDを "{seq}-0" にしているので、再接続したクライアントが
+    受信済みの seq を渡せば、その続きから読み直せる。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        ttl: int = config.RESUMABLE_STREAM_TTL,
+        block_ms: int = config.RESUMABLE_STREAM_READ_BLOCK_MS,
+    ):
+        self._redis = redis
+        self._ttl = ttl
+        self._block_ms = block_ms
+
+    async def start(self, session_id: int, turn_id: str) -> None:
+        """セッションの現在のターンとして登録する"""
+        key = get_turn_stream_key(turn_id)
+        pipeline = self._redis.client.pipeline(transaction=False)
+        # 最初のチャンクより前に再接続された場合もターンが存在すると分かるようにする
+        pipeline.xadd(key, {"start": "1"}, id="0-1")
+        pipeline.expire(key, self._ttl)
+        pipeline.set(get_active_turn_key(session_id), turn_id, ex=self._ttl)
+        await pipeline.execute()
+
+    async def get_active_turn(self, session_id: int) -> Optional[str]:
+        return await self._redis.client.get(get_active_turn_key(session_id))
+
+    async def append(self, turn_id: str, seq: int, content: str) -> None:
+        key = get_turn_stream_key(turn_id)
+        pipeline = self._redis.client.pipeline(transaction=False)
+        pipeline.xadd(key, {"content": content}, id=f"{seq}-0")
+        pipeline.expire(key, self._ttl)
+        await pipeline.execute()
+
+    async def finish(self, turn_id: str, seq: int, error: Optional[str] = None) -> None:
+        """最後のチャンクの後に終了（またはエラー）を記録する"""
+        key = get_turn_stream_key(turn_id)
+        fields = {"done": "1"} if error is None else {"error": error}
+        pipeline = self._redis.client.pipeline(transaction=False)
+        pipeline.xadd(key, fields, id=f"{seq + 1}-0")
+        pipeline.expire(key, self._ttl)
+        await pipeline.execute()
+
+    async def read(
+        self, turn_id: str, after_seq: int
+    ) -> List[Tuple[int, Dict[str, str]]]:
+        """after_seq より後のエントリーを読む（なければ block_ms の間待つ）"""
+        response = await self._redis.client.xread(
+            {get_turn_stream_key(turn_id): f"{after_seq}-0"}, None, self._block_ms
+        )
+        if not response:
+            return []
+        return [
+            (int(entry_id.split("-", 1)[0]), fields)
+            for entry_id, fields in response[0][1]
+        ]
+
+    async def exists(self, turn_id: str) -> bool:
+        return bool(await self._redis.client.exists(get_turn_stream_key(turn_id)))
+
+    async def touch_subscriber(self, turn_id: str, ttl: float) -> None:
+        """このプロセス以外で受信中のクライアントがいることを生成側に知らせる"""
+        await self._redis.client.set(
+            get_turn_subscriber_key(turn_id), "1", px=max(int(ttl * 1000), 1)
+        )
+
+    async def has_subscriber(self, turn_id: str) -> bool:
+        return bool(await self._redis.client.exists(get_turn_subscriber_key(turn_id)))
@@ -0,0 +1,99 @@
+import logging
+import time
+from typing import Optional
+
+from infrastructure.cache.redis.redis_keys import (
+    RESPONSE_CACHE_INDEX_KEY,
+    RESPONSE_CACHE_SIZES_KEY,
+    RESPONSE_CACHE_TOTAL_SIZE_KEY,
+    get_response_cache_key,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+import utilities.metrics as metrics
+
+logger = logging.getLogger(__name__)
+
+# エントリを保存し、合計サイズが上限を超えた分を古い順に削除する
+SET_AND_EVICT_SCRIPT = """
+local previous = redis.call('HGET', KEYS[3], KEYS[1])
+if previous then redis.call('DECRBY', KEYS[4], previous) end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[4], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], ARGV[3])
+local total = redis.call('INCRBY', KEYS[4], ARGV[3])
+local evicted = 0
+while total > tonumber(ARGV[5]) do
+    local oldest = redis.call('ZPOPMIN', KEYS[2])
+    if #oldest == 0 then break end
+    local size = redis.call('HGET', KEYS[3], oldest[1])
+    redis.call('HDEL', KEYS[3], oldest[1])
+    redis.call('UNLINK', oldest[1])
+    if size then total = redis.call('DECRBY', KEYS[4], size) end
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+
+class ResponseCache:
+    """
+    コンテキストのない最初のターンに対するLLMの回答をRedisにキャッシュするクラス
+
+    正規化したプロンプト・モデル・temperature・システムプロンプトのバージョンのハッシュをキーにする。
+    RESPONSE_CACHE_ENABLED を有効にした場合のみ動作する。
+    """
+
+    def __init__(
+        self,
+        redis: RedisRepository,
+        enabled: bool = config.RESPONSE_CACHE_ENABLED,
+        ttl: int = config.RESPONSE_CACHE_TTL,
+        max_entry_size: int = config.RESPONSE_CACHE_MAX_ENTRY_SIZE,
+        max_total_size: int = config.RESPONSE_CACHE_MAX_TOTAL_SIZE,
+    ):
+        self._redis = redis
+        self.enabled = enabled
+        self._ttl = ttl
+        self._max_entry_size = max_entry_size
+        self._max_total_size = max_total_size
+
+    async def get(self, digest: str) -> Optional[str]:
+        """キャッシュされた回答を取得する"""
+        key = get_response_cache_key(digest)
+        try:
+            response = await self._redis.client.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to get response cache {key}: {str(e)}")
+            return None
+        metrics.increment(
+            "response_cache_hits" if response is not None else "response_cache_misses"
+        )
+        return response
+
+    async def set(self, digest: str, response: str) -> None:
+        """回答をキャッシュに保存する（大きすぎる回答は保存しない）"""
+        key = get_response_cache_key(digest)
+        size = len(response.encode("utf-8"))
+        if size > self._max_entry_size:
+            metrics.increment("response_cache_skipped")
+            return
+        try:
+            evicted = await self._redis.client.eval(
+                SET_AND_EVICT_SCRIPT,
+                4,
+                key,
+                RESPONSE_CACHE_INDEX_KEY,
+                RESPONSE_CACHE_SIZES_KEY,
+                RESPONSE_CACHE_TOTAL_SIZE_KEY,
+                response,
+                self._ttl,
+                size,
+                time.time(),
+                self._max_total_size,
+            )
+            metrics.increment("response_cache_stores")
+            if evicted:
+                metrics.increment("response_cache_evictions", evicted)
+        except Exception as e:
+            logger.warning(f"Failed to set response cache {key}: {str(e)}")
@@ -1,18 +1,71 @@
-from sqlalchemy import create_engine
+from typing import Any, Dict
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from infrastructure.database.query_profiler import ProfiledQueuePool, query_profiler
 import utilities.config as config
 
-engine = create_engine(config.POSTGRES_URL, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 同期ドライバーのURLが設定されていても非同期ドライバーで接続する
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def to_async_url(url: str) -> str:
+    """DBのURLのドライバーを非同期ドライバー（asyncpg / aiosqlite）に置き換える"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.get_driver_name() == driver:
+        return url
+    parsed = parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}")
+    if driver == "asyncpg" and "sslmode" in parsed.query:
+        # asyncpg は libpq の sslmode ではなく ssl で同じ値を受け取る
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+    return parsed.render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    DBに合わせたエンジンの設定を返す
+
+    SQLiteはプールの大きさなどを受け付けないので、PostgreSQLの場合だけプールと
+    ステートメントのタイムアウトを設定する。
+    """
+    options: Dict[str, Any] = {"echo": config.DB_ECHO}
+    if make_url(url).get_backend_name() != "postgresql":
+        return options
+    options.update(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        connect_args={
+            "server_settings": {
+                "statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS)
+            }
+        },
+    )
+    if config.DB_PROFILER_ENABLED:
+        options["poolclass"] = ProfiledQueuePool
+    return options
+
+
+engine = create_async_engine(
+    to_async_url(config.POSTGRES_URL), **engine_options(config.POSTGRES_URL)
+)
+if config.DB_PROFILER_ENABLED:
+    query_profiler.install(engine)
+# コミット後に属性を読み直すとイベントループ外でI/Oが発生するため、期限切れにしない
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Baseクラスを定義
 Base = declarative_base()
 
 
-def get_db_connection():
-    db = SessionLocal()
-    try:
+async def get_db_connection():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP, Text
+from sqlalchemy import Column, Integer, ForeignKey, Index, TIMESTAMP, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from infrastructure.database.connection import Base
@@ -6,12 +6,19 @@ from infrastructure.database.connection import Base
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # ユーザーの有効なセッションを読むクエリ用（マイグレーション cc29e507c175）
+        Index("ix_chat_sessions_user_id_end_time", "user_id", "end_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     start_time = Column(TIMESTAMP)
     end_time = Column(TIMESTAMP)
     summary = Column(Text)
+    # コンテキストウィンドウから外れたターンの要約と、要約済みの最後のメッセージID
+    context_summary = Column(Text)
+    summarized_until_message_id = Column(Integer)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
@@ -1,16 +1,40 @@
-from sqlalchemy import Column, Integer, ForeignKey, Text, TIMESTAMP, Boolean
-from sqlalchemy.sql import func
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    TIMESTAMP,
+)
+from sqlalchemy.sql import false, func
 from sqlalchemy.orm import relationship
 from infrastructure.database.connection import Base
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # スレッドのメッセージをIDの順に読むクエリ用（マイグレーション cc29e507c175）
+        Index(
+            "ix_messages_session_id_id",
+            "session_id",
+            "id",
+            postgresql_include=["token_count"],
+        ),
+        # 同じメッセージを2回保存しないためのID（マイグレーション 7f3b9d2e4c61）
+        Index("ix_messages_client_id", "client_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
     content = Column(Text, nullable=False)
     is_user = Column(Boolean, nullable=False)
+    token_count = Column(Integer, nullable=False, server_default="0")
+    interrupted = Column(Boolean, nullable=False, server_default=false())
+    # 書き込みキューのターンのIDとターン内の位置（保存をやり直しても重複させない）
+    client_id = Column(String(64))
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
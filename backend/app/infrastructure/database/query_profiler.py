@@ -0,0 +1,178 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+import utilities.config as config
+import utilities.metrics as metrics
+from utilities.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# ステートメントの種類が上限を超えた場合にまとめて集計するキー
+OTHER_STATEMENTS = "(other)"
+
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAIN_PREFIXES = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+
+
+class ProfiledQueuePool(AsyncAdaptedQueuePool):
+    """コネクションの取得を待った時間を記録するプール"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.observe(
+                "db_pool_checkout_wait_seconds", time.perf_counter() - started
+            )
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> Any:
+    """
+    バインドパラメーターの値を型とサイズに置き換える
+
+    スロークエリの記録に個人情報などの値を残さずに、どの形のパラメーターで遅くなったかを分かるようにする。
+    """
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameter_shape(parameters[0]) if parameters else None
+        return {"rows": len(parameters), "row": first}
+    if isinstance(parameters, dict):
+        return {key: _value_shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_value_shape(value) for value in parameters]
+    return _value_shape(parameters)
+
+
+def _value_shape(value: Any) -> str:
+    name = type(value).__name__
+    if isinstance(value, (str, bytes, list, tuple, dict)):
+        return f"{name}({len(value)})"
+    return name
+
+
+class QueryProfiler:
+    """
+    SQLAlchemyのエンジンのイベントでSQLの実行時間を計測するクラス
+
+    ステートメントごとのレイテンシのヒストグラムと、slow_query_ms を超えたクエリの
+    直近の記録（パラメーターの形と、有効な場合は実行計画）を保持する。
+    """
+
+    def __init__(
+        self,
+        slow_query_ms: float = config.DB_SLOW_QUERY_MS,
+        slow_query_log_size: int = config.DB_SLOW_QUERY_LOG_SIZE,
+        max_statements: int = config.DB_PROFILER_MAX_STATEMENTS,
+        explain: bool = config.DB_SLOW_QUERY_EXPLAIN,
+    ):
+        self._slow_query_seconds = slow_query_ms / 1000
+        self._max_statements = max_statements
+        self._explain = explain
+        self._lock = threading.Lock()
+        self._statements: Dict[str, Histogram] = {}
+        self._slow_queries: Deque[Dict[str, Any]] = deque(maxlen=slow_query_log_size)
+
+    def install(self, engine: AsyncEngine) -> None:
+        """エンジンのイベントに計測用のリスナーを登録する"""
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        if isinstance(sync_engine.pool, QueuePool):
+            record_pool_usage = partial(self._record_pool_usage, sync_engine)
+            event.listen(sync_engine, "checkout", record_pool_usage)
+            event.listen(sync_engine, "checkin", record_pool_usage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """合計時間の長い順のステートメントごとの集計と、直近のスロークエリを返す"""
+        with self._lock:
+            statements = sorted(
+                self._statements.items(), key=lambda item: item[1].sum, reverse=True
+            )
+            return {
+                "statements": [
+                    {"statement": statement, **histogram.to_dict()}
+                    for statement, histogram in statements
+                ],
+                "slow_queries": list(self._slow_queries),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._slow_queries.clear()
+
+    def _before_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        conn.info["query_started"] = time.perf_counter()
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ) -> None:
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        key = _WHITESPACE.sub(" ", statement).strip()
+        metrics.observe("db_query_seconds", elapsed)
+        with self._lock:
+            histogram = self._statements.get(key)
+            if histogram is None:
+                if len(self._statements) >= self._max_statements:
+                    key = OTHER_STATEMENTS
+                histogram = self._statements.setdefault(key, Histogram())
+            histogram.observe(elapsed)
+
+        if elapsed < self._slow_query_seconds:
+            return
+        metrics.increment("db_slow_queries")
+        logger.warning(f"Slow query ({elapsed * 1000:.1f}ms): {key}")
+        record = {
+            "statement": key,
+            "duration_ms": round(elapsed * 1000, 3),
+            "parameters": parameter_shape(parameters, executemany),
+            "recorded_at": time.time(),
+        }
+        if self._explain and not executemany:
+            record["plan"] = self._explain_plan(conn, statement, parameters)
+        with self._lock:
+            self._slow_queries.append(record)
+
+    def _explain_plan(self, conn, statement: str, parameters) -> Optional[List[str]]:
+        """スロークエリと同じパラメーターで実行計画を取得する（SELECTのみ、ANALYZEはしない）"""
+        prefix = _EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(
+            ("SELECT", "WITH")
+        ):
+            return None
+        # イベントを再び発生させないように、DBAPIのカーソルで直接実行する
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [
+                " ".join(str(column) for column in row) for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            logger.warning(f"Failed to explain slow query: {str(e)}")
+            return None
+        finally:
+            cursor.close()
+
+    def _record_pool_usage(self, sync_engine, *args) -> None:
+        # dispose() でプールが作り直されても、現在のプールの値を記録する
+        pool = sync_engine.pool
+        metrics.set_gauge("db_pool_checked_out", pool.checkedout())
+        metrics.set_gauge("db_pool_overflow", max(pool.overflow(), 0))
+
+
+# プロセス内で共有するインスタンス
+query_profiler = QueryProfiler()
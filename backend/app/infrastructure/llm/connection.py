@@ -0,0 +1,12 @@
+from fastapi.requests import HTTPConnection
+
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
+
+
+def get_llm_client_registry(connection: HTTPConnection) -> LLMClientRegistry:
+    return connection.app.state.llm_client_registry
+
+
+def get_prompt_chain_cache(connection: HTTPConnection) -> PromptChainCache:
+    return connection.app.state.prompt_chain_cache
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+LLMClientKey = Tuple[str, float, bool, Optional[int]]
+
+T = TypeVar("T")
+
+# cancellable_stream のタスク内で開かれたHTTPレスポンス
+_open_responses: ContextVar[Optional[List[httpx.Response]]] = ContextVar(
+    "open_responses", default=None
+)
+_DONE = object()
+
+
+class _StreamError:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def _track_response(response: httpx.Response) -> None:
+    responses = _open_responses.get()
+    if responses is not None:
+        responses.append(response)
+
+
+class LLMClientRegistry:
+    """モデルとパラメータ毎にChatOpenAIクライアントを保持し、HTTPコネクションプールを共有するクラス"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = config.LLM_KEEPALIVE_EXPIRY,
+        timeout: float = config.LLM_REQUEST_TIMEOUT,
+    ):
+        self._api_key = api_key or config.OPENAI_API_KEY
+        self._base_url = base_url or config.OPENAI_BASE_URL
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        http_timeout = httpx.Timeout(timeout, connect=10.0)
+        # HTTP/2はh2がインストールされている場合のみ有効にする
+        self._async_http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=limits,
+            timeout=http_timeout,
+            event_hooks={"response": [_track_response]},
+        )
+        self._sync_http_client = httpx.Client(limits=limits, timeout=http_timeout)
+        self._async_openai: Optional[openai.AsyncOpenAI] = None
+        self._sync_openai: Optional[openai.OpenAI] = None
+        self._clients: Dict[LLMClientKey, ChatOpenAI] = {}
+
+    def _ensure_openai_clients(self) -> None:
+        """OpenAIクライアントを遅延生成する（APIキー未設定でも起動できるように）"""
+        if self._async_openai is None:
+            self._async_openai = openai.AsyncOpenAI(
+                api_key=self._api_key,
+                base_url=self._base_url,
+                http_client=self._async_http_client,
+            )
+        if self._sync_openai is None:
+            self._sync_openai = openai.OpenAI(
+                api_key=self._api_key,
+                base_url=self._base_url,
+                http_client=self._sync_http_client,
+            )
+
+    def get(
+        self,
+        model: str = config.LLM_MODEL,
+        temperature: float = config.LLM_TEMPERATURE,
+        streaming: bool = True,
+        max_tokens: Optional[int] = None,
+    ) -> ChatOpenAI:
+        """モデルとパラメータに対応するChatOpenAIを取得（なければ生成）する"""
+        key: LLMClientKey = (model, temperature, streaming, max_tokens)
+        llm = self._clients.get(key)
+        if llm is None:
+            self._ensure_openai_clients()
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                streaming=streaming,
+                max_tokens=max_tokens,
+                openai_api_key=self._api_key,
+                openai_api_base=self._base_url,
+                client=self._sync_openai.chat.completions,
+                async_client=self._async_openai.chat.completions,
+            )
+            self._clients[key] = llm
+            logger.info(f"Registered LLM client for {key}")
+        return llm
+
+    @staticmethod
+    async def cancellable_stream(stream: AsyncIterator[T]) -> AsyncGenerator[T, None]:
+        """
+        LLMのストリームを別タスクで読み進め、閉じられた時点でタスクをキャンセルして上流のレスポンスも閉じる
+
+        LangChainやOpenAI SDKの内側のジェネレーターは途中で例外が起きても明示的には閉じられず、
+        GCされるまでHTTPレスポンスが開いたまま生成が続くことがあるため、ここで確実に閉じる。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        responses: List[httpx.Response] = []
+
+        async def pump() -> None:
+            _open_responses.set(responses)
+            try:
+                async for item in stream:
+                    queue.put_nowait(item)
+            except Exception as e:
+                queue.put_nowait(_StreamError(e))
+            else:
+                queue.put_nowait(_DONE)
+
+        task = asyncio.create_task(pump())
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                yield item
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            for response in responses:
+                if not response.is_closed:
+                    await response.aclose()
+
+    async def aclose(self) -> None:
+        """コネクションプールを閉じる"""
+        self._clients.clear()
+        await self._async_http_client.aclose()
+        self._sync_http_client.close()
+        logger.info("LLM client registry closed")
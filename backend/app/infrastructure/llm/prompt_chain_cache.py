@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable
+from langchain.prompts.chat import (
+    SystemMessagePromptTemplate,
+    HumanMessagePromptTemplate,
+)
+
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT_PATH = (
+    Path(__file__).resolve().parents[2] / "assets" / "system_prompt.txt"
+)
+
+
+class CompiledPrompt(NamedTuple):
+    """あるバージョンのシステムプロンプトとコンパイル済みテンプレート"""
+
+    version: str
+    mtime_ns: int
+    template: ChatPromptTemplate
+    # id(llm) -> (llm, chain)。llmへの参照を保持してidの再利用を防ぐ
+    chains: Dict[int, Tuple[BaseChatModel, Runnable]]
+
+
+class PromptChainCache:
+    """
+    system_prompt.txt を内容のバージョン毎に一度だけコンパイルし、チェーンをキャッシュするクラス
+
+    ファイルのmtimeをバックグラウンドで監視し、変更があれば新しいバージョンに差し替える。
+    リクエスト処理中にファイルI/Oやテンプレートのパースは発生しない。
+    """
+
+    def __init__(
+        self,
+        prompt_path: Path = DEFAULT_SYSTEM_PROMPT_PATH,
+        reload_interval: float = config.PROMPT_RELOAD_INTERVAL,
+    ):
+        self._path = prompt_path
+        self._reload_interval = reload_interval
+        self._compiled: Optional[CompiledPrompt] = None
+        self._watch_task: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        """現在有効なシステムプロンプトのバージョン"""
+        return self._compiled.version if self._compiled else None
+
+    @staticmethod
+    def _compile(system_prompt: str) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_messages(
+            [
+                SystemMessagePromptTemplate.from_template(system_prompt),
+                MessagesPlaceholder(variable_name="history"),
+                HumanMessagePromptTemplate.from_template("User's question: {prompt}"),
+            ]
+        )
+
+    def _load(self) -> Optional[CompiledPrompt]:
+        """ファイルが更新されていれば読み込んでコンパイルする（ブロッキング処理）"""
+        mtime_ns = self._path.stat().st_mtime_ns
+        current = self._compiled
+        if current is not None and current.mtime_ns == mtime_ns:
+            return None
+
+        system_prompt = self._path.read_text(encoding="utf-8")
+        version = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+        if current is not None and current.version == version:
+            return current._replace(mtime_ns=mtime_ns)
+        return CompiledPrompt(version, mtime_ns, self._compile(system_prompt), {})
+
+    async def reload(self) -> None:
+        """ファイルの変更を確認し、新しいバージョンがあればアトミックに差し替える"""
+        compiled = await asyncio.to_thread(self._load)
+        if compiled is None:
+            return
+        previous = self._compiled
+        self._compiled = compiled
+        if previous is None or previous.version != compiled.version:
+            logger.info(f"Loaded system prompt version {compiled.version}")
+
+    async def start(self) -> None:
+        await self.reload()
+        if self._reload_interval > 0:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"Failed to reload system prompt: {str(e)}")
+
+    def get_chain(self, llm: BaseChatModel) -> Tuple[str, Runnable]:
+        """
+        現在のプロンプトバージョンと、それに対応する `template | llm` のチェーンを返す
+        """
+        compiled = self._compiled
+        if compiled is None:
+            raise RuntimeError("System prompt has not been loaded.")
+        cached = compiled.chains.get(id(llm))
+        if cached is None:
+            cached = (llm, compiled.template | llm)
+            compiled.chains[id(llm)] = cached
+        return compiled.version, cached[1]
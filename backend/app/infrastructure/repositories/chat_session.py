@@ -1,76 +1,150 @@
 from datetime import datetime
 import logging
 from typing import List, Optional
+from sqlalchemy import and_, or_, select, update
 from sqlalchemy.exc import SQLAlchemyError
-from infrastructure.cache.redis.redis_keys import (
-    CACHE_DURATION_WEEK,
-    get_sessions_list_key,
-)
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.cache_stampede_guard import cache_stampede_guard
+from infrastructure.cache.redis.chat_session_index_cache import ChatSessionIndexCache
+from infrastructure.cache.redis.redis_keys import get_sessions_index_key
 from schemas.v1.chat_session import ChatSessionResponse
 from domain.repositories.chat_session import ChatSessionRepository
 from infrastructure.database.models.chat_session import ChatSession
 from domain.value_objects.user import UserID
+import utilities.config as config
 
 logger = logging.getLogger(__name__)
 
 
 class ChatSessionRepositoryImpl(ChatSessionRepository):
 
-    def get_chat_session_by_user_id(
-        self, user_id: UserID, skip: int = 0, limit: int = 100
+    async def get_chat_session_by_user_id(
+        self,
+        user_id: UserID,
+        before: Optional[datetime] = None,
+        limit: int = 100,
+        before_id: Optional[int] = None,
     ) -> Optional[List[ChatSession]]:
         """
-        指定された user_idに基づいてチャットセッションを取得します
+        指定された user_idに基づいて、有効なチャットセッションを (開始時刻, ID) の新しい順に1ページ分取得します。
+
+        before と before_id を指定した場合は、(開始時刻, ID) がそれより前のセッションを返します。
+        before だけを指定した場合は、開始時刻がそれより前のセッションを返します。
         """
-        cache_key = get_sessions_list_key(user_id)
-        try:
-            chat_sessions_data = self._redis.get(cache_key)
-            chat_sessions = [ChatSessionResponse(**item) for item in chat_sessions_data]
-            return chat_sessions
+        cache_key = get_sessions_index_key(user_id)
+        variant = (before, before_id, limit)
+        cached_sessions = local_cache.get(cache_key, variant)
+        if cached_sessions is not None:
+            return cached_sessions
+        token = local_cache.token()
+        cache = ChatSessionIndexCache(self._redis)
 
-        except Exception as e:
-            logger.info(f"Failed to get chat sessions from Redis: {str(e)}")
+        async def read():
+            cached = await cache.read(user_id, before, limit, before_id)
+            if cached is None:
+                return None
+            chat_sessions_data, ttl = cached
+            return [ChatSessionResponse(**item) for item in chat_sessions_data], ttl
 
-        try:
-            chat_sessions = (
-                self._db.query(ChatSession)
-                .filter(
-                    ChatSession.user_id == user_id,
-                    ChatSession.end_time > datetime.utcnow(),
+        chat_sessions = await cache_stampede_guard.load(
+            self._redis,
+            cache_key,
+            "chat_sessions_index",
+            read,
+            lambda: self._load_chat_sessions(cache, user_id, before, before_id, limit),
+        )
+        if chat_sessions is not None:
+            local_cache.set(cache_key, variant, chat_sessions, token)
+        return chat_sessions
+
+    async def _load_chat_sessions(
+        self,
+        cache: ChatSessionIndexCache,
+        user_id: UserID,
+        before: Optional[datetime],
+        before_id: Optional[int],
+        limit: int,
+    ) -> Optional[List[ChatSessionResponse]]:
+        """
+        DBから要求されたページを (開始時刻, ID) のキーセットで取得します
+
+        最新のページを読む場合は、新しい方から CACHE_SESSION_INDEX_MAX_SIZE 件までを読んでインデックスを作ります。
+        """
+        generation = None
+        if before is None:
+            try:
+                generation = await cache.generation(user_id)
+            except Exception as e:
+                logger.info(f"Failed to get chat sessions index generation: {str(e)}")
+
+        query = select(ChatSession).where(
+            ChatSession.user_id == user_id,
+            ChatSession.end_time > datetime.utcnow(),
+        )
+        if before is not None:
+            if before_id is None:
+                query = query.where(ChatSession.start_time < before)
+            else:
+                query = query.where(
+                    or_(
+                        ChatSession.start_time < before,
+                        and_(
+                            ChatSession.start_time == before,
+                            ChatSession.id < before_id,
+                        ),
+                    )
                 )
-                .order_by(ChatSession.start_time.desc())
-                .offset(skip)
-                .limit(limit)
-                .all()
+        # インデックスを作る場合は、最新のページを含む新しい方の一部をまとめて読む
+        index_size = (
+            max(limit, config.CACHE_SESSION_INDEX_MAX_SIZE)
+            if generation is not None
+            else limit
+        )
+        try:
+            result = await self._db.execute(
+                query.order_by(
+                    ChatSession.start_time.desc(), ChatSession.id.desc()
+                ).limit(index_size)
             )
-            if chat_sessions:
-                # Convert ORM models to Pydantic models
-                chat_sessions_response = [
-                    ChatSessionResponse.from_orm(chat_session)
-                    for chat_session in chat_sessions
-                ]
-                # Cache the result in Redis
-                chat_sessions_data = [
-                    chat_session.dict() for chat_session in chat_sessions_response
-                ]
-                try:
-                    self._redis.set(
-                        cache_key,
-                        chat_sessions_data,
-                        expiration=CACHE_DURATION_WEEK.total_seconds(),
-                    )
-                except Exception as e:
-                    logger.warning(f"Failed to set chat sessions to Redis: {str(e)}")
-                return chat_sessions_response
-            else:
-                return []
+            chat_sessions = result.scalars().all()
         except SQLAlchemyError as e:
             logger.warning(
                 f"Warning retrieving chat sessions for user {user_id}: {str(e)}"
             )
             return None
 
-    def create_chat_session(
+        # Convert ORM models to Pydantic models
+        chat_sessions_response = [
+            ChatSessionResponse.from_orm(chat_session) for chat_session in chat_sessions
+        ]
+        if generation is not None:
+            try:
+                await cache.fill(
+                    user_id,
+                    [chat_session.dict() for chat_session in chat_sessions_response],
+                    generation,
+                    partial=len(chat_sessions_response) == index_size,
+                )
+            except Exception as e:
+                logger.warning(f"Failed to set chat sessions to Redis: {str(e)}")
+
+        return chat_sessions_response[:limit]
+
+    async def add_to_session_index(self, chat_session: ChatSession) -> None:
+        """
+        作成したセッションをユーザーのセッションのインデックスに追加します（一覧をDBから読み直しません）
+        """
+        cache = ChatSessionIndexCache(self._redis)
+        try:
+            await cache.add(ChatSessionResponse.from_orm(chat_session).dict())
+        except Exception as e:
+            logger.warning(f"Failed to add chat session to Redis index: {str(e)}")
+            try:
+                await cache.discard(chat_session.user_id)
+            except Exception as e:
+                logger.warning(f"Failed to discard chat sessions index: {str(e)}")
+
+    async def create_chat_session(
         self, user_id: int, start_time: datetime = None
     ) -> Optional[ChatSession]:
         """
@@ -81,13 +155,62 @@ class ChatSessionRepositoryImpl(ChatSessionRepository):
         )
         try:
             self._db.add(db_chat_session)
-            self._db.commit()
-            self._db.refresh(db_chat_session)
-            return db_chat_session
+            await self._db.commit()
+            await self._db.refresh(db_chat_session)
         except SQLAlchemyError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Error creating chat session: {str(e)}")
             return None
+        await self.add_to_session_index(db_chat_session)
+        return db_chat_session
+
+    async def get_chat_session(self, session_id: int) -> Optional[ChatSession]:
+        """
+        指定された session_id のチャットセッションを取得します
+        """
+        try:
+            return await self._db.get(ChatSession, session_id)
+        except SQLAlchemyError as e:
+            logger.warning(f"Warning retrieving chat session {session_id}: {str(e)}")
+            return None
+
+    async def update_context_summary(
+        self,
+        session_id: int,
+        context_summary: str,
+        summarized_until_message_id: int,
+        previous_message_id: Optional[int],
+    ) -> bool:
+        """
+        要約済みのメッセージIDが previous_message_id のままであれば、コンテキストの要約を更新します
+        """
+        try:
+            # 他のワーカーが先に要約を進めていた場合は上書きしない
+            result = await self._db.execute(
+                update(ChatSession)
+                .where(
+                    ChatSession.id == session_id,
+                    (
+                        ChatSession.summarized_until_message_id.is_(None)
+                        if previous_message_id is None
+                        else ChatSession.summarized_until_message_id
+                        == previous_message_id
+                    ),
+                )
+                .values(
+                    {
+                        ChatSession.context_summary: context_summary,
+                        ChatSession.summarized_until_message_id: summarized_until_message_id,
+                    }
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self._db.commit()
+            return result.rowcount == 1
+        except SQLAlchemyError as e:
+            await self._db.rollback()
+            logger.error(f"Error updating context summary: {str(e)}")
+            return False
 
     # def update_chat_session_summary(
     #     self, session_id: int, summary: str
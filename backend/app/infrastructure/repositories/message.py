@@ -1,70 +1,124 @@
 import logging
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError
 
-from infrastructure.cache.redis.redis_keys import (
-    CACHE_DURATION_DAY,
-    get_messages_list_key,
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.cache_stampede_guard import cache_stampede_guard
+from infrastructure.cache.redis.message_page_cache import (
+    MessagePageCache,
+    page_window,
 )
+from infrastructure.cache.redis.redis_keys import get_messages_page_key
 from schemas.v1.message import MessageResponse
 from domain.repositories.message import MessageRepository
 from infrastructure.database.models.message import Message
+import utilities.metrics as metrics
+from utilities.token_counter import count_tokens
 
 logger = logging.getLogger(__name__)
 
+# client_id が重複する行を読み飛ばす INSERT を作れる方言
+INSERT_IGNORING_DUPLICATES = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
 
 class MessageRepositoryImpl(MessageRepository):
-    def get_messages_by_session_id(
-        self, session_id: int, skip: int = 0, limit: int = 100
+    async def get_messages_by_session_id(
+        self,
+        session_id: int,
+        before: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: int = 100,
     ) -> Optional[List[Message]]:
         """
-        指定された session_id に基づいてメッセージを取得します。
-        """
-        cache_key = get_messages_list_key(session_id)
-        try:
-            messages_data = self._redis.get(cache_key)
-            messages = [MessageResponse(**item) for item in messages_data]
-            return messages
-
-        except Exception as e:
-            logger.info(f"Failed to get messages from Redis: {str(e)}")
-
-        try:
-            messages = (
-                self._db.query(Message)
-                .filter(Message.session_id == session_id)
-                .order_by(Message.created_at.asc())
-                .offset(skip)
-                .limit(limit)
-                .all()
-            )
-
-            if messages:
-                messages_response = [
-                    MessageResponse.from_orm(message) for message in messages
-                ]
+        指定された session_id のメッセージを1ページ分、古い順に取得します。
 
-                messages_data = [message.dict() for message in messages_response]
+        before を指定した場合はそのIDより古いメッセージのうち新しい limit 件、after を指定した場合は
+        そのIDより新しいメッセージのうち古い limit 件、どちらもない場合は最新の limit 件を返します。
+        """
+        window = page_window(before, after, limit)
+        cache_key = get_messages_page_key(session_id, window)
+        cached_messages = local_cache.get(cache_key)
+        if cached_messages is not None:
+            return cached_messages
+        token = local_cache.token()
+        cache = MessagePageCache(self._redis)
 
-                try:
-                    self._redis.set(
-                        cache_key,
-                        messages_data,
-                        expiration=CACHE_DURATION_DAY.total_seconds(),
-                    )
+        async def read():
+            cached = await cache.read(session_id, window)
+            if cached is None:
+                return None
+            messages_data, ttl = cached
+            return [MessageResponse(**item) for item in messages_data], ttl
 
-                except Exception as e:
-                    logger.error(f"Failed to set messages to Redis: {str(e)}")
+        messages = await cache_stampede_guard.load(
+            self._redis,
+            cache_key,
+            "messages_page",
+            read,
+            lambda: self._load_messages(
+                cache, session_id, window, before, after, limit
+            ),
+        )
+        if messages is not None:
+            local_cache.set(cache_key, None, messages, token)
+        return messages
 
-                return messages_response
-            else:
-                return []
+    async def _load_messages(
+        self,
+        cache: MessagePageCache,
+        session_id: int,
+        window: str,
+        before: Optional[int],
+        after: Optional[int],
+        limit: int,
+    ) -> Optional[List[MessageResponse]]:
+        """
+        DBから (session_id, id) のキーセットでページを取得してキャッシュに載せます。
+        """
+        generation = None
+        try:
+            generation = await cache.generation(session_id)
+        except Exception as e:
+            logger.info(f"Failed to get messages cache generation: {str(e)}")
 
+        query = select(Message).where(Message.session_id == session_id)
+        if after is not None:
+            query = query.where(Message.id > after).order_by(Message.id.asc())
+        else:
+            # 新しい順に limit 件を取得してから古い順に並べ直す
+            if before is not None:
+                query = query.where(Message.id < before)
+            query = query.order_by(Message.id.desc())
+        try:
+            result = await self._db.execute(query.limit(limit))
+            messages_response = [
+                MessageResponse.from_orm(message) for message in result.scalars()
+            ]
         except SQLAlchemyError as e:
             logger.warning(
                 f"Warn retrieving messages for session {session_id}: {str(e)}"
             )
             return None
+        if after is None:
+            messages_response.reverse()
+
+        if generation is not None:
+            try:
+                await cache.fill(
+                    session_id,
+                    window,
+                    [message.dict() for message in messages_response],
+                    generation,
+                )
+            except Exception as e:
+                logger.error(f"Failed to set messages to Redis: {str(e)}")
+
+        return messages_response
 
     # def get_message_by_id(self, message_id: int) -> Optional[Message]:
     #     """
@@ -76,19 +130,158 @@ class MessageRepositoryImpl(MessageRepository):
     #         logger.error(f"Error retrieving message with id {message_id}: {str(e)}")
     #         return None
 
-    def create_message(
-        self, session_id: int, content: str, is_user: bool
+    async def get_recent_messages_within_budget(
+        self, session_id: int, token_budget: int
+    ) -> List[Message]:
+        """
+        指定された session_id の新しいメッセージから、トークン数の合計が予算内に収まる分を古い順に取得します。
+        """
+        # 新しい順の累積トークン数を計算し、予算内に収まる行だけを残す
+        running_total = (
+            func.sum(Message.token_count)
+            .over(order_by=Message.id.desc())
+            .label("running_total")
+        )
+        recent = (
+            select(Message.id, running_total)
+            .where(Message.session_id == session_id)
+            .subquery()
+        )
+        result = await self._db.execute(
+            select(Message)
+            .join(recent, Message.id == recent.c.id)
+            .where(recent.c.running_total <= token_budget)
+            .order_by(Message.id.asc())
+        )
+        return list(result.scalars())
+
+    async def get_messages_in_range(
+        self,
+        session_id: int,
+        after_id: int,
+        before_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[Message]:
+        """
+        指定された session_id のうち、IDが after_id より大きく before_id より小さいメッセージを古い順に取得します。
+        """
+        query = select(Message).where(
+            Message.session_id == session_id, Message.id > after_id
+        )
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        result = await self._db.execute(query.order_by(Message.id.asc()).limit(limit))
+        return list(result.scalars())
+
+    async def create_messages(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """
+        複数のメッセージを1つのトランザクションでまとめて作成し、作成したIDを返します。
+
+        client_id を持つメッセージは、同じ client_id の行が既にあれば作成しません
+        （保存をやり直した場合に重複させないため）。
+        """
+        rows = [
+            {
+                "session_id": message["session_id"],
+                "content": message["content"],
+                "is_user": message["is_user"],
+                "interrupted": message.get("interrupted", False),
+                "token_count": count_tokens(message["content"]),
+                "client_id": message.get("client_id"),
+            }
+            for message in messages
+        ]
+        dialect = self._db.get_bind().dialect.name
+        statement = insert(Message)
+        if dialect in INSERT_IGNORING_DUPLICATES:
+            statement = INSERT_IGNORING_DUPLICATES[dialect](
+                Message
+            ).on_conflict_do_nothing(index_elements=[Message.client_id])
+        session_ids = list({message["session_id"] for message in messages})
+        token = await self._begin_cache_write(session_ids)
+        try:
+            # 複数行の INSERT ... RETURNING にまとめて1往復で作成する
+            # （読み飛ばした行は返らないので、パラメーターの順には対応づけずIDの順に並べる）
+            result = await self._db.scalars(statement.returning(Message), rows)
+            created = sorted(
+                (MessageResponse.from_orm(message) for message in result),
+                key=lambda message: message.id,
+            )
+            await self._db.commit()
+        except SQLAlchemyError as e:
+            await self._db.rollback()
+            logger.error(f"Error creating {len(rows)} messages: {str(e)}")
+            await self._cancel_cache_write(session_ids, token)
+            raise
+        if len(created) < len(rows):
+            metrics.increment("messages_duplicates_skipped", len(rows) - len(created))
+        await self._append_to_cache(created, token)
+        return [message.id for message in created]
+
+    async def create_message(
+        self, session_id: int, content: str, is_user: bool, interrupted: bool = False
     ) -> Optional[Message]:
         """
         新しいメッセージを作成します。
         """
-        db_message = Message(session_id=session_id, content=content, is_user=is_user)
+        db_message = Message(
+            session_id=session_id,
+            content=content,
+            is_user=is_user,
+            token_count=count_tokens(content),
+            interrupted=interrupted,
+        )
+        token = await self._begin_cache_write([session_id])
         try:
             self._db.add(db_message)
-            self._db.commit()
-            self._db.refresh(db_message)
-            return db_message
+            await self._db.commit()
+            await self._db.refresh(db_message)
         except SQLAlchemyError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Error creating message: {str(e)}")
+            await self._cancel_cache_write([session_id], token)
+            return None
+        await self._append_to_cache([MessageResponse.from_orm(db_message)], token)
+        return db_message
+
+    async def _begin_cache_write(self, session_ids: List[int]) -> Optional[str]:
+        """
+        コミットの前に、スレッドのページのキャッシュへの書き込みを登録します。
+
+        ページへの追加の前にプロセスが落ちた場合は、登録の期限が過ぎた後の読み込みでページが削除されます。
+        """
+        if self._redis is None:
             return None
+        try:
+            return await MessagePageCache(self._redis).begin_write(session_ids)
+        except Exception as e:
+            logger.warning(f"Failed to register pending messages in Redis: {str(e)}")
+            return None
+
+    async def _cancel_cache_write(
+        self, session_ids: List[int], token: Optional[str]
+    ) -> None:
+        if token is None:
+            return
+        try:
+            await MessagePageCache(self._redis).cancel_write(session_ids, token)
+        except Exception as e:
+            logger.warning(f"Failed to cancel pending messages in Redis: {str(e)}")
+
+    async def _append_to_cache(
+        self, messages: List[MessageResponse], token: Optional[str] = None
+    ) -> None:
+        """
+        保存したメッセージをスレッドのページのキャッシュに追加します（失敗した場合はスレッドのページを削除します）。
+        """
+        if self._redis is None:
+            return
+        cache = MessagePageCache(self._redis)
+        try:
+            await cache.append([message.dict() for message in messages], token)
+        except Exception as e:
+            logger.warning(f"Failed to append messages to Redis: {str(e)}")
+            try:
+                await cache.discard(list({message.session_id for message in messages}))
+            except Exception as e:
+                logger.warning(f"Failed to discard messages cache: {str(e)}")
@@ -1,5 +1,6 @@
 import logging
 from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from infrastructure.database.models.user import User
 from domain.repositories.user import UserRepository
@@ -8,91 +9,92 @@ logger = logging.getLogger(__name__)
 
 
 class UserRepositoryImpl(UserRepository):
-    def get_user(self, user_id: int) -> Optional[User]:
+    async def get_user(self, user_id: int) -> Optional[User]:
         """
         指定されたuser_idに基づいてユーザーを取得します。
         """
         try:
-            return self._db.query(User).filter(User.id == user_id).first()
+            return await self._db.get(User, user_id)
         except SQLAlchemyError as e:
             logger.warning(f"Warn retrieving user with id {user_id}: {str(e)}")
             return None
 
-    def create_user(self, username: str, email: str) -> Optional[User]:
+    async def create_user(self, username: str, email: str) -> Optional[User]:
         """
         新しいユーザーを作成します。
         """
         db_user = User(username=username, email=email)
         try:
             self._db.add(db_user)
-            self._db.commit()
-            self._db.refresh(db_user)
+            await self._db.commit()
+            await self._db.refresh(db_user)
             return db_user
         except IntegrityError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Integrity error while creating user: {str(e)}")
             return None
         except SQLAlchemyError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Error creating user: {str(e)}")
             return None
 
-    def update_user(
+    async def update_user(
         self, user_id: int, username: Optional[str] = None, email: Optional[str] = None
     ) -> Optional[User]:
         """
         指定されたuser_idに基づいてユーザーを更新します。
         """
         try:
-            db_user = self._db.query(User).filter(User.id == user_id).first()
+            db_user = await self._db.get(User, user_id)
             if db_user:
                 if username is not None:
                     db_user.username = username
                 if email is not None:
                     db_user.email = email
-                self._db.commit()
-                self._db.refresh(db_user)
+                await self._db.commit()
+                await self._db.refresh(db_user)
                 return db_user
             return None
         except IntegrityError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Integrity error while updating user: {str(e)}")
             return None
         except SQLAlchemyError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Error updating user: {str(e)}")
             return None
 
-    def delete_user(self, user_id: int) -> bool:
+    async def delete_user(self, user_id: int) -> bool:
         """
         指定されたuser_idに基づいてユーザーを削除します。
         """
         try:
-            db_user = self._db.query(User).filter(User.id == user_id).first()
+            db_user = await self._db.get(User, user_id)
             if db_user:
-                self._db.delete(db_user)
-                self._db.commit()
+                await self._db.delete(db_user)
+                await self._db.commit()
                 return True
             return False
         except SQLAlchemyError as e:
-            self._db.rollback()
+            await self._db.rollback()
             logger.error(f"Error deleting user: {str(e)}")
             return False
 
-    def get_or_create_user(self, username: str, email: str) -> User:
+    async def get_or_create_user(self, username: str, email: str) -> User:
         """
         ユーザーを取得または作成します。
         """
         try:
-            user = self._db.query(User).filter(User.email == email).first()
+            result = await self._db.execute(select(User).where(User.email == email))
+            user = result.scalars().first()
             if user:
                 user.username = username
             else:
                 user = User(username=username, email=email)
                 self._db.add(user)
-            self._db.commit()
-            self._db.refresh(user)
+            await self._db.commit()
+            await self._db.refresh(user)
             return user
         except SQLAlchemyError as db_error:
-            self._db.rollback()
+            await self._db.rollback()
             raise db_error
@@ -1,17 +1,72 @@
+import asyncio
 import os
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from api import router as api_router
+from application.services.metrics_access import verify_metrics_token
+from application.services.message_write_behind import message_write_behind
+from application.services.resumable_stream import resumable_streams
+from infrastructure.cache.redis.cache_invalidation_listener import (
+    CacheInvalidationListener,
+)
+from infrastructure.cache.redis.redis_client import RedisClient
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.query_profiler import query_profiler
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from infrastructure.llm.prompt_chain_cache import PromptChainCache
 import utilities.config as config
+import utilities.metrics as metrics
+from utilities.token_counter import load_encoding
 
 # 全てのモデルのインポート
 from infrastructure.database.models import *
 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI()
+
+
+async def get_write_behind_redis(redis_client: RedisClient):
+    """Write-behindのジャーナル用のRedis（接続できない場合はジャーナルなしで動かす）"""
+    try:
+        await redis_client.get_client().ping()
+        return RedisRepository(redis_client.get_client())
+    except Exception as e:
+        logging.warning(f"Write-behind runs without a Redis journal: {str(e)}")
+        return None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LLMクライアントはプロセス全体で共有し、コネクションを使い回す
+    app.state.llm_client_registry = LLMClientRegistry()
+    app.state.redis_client = RedisClient()
+    # 他のワーカーの書き込みを購読し、プロセス内のL1キャッシュから削除する
+    app.state.cache_invalidation_listener = CacheInvalidationListener(
+        app.state.redis_client.get_client()
+    )
+    await app.state.cache_invalidation_listener.start()
+    app.state.prompt_chain_cache = PromptChainCache()
+    await app.state.prompt_chain_cache.start()
+    # 初回はBPEファイルをダウンロードする場合があるので、イベントループを止めないようにスレッドで読み込む
+    await asyncio.to_thread(load_encoding)
+    if config.WRITE_BEHIND_ENABLED:
+        await message_write_behind.start(
+            await get_write_behind_redis(app.state.redis_client)
+        )
+    yield
+    # 生成中の回答を途中まで保存してから書き込みループを止める
+    await resumable_streams.shutdown()
+    await message_write_behind.stop()
+    await app.state.prompt_chain_cache.stop()
+    await app.state.llm_client_registry.aclose()
+    await app.state.cache_invalidation_listener.stop()
+    await app.state.redis_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(SessionMiddleware, secret_key=config.SECRET_KEY)
 
 
@@ -29,4 +84,14 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", dependencies=[Depends(verify_metrics_token)])
+async def get_metrics():
+    return metrics.snapshot()
+
+
+@app.get("/metrics/queries", dependencies=[Depends(verify_metrics_token)])
+async def get_query_metrics():
+    return query_profiler.snapshot()
+
+
 app.include_router(api_router, prefix="/api")
@@ -15,6 +15,7 @@ class MessageResponse(MessageBase):
     id: int = Field(..., alias="id")
     session_id: int = Field(..., alias="sessionID")
     content: str = Field(default=None, alias="content")
+    interrupted: bool = Field(default=False, alias="interrupted")
     created_at: datetime = Field(..., alias="createdAt")
     updated_at: datetime = Field(..., alias="updatedAt")
 
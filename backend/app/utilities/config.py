@@ -14,12 +14,57 @@ POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 POSTGRES_NAME = os.getenv("POSTGRES_NAME")
 POSTGRES_URL = os.getenv("POSTGRES_URL")
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+# Query profiler (SQLのレイテンシとスロークエリの記録)
+DB_PROFILER_ENABLED = os.getenv("DB_PROFILER_ENABLED", "true").lower() == "true"
+DB_PROFILER_MAX_STATEMENTS = int(os.getenv("DB_PROFILER_MAX_STATEMENTS", 200))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", 50))
+DB_SLOW_QUERY_EXPLAIN = os.getenv("DB_SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+
+# Metrics (メトリクスのエンドポイントの Bearer トークン。設定しない場合はエンドポイントを公開しない)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 # Redis
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
-REDIS_DB = os.getenv("REDIS_DB")
+REDIS_DB = int(os.getenv("REDIS_DB") or 0)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# Cache codec (キャッシュの値のシリアライズと圧縮)
+CACHE_SERIALIZER = os.getenv("CACHE_SERIALIZER", "orjson")
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zstd")
+CACHE_COMPRESSION_THRESHOLD = int(os.getenv("CACHE_COMPRESSION_THRESHOLD", 1024))
+CACHE_ZSTD_LEVEL = int(os.getenv("CACHE_ZSTD_LEVEL", 3))
+
+# Cache stampede protection (キャッシュミス時のDBクエリの集中の防止)
+CACHE_STAMPEDE_PROTECTION_ENABLED = (
+    os.getenv("CACHE_STAMPEDE_PROTECTION_ENABLED", "true").lower() == "true"
+)
+CACHE_LEASE_TTL_MS = int(os.getenv("CACHE_LEASE_TTL_MS", 5000))
+CACHE_LEASE_WAIT_TIMEOUT = float(os.getenv("CACHE_LEASE_WAIT_TIMEOUT", 3))
+CACHE_LEASE_POLL_INTERVAL = float(os.getenv("CACHE_LEASE_POLL_INTERVAL", 0.01))
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", 1.0))
+CACHE_EMPTY_TTL = int(os.getenv("CACHE_EMPTY_TTL", 30))
+CACHE_PENDING_WRITE_TTL_MS = int(os.getenv("CACHE_PENDING_WRITE_TTL_MS", 30000))
+CACHE_SESSION_INDEX_MAX_SIZE = int(os.getenv("CACHE_SESSION_INDEX_MAX_SIZE", 1000))
+
+# L1 cache (Redisの手前に置くプロセス内のキャッシュ。無効化はRedis Pub/Subで全ワーカーに届ける)
+L1_CACHE_ENABLED = os.getenv("L1_CACHE_ENABLED", "true").lower() == "true"
+L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", 10000))
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", 30))
 
 # Google Cloud OAuth
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
@@ -30,6 +75,70 @@ ALGORITHM = os.getenv("ALGORITHM")
 
 # LLM
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.5))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 30))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", 5))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", 40))
+
+# LLM response cache
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60 * 60 * 24))
+RESPONSE_CACHE_MAX_ENTRY_SIZE = int(
+    os.getenv("RESPONSE_CACHE_MAX_ENTRY_SIZE", 32 * 1024)
+)
+RESPONSE_CACHE_MAX_TOTAL_SIZE = int(
+    os.getenv("RESPONSE_CACHE_MAX_TOTAL_SIZE", 64 * 1024 * 1024)
+)
+
+# Single-flight (同一リクエストの上流ストリームの共有)
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_REDIS_ENABLED = (
+    os.getenv("SINGLE_FLIGHT_REDIS_ENABLED", "false").lower() == "true"
+)
+SINGLE_FLIGHT_LOCK_TTL_MS = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL_MS", 30000))
+SINGLE_FLIGHT_STREAM_TTL = int(os.getenv("SINGLE_FLIGHT_STREAM_TTL", 60))
+SINGLE_FLIGHT_READ_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_READ_TIMEOUT", 30))
+
+# Admission control (LLMストリームの同時実行数の制限)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 32))
+ADMISSION_PER_USER_LIMIT = int(os.getenv("ADMISSION_PER_USER_LIMIT", 2))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+ADMISSION_REDIS_ENABLED = (
+    os.getenv("ADMISSION_REDIS_ENABLED", "false").lower() == "true"
+)
+ADMISSION_REDIS_MAX_CONCURRENCY = int(os.getenv("ADMISSION_REDIS_MAX_CONCURRENCY", 128))
+ADMISSION_REDIS_RETRY_INTERVAL = float(os.getenv("ADMISSION_REDIS_RETRY_INTERVAL", 0.2))
+ADMISSION_LEASE_TTL_MS = int(os.getenv("ADMISSION_LEASE_TTL_MS", 30000))
+
+# Write-behind (メッセージの非同期・バッチ保存)
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 100))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", 0.05))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 5000))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 3))
+WRITE_BEHIND_RETRY_BACKOFF = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF", 0.2))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", 10))
+WRITE_BEHIND_RECOVERY_INTERVAL = float(os.getenv("WRITE_BEHIND_RECOVERY_INTERVAL", 10))
+WRITE_BEHIND_INSTANCE_TTL = int(os.getenv("WRITE_BEHIND_INSTANCE_TTL", 60))
+
+# Resumable streams (再接続したクライアントへの回答の再送)
+RESUMABLE_STREAM_ENABLED = (
+    os.getenv("RESUMABLE_STREAM_ENABLED", "true").lower() == "true"
+)
+RESUMABLE_STREAM_TTL = int(os.getenv("RESUMABLE_STREAM_TTL", 120))
+RESUMABLE_STREAM_RESUME_GRACE = float(os.getenv("RESUMABLE_STREAM_RESUME_GRACE", 15))
+RESUMABLE_STREAM_READ_BLOCK_MS = int(os.getenv("RESUMABLE_STREAM_READ_BLOCK_MS", 1000))
+
+# Multi-turn websocket (1つの接続で複数ターンの会話を扱う)
+WEBSOCKET_PING_INTERVAL = float(os.getenv("WEBSOCKET_PING_INTERVAL", 25))
+WEBSOCKET_IDLE_TIMEOUT = float(os.getenv("WEBSOCKET_IDLE_TIMEOUT", 300))
 
 # Others
 ENV = os.getenv("ENV", "dev")
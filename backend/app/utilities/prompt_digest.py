@@ -0,0 +1,22 @@
+import hashlib
+import json
+import unicodedata
+from typing import Optional
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角半角の揺れと空白の違いを吸収する"""
+    return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+def get_prompt_digest(
+    prompt: str, model: str, temperature: float, prompt_version: Optional[str]
+) -> str:
+    """
+    正規化したプロンプト・モデル・temperature・システムプロンプトのバージョンからハッシュを生成する
+    """
+    payload = json.dumps(
+        [normalize_prompt(prompt), model, temperature, prompt_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
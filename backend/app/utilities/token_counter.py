@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import tiktoken
+
+import utilities.config as config
+
+logger = logging.getLogger(__name__)
+
+# tiktokenが使えない場合の概算（英文でおおよそ4文字で1トークン）
+CHARS_PER_TOKEN = 4
+# エンコーディングの読み込みに失敗した後、読み込み直すまでの秒数
+ENCODING_RETRY_INTERVAL = 60
+
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_loading_lock = threading.Lock()
+_next_attempt: Dict[str, float] = {}
+
+
+def load_encoding(model: str = config.LLM_MODEL) -> Optional[tiktoken.Encoding]:
+    """
+    モデルのエンコーディングを読み込む
+
+    初回はBPEファイルをダウンロードする場合があるので、イベントループの外（起動時の asyncio.to_thread など）で呼ぶ。
+    失敗した場合は記録せず、次の呼び出しで読み込み直す。
+    """
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Failed to load tiktoken encoding for {model}: {str(e)}")
+        return None
+    _encodings[model] = encoding
+    return encoding
+
+
+def _load_in_background(model: str) -> None:
+    """読み込みに失敗したエンコーディングを、一定の間隔で別のスレッドから読み込み直す"""
+    with _loading_lock:
+        if time.monotonic() < _next_attempt.get(model, 0):
+            return
+        _next_attempt[model] = time.monotonic() + ENCODING_RETRY_INTERVAL
+    threading.Thread(target=load_encoding, args=(model,), daemon=True).start()
+
+
+def count_tokens(text: str, model: str = config.LLM_MODEL) -> int:
+    """
+    テキストのトークン数を数える
+
+    エンコーディングをまだ読み込めていない場合は、読み込みを待たずに文字数から概算する。
+    """
+    encoding = _encodings.get(model)
+    if encoding is None:
+        _load_in_background(model)
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,13 @@
+"""
+ベンチマークスクリプト群
+
+backend ディレクトリで `python -m benchmarks.<name>` のように実行する。
+アプリケーションのモジュールを import できるように app ディレクトリをパスに追加している。
+"""
+
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
@@ -0,0 +1,159 @@
+"""
+キャッシュのシリアライザーと圧縮方式の組み合わせごとに、messages_list_* に保存する
+メッセージリストのエンコード・デコードの時間と、Redisでのメモリ使用量を比較する
+
+legacy はコーデックを導入する前の RedisRepository と同じ json.dumps / json.loads で、
+decode+rebuild はデコードしてから MessageResponse を作り直すまでの時間。
+--redis-url のRedisが MEMORY USAGE に対応していない場合、redis 列は n/a になる。
+
+    cd backend && python -m benchmarks.cache_codec
+    cd backend && python -m benchmarks.cache_codec --messages 200 --answer-chars 4000
+    cd backend && python -m benchmarks.cache_codec --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, List
+
+import redis.asyncio
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url
+from infrastructure.cache.redis.redis_codec import (
+    CacheCodec,
+    available_compressors,
+    available_serializers,
+    json_default,
+)
+from schemas.v1.message import MessageResponse
+
+WORDS = (
+    "キャッシュ データベース レスポンス 非同期 ストリーミング セッション 設定 関数 "
+    "the cache stores each answer so that the next request can return it without "
+    "calling the model again and the database only sees writes in batches while "
+    "redis keeps a copy of recent messages for every session async await pool "
+    "```python def main(): return await client.get(key) ``` - 1. 2. **注意** "
+).split()
+
+
+def message_list(args: argparse.Namespace, rng: random.Random) -> List[dict]:
+    """ユーザーの短い質問とエージェントの長い回答が交互に並ぶ、キャッシュと同じ形のリスト"""
+    started = datetime(2024, 10, 1, 9, 0, 0, 123456)
+    messages = []
+    for index in range(args.messages):
+        is_user = index % 2 == 0
+        length = args.question_chars if is_user else args.answer_chars
+        content = ""
+        while len(content) < length:
+            content += rng.choice(WORDS) + " "
+        created_at = started + timedelta(seconds=index * 7, microseconds=index)
+        messages.append(
+            MessageResponse(
+                id=index + 1,
+                session_id=1,
+                content=content[:length],
+                is_user=is_user,
+                interrupted=False,
+                created_at=created_at,
+                updated_at=created_at,
+            ).dict()
+        )
+    return messages
+
+
+def median_time(args: argparse.Namespace, function: Callable[[], Any]) -> float:
+    durations = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+async def memory_usage(client: redis.asyncio.Redis, key: str, data: Any) -> str:
+    await client.set(key, data, ex=60)
+    return f"{await client.memory_usage(key, samples=0)}B"
+
+
+async def supports_memory_usage(client: redis.asyncio.Redis, key: str) -> bool:
+    try:
+        await memory_usage(client, key, "")
+        return True
+    except redis.exceptions.RedisError:
+        # 未対応のコマンドで接続を切るサーバーもあるので、コネクションを張り直す
+        await client.connection_pool.disconnect()
+        return False
+
+
+async def main(args: argparse.Namespace) -> None:
+    value = message_list(args, random.Random(args.seed))
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    key = f"benchmark_{uuid.uuid4().hex[:8]}"
+
+    def rebuild(data: List[dict]) -> List[MessageResponse]:
+        return [MessageResponse(**item) for item in data]
+
+    legacy = json.dumps(value, default=json_default)
+    rows = [
+        (
+            "legacy",
+            lambda: json.dumps(value, default=json_default),
+            lambda: json.loads(legacy),
+            legacy,
+        )
+    ]
+    for serializer in available_serializers():
+        for compression in available_compressors(args.zstd_level):
+            codec = CacheCodec(
+                serializer, compression, args.compression_threshold, args.zstd_level
+            )
+            encoded = codec.encode(value)
+            rows.append(
+                (
+                    f"{serializer}+{compression}",
+                    lambda codec=codec: codec.encode(value),
+                    lambda codec=codec, encoded=encoded: codec.decode(encoded),
+                    encoded,
+                )
+            )
+
+    print(
+        f"messages={args.messages} answer_chars={args.answer_chars} "
+        f"legacy_size={len(legacy.encode())}B"
+    )
+    measure_memory = await supports_memory_usage(client, key)
+    try:
+        for label, encode, decode, data in rows:
+            encode_time = median_time(args, encode)
+            decode_time = median_time(args, decode)
+            rebuild_time = median_time(args, lambda: rebuild(decode()))
+            memory = await memory_usage(client, key, data) if measure_memory else "n/a"
+            size = len(data.encode()) if isinstance(data, str) else len(data)
+            print(
+                f"{label:<15} size={size:>8}B redis={memory:>14} "
+                f"encode={encode_time * 1000:.3f}ms "
+                f"decode={decode_time * 1000:.3f}ms "
+                f"decode+rebuild={rebuild_time * 1000:.3f}ms"
+            )
+    finally:
+        await client.unlink(key)
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--question-chars", type=int, default=120)
+    parser.add_argument("--answer-chars", type=int, default=1500)
+    parser.add_argument("--compression-threshold", type=int, default=1024)
+    parser.add_argument("--zstd-level", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
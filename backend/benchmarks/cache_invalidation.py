@@ -0,0 +1,114 @@
+"""
+キーを SCAN で探して削除する旧実装と、UNLINK でキーを直接削除する方法、タグで削除する方法で、
+Redisのキーの数に対してキャッシュの無効化にかかる時間がどう変わるかを比較する
+
+--keys で指定した数のダミーのキーを作成し、その中に無効化の対象のキャッシュを置いてから、
+それぞれの方法で無効化する時間を計測する。旧実装はキースペース全体を走査するのでキーの数に比例し、
+UNLINK とタグでの削除は対象のキーの数にしか比例しない。ダミーのキーは最後に削除する。
+
+    cd backend && python -m benchmarks.cache_invalidation
+    cd backend && python -m benchmarks.cache_invalidation --keys 10000 100000 1000000
+    cd backend && python -m benchmarks.cache_invalidation --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+import redis.asyncio
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url
+from infrastructure.cache.redis.redis_keys import (
+    get_cache_tag_key,
+    get_messages_page_key,
+    get_session_cache_tag,
+)
+from infrastructure.cache.redis.redis_repository import RedisRepository
+
+FILL_BATCH_SIZE = 10000
+
+
+async def legacy_delete(client: redis.asyncio.Redis, patterns: List[str]) -> None:
+    """キーを SCAN で探して1件ずつ削除していた頃の RedisRepository.delete と同じ操作"""
+    for pattern in patterns:
+        async for key in client.scan_iter(match=pattern):
+            await client.delete(key)
+
+
+async def fill(client: redis.asyncio.Redis, prefix: str, start: int, stop: int):
+    for offset in range(start, stop, FILL_BATCH_SIZE):
+        end = min(offset + FILL_BATCH_SIZE, stop)
+        await client.mset({f"{prefix}_{index}": "x" for index in range(offset, end)})
+
+
+async def cleanup(client: redis.asyncio.Redis, prefix: str, count: int):
+    for offset in range(0, count, FILL_BATCH_SIZE):
+        end = min(offset + FILL_BATCH_SIZE, count)
+        await client.unlink(*[f"{prefix}_{index}" for index in range(offset, end)])
+
+
+async def measure(args: argparse.Namespace, prepare, invalidate) -> float:
+    durations = []
+    for _ in range(args.repeat):
+        await prepare()
+        started = time.perf_counter()
+        await invalidate()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+async def main(args: argparse.Namespace) -> None:
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    repository = RedisRepository(client)
+    prefix = f"benchmark_{uuid.uuid4().hex[:8]}"
+    session_id = f"{prefix}_session"
+    cache_key = get_messages_page_key(session_id, "latest_0_100")
+    tag = get_session_cache_tag(session_id)
+    # タグでの削除は、同じタグに登録したページなどのキャッシュもまとめて削除する
+    tagged_keys = [f"{cache_key}_{index}" for index in range(args.tagged_keys)]
+    value = [{"id": index, "content": "x" * 200} for index in range(20)]
+
+    async def set_plain():
+        await repository.set(cache_key, value, 60)
+
+    async def set_tagged():
+        for key in [cache_key, *tagged_keys]:
+            await repository.set(key, value, 60, tags=[tag])
+
+    filled = 0
+    try:
+        for size in sorted(args.keys):
+            await fill(client, prefix, filled, size)
+            filled = size
+            scan = await measure(
+                args, set_plain, lambda: legacy_delete(client, [cache_key])
+            )
+            unlink = await measure(
+                args, set_plain, lambda: repository.delete([cache_key])
+            )
+            tagged = await measure(
+                args, set_tagged, lambda: repository.invalidate_tags([tag])
+            )
+            assert await client.exists(cache_key, *tagged_keys) == 0
+            print(
+                f"keys={size:<8} scan={scan * 1000:.2f}ms "
+                f"unlink={unlink * 1000:.2f}ms "
+                f"tags({1 + args.tagged_keys} keys)={tagged * 1000:.2f}ms"
+            )
+    finally:
+        await cleanup(client, prefix, filled)
+        await client.unlink(cache_key, get_cache_tag_key(tag), *tagged_keys)
+        await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--keys", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--tagged-keys", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
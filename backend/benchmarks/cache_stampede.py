@@ -0,0 +1,175 @@
+"""
+よく読まれるキャッシュを無効化したときに、同時に読み込んでいるクライアントのDBクエリがどれだけ集中するかを計測する
+
+--readers 個のクライアントが同じユーザーのチャットセッション一覧を読み続け、--invalidate-interval 秒ごとに
+ユーザーのセッション一覧のキャッシュを削除する。1秒ごとの chat_sessions へのクエリ数を数えて比較する。
+
+- off: スタンピード対策なし（キャッシュミスした全員がDBにクエリする）
+- lease: Redisのリースだけ（全員が別のワーカーにいる状態を再現する）
+- lease+local: Redisのリースと、プロセス内での再計算の共有
+
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.cache_stampede --readers 500
+    cd backend && python -m benchmarks.cache_stampede --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List
+
+import redis.asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url, percentile
+from infrastructure.cache.redis.cache_stampede_guard import cache_stampede_guard
+from infrastructure.cache.redis.chat_session_index_cache import ChatSessionIndexCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import (
+    Message,
+)  # noqa: F401  リレーションの解決に必要
+from infrastructure.database.models.user import User
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
+import utilities.config as config
+import utilities.metrics as metrics
+
+MODES = {
+    "off": (False, False),
+    "lease": (True, False),
+    "lease+local": (True, True),
+}
+
+
+async def run(
+    label: str,
+    engine,
+    session_factory,
+    redis_repository: RedisRepository,
+    user_id: int,
+    args: argparse.Namespace,
+) -> None:
+    cache_stampede_guard.enabled, cache_stampede_guard.coalesce_locally = MODES[label]
+    before = metrics.snapshot()["counters"]
+    queries: Counter = Counter()
+    started = time.perf_counter()
+
+    def count_query(conn, cursor, statement, *args) -> None:
+        if "FROM chat_sessions" in statement:
+            queries[int(time.perf_counter() - started)] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+    latencies: List[float] = []
+    stop = asyncio.Event()
+
+    async def reader() -> None:
+        while not stop.is_set():
+            async with session_factory() as db:
+                repository = ChatSessionRepositoryImpl(db=db, redis=redis_repository)
+                read_started = time.perf_counter()
+                await repository.get_chat_session_by_user_id(user_id)
+                latencies.append(time.perf_counter() - read_started)
+            await asyncio.sleep(args.think_time)
+
+    async def invalidator() -> None:
+        while not stop.is_set():
+            await ChatSessionIndexCache(redis_repository).discard(user_id)
+            await asyncio.sleep(args.invalidate_interval)
+
+    tasks = [asyncio.create_task(reader()) for _ in range(args.readers)]
+    tasks.append(asyncio.create_task(invalidator()))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+
+    per_second = [queries.get(second, 0) for second in range(int(args.duration))]
+    print(
+        f"{label:<12} readers={args.readers:<5} reads/s={len(latencies) / args.duration:.0f} "
+        f"db_queries/s mean={statistics.mean(per_second):.1f} max={max(per_second)} "
+        f"read_p50={statistics.median(latencies) * 1000:.1f}ms "
+        f"read_p99={percentile(latencies, 0.99) * 1000:.1f}ms"
+    )
+    counters = metrics.snapshot()["counters"]
+    print(
+        " " * 13
+        + " ".join(
+            f"{name}={counters.get(name, 0) - before.get(name, 0):.0f}"
+            for name in (
+                "cache_recomputes",
+                "cache_stampede_coalesced",
+                "cache_lease_waits",
+                "cache_lease_timeouts",
+            )
+        )
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    # アプリと同じく、コネクションの上限に達したらエラーにせず待つ
+    pool = redis.asyncio.BlockingConnectionPool.from_url(
+        args.redis_url, decode_responses=True, max_connections=args.max_connections
+    )
+    client = redis.asyncio.Redis(connection_pool=pool)
+    redis_repository = RedisRepository(client)
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_sessions = [
+            ChatSession(
+                user_id=user.id,
+                summary=f"benchmark {index}",
+                start_time=datetime.utcnow(),
+                end_time=datetime.utcnow() + timedelta(days=1),
+            )
+            for index in range(args.sessions)
+        ]
+        db.add_all(chat_sessions)
+        await db.commit()
+        try:
+            for label in args.modes:
+                await run(
+                    label, engine, session_factory, redis_repository, user.id, args
+                )
+        finally:
+            await ChatSessionIndexCache(redis_repository).discard(user.id)
+            for chat_session in chat_sessions:
+                await db.delete(chat_session)
+            await db.delete(user)
+            await db.commit()
+    await client.aclose()
+    await pool.disconnect()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--readers", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--invalidate-interval", type=float, default=1)
+    parser.add_argument("--think-time", type=float, default=0.05)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,220 @@
+"""
+同期セッションでDBにアクセスする旧実装と、AsyncSession を使う実装で、
+同時に多数のストリームを処理したときのイベントループの遅延とレイテンシを比較する
+
+各ストリームは別々のセッションで、会話履歴の取得 → トークンのストリーミング（sleepで模擬）→
+メッセージ2件の保存を行う。旧実装はクエリの間イベントループを止めるので、他のストリームの
+トークン送信やループの遅延を計測するタスクまで待たされる。--query-latency を指定すると、
+ネットワーク越しのDBを模擬して履歴の取得ごとに pg_sleep を実行する（PostgreSQLのみ）。
+ベンチマーク用のデータは終了時に削除する。
+
+    cd backend && python -m benchmarks.db_event_loop --streams 200
+    cd backend && python -m benchmarks.db_event_loop --query-latency 0.005
+    cd backend && python -m benchmarks.db_event_loop --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+from sqlalchemy import create_engine, delete, func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def monitor_lag(interval: float, lags: List[float], stop: asyncio.Event):
+    """interval ごとに起きる予定のタスクが、実際にどれだけ遅れて起きたかを記録する"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(time.perf_counter() - expected, 0.0))
+
+
+async def stream_tokens(args: argparse.Namespace) -> None:
+    for _ in range(args.tokens):
+        await asyncio.sleep(args.inter_token_delay)
+
+
+# どちらの実装も AgentService と同じく、ストリーミング中はコネクションをプールに返しておく
+
+
+SLEEP = text("SELECT pg_sleep(:seconds)")
+
+
+def legacy_turn_queries(db, session_id: int, args: argparse.Namespace) -> None:
+    # 旧リポジトリと同じクエリを同期セッションで実行する
+    if args.query_latency:
+        db.execute(SLEEP, {"seconds": args.query_latency})
+    db.get(ChatSession, session_id)
+    running_total = (
+        func.sum(Message.token_count).over(order_by=Message.id.desc()).label("rt")
+    )
+    recent = (
+        select(Message.id, running_total)
+        .where(Message.session_id == session_id)
+        .subquery()
+    )
+    db.execute(
+        select(Message)
+        .join(recent, Message.id == recent.c.id)
+        .where(recent.c.rt <= args.budget)
+        .order_by(Message.id.asc())
+    ).scalars().all()
+
+
+def legacy_save(db, session_id: int) -> None:
+    for is_user in (True, False):
+        db.add(
+            Message(
+                session_id=session_id,
+                content="benchmark",
+                is_user=is_user,
+                token_count=3,
+            )
+        )
+        db.commit()
+
+
+async def legacy_stream(
+    session_factory, session_id: int, args: argparse.Namespace
+) -> float:
+    started = time.perf_counter()
+    db = session_factory()
+    try:
+        legacy_turn_queries(db, session_id, args)
+        db.commit()
+        await stream_tokens(args)
+        legacy_save(db, session_id)
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+async def async_stream(
+    session_factory, session_id: int, args: argparse.Namespace
+) -> float:
+    started = time.perf_counter()
+    async with session_factory() as db:
+        chat_sessions = ChatSessionRepositoryImpl(db=db, redis=None)
+        messages = MessageRepositoryImpl(db=db, redis=None)
+        if args.query_latency:
+            await db.execute(SLEEP, {"seconds": args.query_latency})
+        await chat_sessions.get_chat_session(session_id)
+        await messages.get_recent_messages_within_budget(session_id, args.budget)
+        await db.commit()
+        await stream_tokens(args)
+        for is_user in (True, False):
+            await messages.create_message(session_id, "benchmark", is_user)
+    return time.perf_counter() - started
+
+
+async def run(
+    label: str, stream, session_factory, session_ids: List[int], args
+) -> None:
+    # コネクションの確立やステートメントの準備を計測から除く
+    await asyncio.gather(
+        *(
+            stream(session_factory, session_id, args)
+            for session_id in session_ids[: args.pool_size]
+        )
+    )
+    lags: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(args.lag_interval, lags, stop))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(
+        *(stream(session_factory, session_id, args) for session_id in session_ids)
+    )
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    print(
+        f"{label:<7} streams={args.streams:<4} elapsed={elapsed:.2f}s "
+        f"loop_lag_p50={statistics.median(lags) * 1000:.1f}ms "
+        f"loop_lag_p99={percentile(lags, 0.99) * 1000:.1f}ms "
+        f"loop_lag_max={max(lags) * 1000:.1f}ms "
+        f"latency_p50={statistics.median(latencies) * 1000:.0f}ms "
+        f"latency_p99={percentile(latencies, 0.99) * 1000:.0f}ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    pool_options = {}
+    if not args.database_url.startswith("sqlite"):
+        pool_options = {"pool_size": args.pool_size, "max_overflow": args.pool_size}
+    sync_engine = create_engine(args.database_url, **pool_options)
+    async_engine = create_async_engine(to_async_url(args.database_url), **pool_options)
+    if sync_engine.dialect.name == "sqlite":
+        Base.metadata.create_all(sync_engine)
+    sync_factory = sessionmaker(bind=sync_engine, autoflush=False)
+    async_factory = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async with async_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_sessions = [
+            ChatSession(user_id=user.id, summary="benchmark")
+            for _ in range(args.streams)
+        ]
+        db.add_all(chat_sessions)
+        await db.flush()
+        session_ids = [chat_session.id for chat_session in chat_sessions]
+        db.add_all(
+            Message(
+                session_id=session_id,
+                content=f"history {index}",
+                is_user=index % 2 == 0,
+                token_count=50,
+            )
+            for session_id in session_ids
+            for index in range(args.history)
+        )
+        await db.commit()
+        try:
+            await run("sync", legacy_stream, sync_factory, session_ids, args)
+            await run("async", async_stream, async_factory, session_ids, args)
+        finally:
+            await db.execute(delete(Message).where(Message.session_id.in_(session_ids)))
+            await db.execute(delete(ChatSession).where(ChatSession.id.in_(session_ids)))
+            await db.delete(user)
+            await db.commit()
+
+    sync_engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--history", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=config.CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--inter-token-delay", type=float, default=0.01)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--lag-interval", type=float, default=0.005)
+    parser.add_argument("--query-latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,192 @@
+"""
+Redisのキャッシュだけの場合と、プロセス内のL1キャッシュを手前に置いた場合で、メッセージ一覧の読み込みの時間と
+ヒット率を比較し、別のワーカーのL1キャッシュに無効化が届くまでの時間を計測する
+
+--readers 個のクライアントが --sessions 個のスレッドのメッセージを読み続け、--write-interval 秒ごとに
+ランダムなスレッドにターンを保存する（保存のたびにそのスレッドのキャッシュが無効化される）。
+無効化の計測では、別のRedisクライアントで購読する2つ目のL1キャッシュに値を置き、キーを削除してから
+そのL1キャッシュから消えるまでの時間を計る。
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.l1_cache --readers 50 --duration 10
+    cd backend && python -m benchmarks.l1_cache --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from typing import List
+
+import redis.asyncio
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.message_persistence import turn_messages
+from benchmarks.redis_event_loop import default_redis_url, percentile
+from infrastructure.cache.local_cache import LocalCache, local_cache
+from infrastructure.cache.redis.cache_invalidation_listener import (
+    CacheInvalidationListener,
+)
+from infrastructure.cache.redis.message_page_cache import MessagePageCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+import utilities.metrics as metrics
+
+
+async def run(
+    label: str,
+    session_factory,
+    redis_repository: RedisRepository,
+    session_ids: List[int],
+    args: argparse.Namespace,
+) -> None:
+    local_cache.enabled = label == "l1"
+    local_cache.clear()
+    before = metrics.snapshot()["counters"]
+    latencies: List[float] = []
+    stop = asyncio.Event()
+
+    async def reader() -> None:
+        while not stop.is_set():
+            async with session_factory() as db:
+                repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+                started = time.perf_counter()
+                await repository.get_messages_by_session_id(random.choice(session_ids))
+                latencies.append(time.perf_counter() - started)
+            # 他のタスクにイベントループを譲る
+            await asyncio.sleep(0)
+
+    async def writer() -> None:
+        index = 0
+        while not stop.is_set():
+            await asyncio.sleep(args.write_interval)
+            async with session_factory() as db:
+                repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+                await repository.create_messages(
+                    turn_messages(random.choice(session_ids), index)
+                )
+            index += 1
+
+    tasks = [asyncio.create_task(reader()) for _ in range(args.readers)]
+    tasks.append(asyncio.create_task(writer()))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("l1_cache_hits", 0) - before.get("l1_cache_hits", 0)
+    print(
+        f"{label:<6} reads/s={len(latencies) / args.duration:<8.0f} "
+        f"l1_hit_ratio={hits / max(len(latencies), 1):.1%} "
+        f"read_p50={statistics.median(latencies) * 1000:.3f}ms "
+        f"read_p99={percentile(latencies, 0.99) * 1000:.3f}ms "
+        f"l1_bytes={metrics.snapshot()['gauges'].get('l1_cache_bytes', 0):.0f}"
+    )
+
+
+async def measure_invalidation(
+    redis_repository: RedisRepository, args: argparse.Namespace
+) -> None:
+    """別のワーカーを想定した2つ目のL1キャッシュに、無効化が届くまでの時間を計る"""
+    local_cache.enabled = True
+    other_client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    other_cache = LocalCache()
+    listener = CacheInvalidationListener(other_client, other_cache)
+    await listener.start()
+    while not other_cache.active:
+        await asyncio.sleep(0.01)
+
+    # 削除の応答までの時間と、応答からもう1つのL1キャッシュで消えるまでの時間を分けて記録する
+    writes: List[float] = []
+    deliveries: List[float] = []
+    key = f"benchmark_l1_{uuid.uuid4().hex}"
+    for _ in range(args.probes):
+        other_cache.set(key, None, ["value"], other_cache.token())
+        started = time.perf_counter()
+        await redis_repository.delete([key])
+        written = time.perf_counter()
+        while other_cache.get(key) is not None:
+            # Redisと同じCPUで動かす場合に、Redisの処理を妨げないよう短く待つ
+            await asyncio.sleep(0.0002)
+        writes.append(written - started)
+        deliveries.append(time.perf_counter() - written)
+    for name, latencies in (("write", writes), ("delivered_after_write", deliveries)):
+        print(
+            f"invalidation {name:<22} probes={args.probes} "
+            f"p50={statistics.median(latencies) * 1000:.3f}ms "
+            f"p99={percentile(latencies, 0.99) * 1000:.3f}ms "
+            f"max={max(latencies) * 1000:.3f}ms"
+        )
+    await listener.stop()
+    await other_client.aclose()
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    redis_repository = RedisRepository(client)
+    listener = CacheInvalidationListener(client)
+    local_cache.enabled = True
+    await listener.start()
+    while not local_cache.active:
+        await asyncio.sleep(0.01)
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_sessions = [
+            ChatSession(user_id=user.id, summary="benchmark")
+            for _ in range(args.sessions)
+        ]
+        db.add_all(chat_sessions)
+        await db.commit()
+        session_ids = [chat_session.id for chat_session in chat_sessions]
+        try:
+            repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+            for session_id in session_ids:
+                for index in range(args.turns):
+                    await repository.create_messages(turn_messages(session_id, index))
+            for label in ("redis", "l1"):
+                await run(label, session_factory, redis_repository, session_ids, args)
+            await measure_invalidation(redis_repository, args)
+        finally:
+            await MessagePageCache(redis_repository).discard(session_ids)
+            await db.execute(delete(Message).where(Message.session_id.in_(session_ids)))
+            for chat_session in chat_sessions:
+                await db.delete(chat_session)
+            await db.delete(user)
+            await db.commit()
+    await listener.stop()
+    await client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--write-interval", type=float, default=0.5)
+    parser.add_argument("--probes", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+ターン毎にChatOpenAIを生成する旧実装と、LLMClientRegistryでクライアントを共有する実装の比較
+
+フェイクのOpenAI互換サーバーに対してストリーミングを行い、
+TTFT（最初のトークンまでの時間）とサーバー側で開かれたTCPコネクション数を計測する。
+
+    cd backend && python -m benchmarks.llm_client_pool --turns 50 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+from langchain_openai import ChatOpenAI
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from tools.fake_openai_server import FakeOpenAIServer
+
+API_KEY = "sk-fake"
+
+
+async def stream_once(llm: ChatOpenAI) -> float:
+    start = time.perf_counter()
+    ttft = None
+    async for _ in llm.astream("hello"):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft or 0.0
+
+
+async def run_turns(
+    make_llm: Callable[[], ChatOpenAI], turns: int, concurrency: int
+) -> List[float]:
+    ttfts: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn() -> None:
+        async with semaphore:
+            ttfts.append(await stream_once(make_llm()))
+
+    await asyncio.gather(*(turn() for _ in range(turns)))
+    return ttfts
+
+
+def report(label: str, server: FakeOpenAIServer, ttfts: List[float]) -> None:
+    ttfts = sorted(ttfts)
+    p99 = ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.99))]
+    print(
+        f"{label:<10} connections={server.connections_opened:<5} "
+        f"requests={server.requests_served:<5} "
+        f"ttft_mean={statistics.mean(ttfts) * 1000:.2f}ms "
+        f"ttft_p99={p99 * 1000:.2f}ms"
+    )
+
+
+async def bench(
+    label: str,
+    make_llm_factory: Callable[[str], Callable[[], ChatOpenAI]],
+    args: argparse.Namespace,
+    cleanup: Callable[[], Awaitable[None]] = None,
+) -> None:
+    async with FakeOpenAIServer(ttft=args.ttft, token_count=args.tokens) as server:
+        ttfts = await run_turns(
+            make_llm_factory(server.base_url), args.turns, args.concurrency
+        )
+        report(label, server, ttfts)
+        if cleanup is not None:
+            await cleanup()
+
+
+async def main(args: argparse.Namespace) -> None:
+    def per_turn(base_url: str) -> Callable[[], ChatOpenAI]:
+        # 旧実装: ターン毎にHTTPクライアントごと生成する
+        return lambda: ChatOpenAI(
+            model="gpt-4o",
+            temperature=0.5,
+            streaming=True,
+            openai_api_key=API_KEY,
+            openai_api_base=base_url,
+        )
+
+    registries: List[LLMClientRegistry] = []
+
+    def pooled(base_url: str) -> Callable[[], ChatOpenAI]:
+        registry = LLMClientRegistry(api_key=API_KEY, base_url=base_url)
+        registries.append(registry)
+        return lambda: registry.get(model="gpt-4o", temperature=0.5)
+
+    async def close_registries() -> None:
+        for registry in registries:
+            await registry.aclose()
+
+    await bench("per-turn", per_turn, args)
+    await bench("pooled", pooled, args, cleanup=close_registries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,171 @@
+"""
+スレッドのメッセージを OFFSET で読む旧実装と、(session_id, id) のキーセットで読む実装で、
+深いページの読み込みの時間を比較する
+
+--messages 件のメッセージがあるスレッドで、先頭から --depths 件目の位置の1ページ（--limit 件）を
+OFFSET と before カーソルのそれぞれで読む。さらに、最新のページから before カーソルで
+スレッドの先頭までさかのぼる読み込みを、キャッシュがない状態とある状態で計る。
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.message_pagination --messages 100000
+    cd backend && python -m benchmarks.message_pagination --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+import redis.asyncio
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.message_page_cache import MessagePageCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+
+INSERT_BATCH_SIZE = 5000
+
+
+async def measure(session_factory, query, repeat: int) -> float:
+    durations: List[float] = []
+    for _ in range(repeat):
+        async with session_factory() as db:
+            started = time.perf_counter()
+            result = await db.execute(query)
+            result.scalars().all()
+            durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+async def scroll_back(
+    session_factory, redis_repository: RedisRepository, session_id: int, limit: int
+) -> int:
+    """最新のページから before カーソルでスレッドの先頭まで読み、ページ数を返す"""
+    pages, before = 0, None
+    while True:
+        async with session_factory() as db:
+            repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+            messages = await repository.get_messages_by_session_id(
+                session_id, before=before, limit=limit
+            )
+        pages += 1
+        if len(messages) < limit:
+            return pages
+        before = messages[0].id
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    redis_repository = RedisRepository(client)
+    # Redisのキャッシュの効果だけを計るため、プロセス内のL1キャッシュは使わない
+    local_cache.enabled = False
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_session = ChatSession(user_id=user.id, summary="benchmark")
+        db.add(chat_session)
+        await db.commit()
+        session_id = chat_session.id
+        try:
+            for start in range(0, args.messages, INSERT_BATCH_SIZE):
+                await db.execute(
+                    insert(Message),
+                    [
+                        {
+                            "session_id": session_id,
+                            "content": f"message {index}",
+                            "is_user": index % 2 == 0,
+                        }
+                        for index in range(
+                            start, min(start + INSERT_BATCH_SIZE, args.messages)
+                        )
+                    ],
+                )
+            await db.commit()
+            ids = list(
+                (
+                    await db.execute(
+                        select(Message.id)
+                        .where(Message.session_id == session_id)
+                        .order_by(Message.id.asc())
+                    )
+                ).scalars()
+            )
+
+            thread = select(Message).where(Message.session_id == session_id)
+            # コネクションを張る時間を最初の計測に含めない
+            await measure(session_factory, thread.limit(1), 1)
+            for depth in sorted(args.depths):
+                if depth + args.limit > len(ids):
+                    continue
+                offset = await measure(
+                    session_factory,
+                    thread.order_by(Message.id.asc()).offset(depth).limit(args.limit),
+                    args.repeat,
+                )
+                keyset = await measure(
+                    session_factory,
+                    thread.where(Message.id < ids[depth + args.limit])
+                    .order_by(Message.id.desc())
+                    .limit(args.limit),
+                    args.repeat,
+                )
+                print(
+                    f"depth={depth:<8} offset={offset * 1000:.2f}ms "
+                    f"keyset={keyset * 1000:.2f}ms"
+                )
+
+            await MessagePageCache(redis_repository).discard([session_id])
+            for label in ("cold", "warm"):
+                started = time.perf_counter()
+                pages = await scroll_back(
+                    session_factory, redis_repository, session_id, args.limit
+                )
+                elapsed = time.perf_counter() - started
+                print(
+                    f"scroll_back {label:<5} pages={pages:<6} elapsed={elapsed:.2f}s "
+                    f"per_page={elapsed / pages * 1000:.2f}ms"
+                )
+        finally:
+            await MessagePageCache(redis_repository).discard([session_id])
+            await db.execute(delete(Message).where(Message.session_id == session_id))
+            await db.delete(chat_session)
+            await db.delete(user)
+            await db.commit()
+    await client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[0, 1000, 10000, 50000, 90000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+"""
+メッセージを1行ずつ保存する旧実装と、Write-behindでバッチ保存する実装の比較
+
+旧実装は1ターンにつき create_message を2回（それぞれ add / commit / refresh）呼ぶ。
+Write-behindはターンをキューに溜め、複数行の INSERT ... RETURNING で1トランザクションにまとめる。
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.message_persistence --turns 2000
+    cd backend && python -m benchmarks.message_persistence --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from application.services.message_write_behind import MessageWriteBehind
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+
+
+def turn_messages(session_id: int, index: int):
+    return [
+        {"session_id": session_id, "content": f"question {index}", "is_user": True},
+        {
+            "session_id": session_id,
+            "content": f"answer {index} " * 20,
+            "is_user": False,
+        },
+    ]
+
+
+def report(label: str, turns: int, elapsed: float) -> None:
+    rows = turns * 2
+    print(
+        f"{label:<12} turns={turns:<6} rows={rows:<6} "
+        f"elapsed={elapsed:.2f}s inserts_per_sec={rows / elapsed:.0f}"
+    )
+
+
+async def per_row(session_factory, session_id: int, turns: int) -> float:
+    async with session_factory() as db:
+        repository = MessageRepositoryImpl(db=db, redis=None)
+        start = time.perf_counter()
+        for index in range(turns):
+            for message in turn_messages(session_id, index):
+                await repository.create_message(**message)
+        return time.perf_counter() - start
+
+
+async def write_behind(
+    session_factory, session_id: int, turns: int, batch_size: int
+) -> float:
+    service = MessageWriteBehind(batch_size=batch_size, session_factory=session_factory)
+    await service.start()
+    flushed = asyncio.Event()
+    remaining = turns
+
+    def on_flushed() -> None:
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            flushed.set()
+
+    start = time.perf_counter()
+    for index in range(turns):
+        await service.enqueue(turn_messages(session_id, index), on_flushed=on_flushed)
+    await flushed.wait()
+    elapsed = time.perf_counter() - start
+    await service.stop()
+    return elapsed
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_session = ChatSession(user_id=user.id, summary="benchmark")
+        db.add(chat_session)
+        await db.commit()
+        try:
+            report(
+                "per-row",
+                args.turns,
+                await per_row(session_factory, chat_session.id, args.turns),
+            )
+            report(
+                "write-behind",
+                args.turns,
+                await write_behind(
+                    session_factory, chat_session.id, args.turns, args.batch_size
+                ),
+            )
+        finally:
+            await db.execute(
+                delete(Message).where(Message.session_id == chat_session.id)
+            )
+            await db.delete(chat_session)
+            await db.delete(user)
+            await db.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument(
+        "--batch-size", type=int, default=config.WRITE_BEHIND_BATCH_SIZE
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""
+ターンを保存するたびにスレッドのメッセージのキャッシュを削除する旧実装と、保存したメッセージを
+キャッシュのページに追加する実装で、会話中のスレッドのキャッシュヒット率と読み込みの時間を比較する
+
+各スレッドで「ターンを保存してから、クライアントが GET /api/v1/messages/{id} でメッセージを
+--reads 回読み込む」を --turns 回繰り返す。旧実装は保存のたびにキャッシュを削除するので、
+保存後の最初の読み込みは必ずDBから最新のページを読み直す。
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.messages_cache --sessions 20 --turns 30
+    cd backend && python -m benchmarks.messages_cache --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+import redis.asyncio
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.message_persistence import turn_messages
+from benchmarks.redis_event_loop import default_redis_url, percentile
+from infrastructure.cache.redis.message_page_cache import MessagePageCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+import utilities.metrics as metrics
+
+
+async def run(
+    label: str,
+    session_factory,
+    redis_repository: RedisRepository,
+    session_ids: List[int],
+    args: argparse.Namespace,
+) -> None:
+    cache = MessagePageCache(redis_repository)
+    await cache.discard(session_ids)
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("messages_cache_hits", 0)
+    misses = counters.get("messages_cache_misses", 0)
+    latencies: List[float] = []
+
+    async def conversation(session_id: int) -> None:
+        for index in range(args.turns):
+            async with session_factory() as db:
+                repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+                await repository.create_messages(turn_messages(session_id, index))
+                if label == "invalidate":
+                    await cache.discard([session_id])
+            for _ in range(args.reads):
+                async with session_factory() as db:
+                    repository = MessageRepositoryImpl(db=db, redis=redis_repository)
+                    started = time.perf_counter()
+                    await repository.get_messages_by_session_id(session_id)
+                    latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - started
+
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("messages_cache_hits", 0) - hits
+    misses = counters.get("messages_cache_misses", 0) - misses
+    print(
+        f"{label:<10} reads={len(latencies):<6} elapsed={elapsed:.2f}s "
+        f"hit_ratio={hits / max(hits + misses, 1):.1%} "
+        f"read_p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"read_p99={percentile(latencies, 0.99) * 1000:.2f}ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    redis_repository = RedisRepository(client)
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        chat_sessions = [
+            ChatSession(user_id=user.id, summary="benchmark")
+            for _ in range(args.sessions)
+        ]
+        db.add_all(chat_sessions)
+        await db.commit()
+        session_ids = [chat_session.id for chat_session in chat_sessions]
+        try:
+            for label in ("invalidate", "append"):
+                await run(label, session_factory, redis_repository, session_ids, args)
+                await db.execute(
+                    delete(Message).where(Message.session_id.in_(session_ids))
+                )
+                await db.commit()
+        finally:
+            await MessagePageCache(redis_repository).discard(session_ids)
+            await db.execute(delete(Message).where(Message.session_id.in_(session_ids)))
+            for chat_session in chat_sessions:
+                await db.delete(chat_session)
+            await db.delete(user)
+            await db.commit()
+    await client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--reads", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
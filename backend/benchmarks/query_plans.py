@@ -0,0 +1,318 @@
+"""
+リポジトリのホットパスのクエリが、マイグレーション cc29e507c175 の複合インデックスを使うことを
+EXPLAIN で確認し、インデックスがない場合とある場合のレイテンシを比較する（PostgreSQLのみ）
+
+--schema のスキーマにテーブルを作成し、--users 人のユーザー、--sessions 個のセッション（半分ほどは
+期限切れ）、--messages 件のメッセージを generate_series で投入する。各リポジトリのメソッドを
+1回ずつ呼んで実際に発行されたSQLを記録し、ホットパスのインデックスを削除した状態と作成した状態で、
+同じSQLとパラメーターの実行時間と実行計画を取得する。インデックスがある状態で、対象のテーブルを
+Seq Scan で読むクエリや、想定したインデックスを使わないクエリがあれば終了コード1で終了する。
+作成したスキーマは終了時に削除する（--keep で残す）。
+
+リポジトリはキャッシュを読むので Redis も使う。ユーザーID 1 とセッションID 1 のキャッシュを
+削除するので、ローカルの Redis で実行すること。
+
+    cd backend && python -m benchmarks.query_plans --messages 2000000
+    cd backend && python -m benchmarks.query_plans --messages 10000000 --keep
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.chat_session_index_cache import ChatSessionIndexCache
+from infrastructure.cache.redis.message_page_cache import MessagePageCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import Message
+from infrastructure.database.models.user import User  # noqa: F401  テーブルの作成に必要
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
+from infrastructure.repositories.message import MessageRepositoryImpl
+import utilities.config as config
+
+# テーブルごとに、ホットパスのクエリが使うべきインデックス
+HOT_PATH_INDEXES = {
+    "messages": "ix_messages_session_id_id",
+    "chat_sessions": "ix_chat_sessions_user_id_end_time",
+}
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (username, email)
+    SELECT 'benchmark ' || i, 'benchmark-' || i || '@example.com'
+    FROM generate_series(1, :users) AS i
+    """,
+    # 開始時刻を直近60日に散らし、30日で期限切れにする
+    """
+    INSERT INTO chat_sessions (user_id, summary, start_time, end_time)
+    SELECT 1 + i % :users, 'benchmark ' || i, start_time,
+        start_time + interval '30 days'
+    FROM (
+        SELECT i, (now() AT TIME ZONE 'utc') - random() * interval '60 days'
+            AS start_time
+        FROM generate_series(0, :sessions - 1) AS i
+    ) AS seeded
+    """,
+    """
+    INSERT INTO messages (session_id, content, is_user, token_count)
+    SELECT 1 + i % :sessions, 'message ' || i, i % 2 = 0, 10 + i % 50
+    FROM generate_series(0, :messages - 1) AS i
+    """,
+]
+
+Query = Tuple[str, str, str, Any]
+
+
+def plan_scans(node: Dict[str, Any]) -> List[Tuple[str, str, Optional[str]]]:
+    """実行計画から、テーブルかインデックスを読むノードの (ノードの種類, テーブル, インデックス) を集める"""
+    scans = []
+    # Bitmap Index Scan はインデックス名だけを持つ（テーブルは親の Bitmap Heap Scan が読む）
+    if "Relation Name" in node or "Index Name" in node:
+        scans.append(
+            (node["Node Type"], node.get("Relation Name", ""), node.get("Index Name"))
+        )
+    for child in node.get("Plans", []):
+        scans.extend(plan_scans(child))
+    return scans
+
+
+async def measure(
+    connection: AsyncConnection, statement: str, parameters: Any, repeat: int
+) -> float:
+    durations: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await connection.exec_driver_sql(statement, parameters)
+        result.fetchall()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+async def explain(
+    connection: AsyncConnection, statement: str, parameters: Any
+) -> List[Tuple[str, str, Optional[str]]]:
+    result = await connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + statement, parameters
+    )
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan_scans(plan[0]["Plan"])
+
+
+async def capture_queries(
+    engine: AsyncEngine, redis_repository: RedisRepository
+) -> List[Query]:
+    """各リポジトリのメソッドを呼び、発行された (ラベル, テーブル, SQL, パラメーター) を返す"""
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    session_id, user_id = 1, 1
+    async with session_factory() as db:
+        ids = (
+            await db.execute(
+                select(Message.id)
+                .where(Message.session_id == session_id)
+                .order_by(Message.id)
+            )
+        ).scalars()
+        ids = list(ids)
+    middle = ids[len(ids) // 2]
+
+    calls = {
+        "messages_latest": lambda messages, _: messages.get_messages_by_session_id(
+            session_id
+        ),
+        "messages_before": lambda messages, _: messages.get_messages_by_session_id(
+            session_id, before=middle
+        ),
+        "messages_after": lambda messages, _: messages.get_messages_by_session_id(
+            session_id, after=middle
+        ),
+        "messages_budget": lambda messages, _: (
+            messages.get_recent_messages_within_budget(
+                session_id, config.CONTEXT_TOKEN_BUDGET
+            )
+        ),
+        "messages_range": lambda messages, _: messages.get_messages_in_range(
+            session_id, middle
+        ),
+        "chat_sessions_active": lambda _, chat_sessions: (
+            chat_sessions.get_chat_session_by_user_id(user_id)
+        ),
+    }
+    captured: List[Tuple[str, Any]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((statement, parameters))
+
+    queries: List[Query] = []
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        for label, call in calls.items():
+            # キャッシュから読まずにDBへクエリさせる
+            await MessagePageCache(redis_repository).discard([session_id])
+            await ChatSessionIndexCache(redis_repository).discard(user_id)
+            captured.clear()
+            async with session_factory() as db:
+                await call(
+                    MessageRepositoryImpl(db=db, redis=redis_repository),
+                    ChatSessionRepositoryImpl(db=db, redis=redis_repository),
+                )
+            table = label.rsplit("_", 1)[0]
+            queries.extend(
+                (label, table, statement, parameters)
+                for statement, parameters in captured
+            )
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+        await MessagePageCache(redis_repository).discard([session_id])
+        await ChatSessionIndexCache(redis_repository).discard(user_id)
+    return queries
+
+
+async def run(
+    engine: AsyncEngine, queries: List[Query], repeat: int
+) -> List[Tuple[float, List[Tuple[str, str, Optional[str]]]]]:
+    results = []
+    async with engine.connect() as connection:
+        for _, _, statement, parameters in queries:
+            scans = await explain(connection, statement, parameters)
+            latency = await measure(connection, statement, parameters, repeat)
+            results.append((latency, scans))
+    return results
+
+
+def describe(scans: List[Tuple[str, str, Optional[str]]]) -> str:
+    return ", ".join(
+        node_type
+        + (f" on {relation}" if relation else "")
+        + (f" using {index}" if index else "")
+        for node_type, relation, index in scans
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(
+        to_async_url(args.database_url),
+        connect_args={"server_settings": {"search_path": args.schema}},
+    )
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("query_plans supports PostgreSQL only")
+    ddl_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    redis_repository = RedisRepository(client)
+    # プロセス内のL1キャッシュから読まずにクエリを発行させる
+    local_cache.enabled = False
+    hot_path_indexes = [
+        index
+        for table in (Message.__table__, ChatSession.__table__)
+        for index in table.indexes
+        if index.name in HOT_PATH_INDEXES.values()
+    ]
+
+    failures: List[str] = []
+    try:
+        async with ddl_engine.connect() as connection:
+            await connection.execute(
+                text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE')
+            )
+            await connection.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+            await connection.run_sync(Base.metadata.create_all)
+            # マイグレーション前の状態（主キーのインデックスだけ）にする
+            for index in hot_path_indexes:
+                await connection.run_sync(index.drop)
+
+            started = time.perf_counter()
+            for statement in SEED_STATEMENTS:
+                await connection.execute(
+                    text(statement),
+                    {
+                        "users": args.users,
+                        "sessions": args.sessions,
+                        "messages": args.messages,
+                    },
+                )
+            await connection.execute(text("VACUUM ANALYZE"))
+            print(
+                f"seeded users={args.users} sessions={args.sessions} "
+                f"messages={args.messages} in {time.perf_counter() - started:.1f}s"
+            )
+
+        queries = await capture_queries(engine, redis_repository)
+        before = await run(engine, queries, args.repeat)
+
+        async with ddl_engine.connect() as connection:
+            for index in hot_path_indexes:
+                started = time.perf_counter()
+                await connection.run_sync(index.create)
+                print(f"created {index.name} in {time.perf_counter() - started:.1f}s")
+            await connection.execute(text("VACUUM ANALYZE"))
+        after = await run(engine, queries, args.repeat)
+
+        for (
+            (label, table, _, _),
+            (before_latency, before_scans),
+            (
+                after_latency,
+                after_scans,
+            ),
+        ) in zip(queries, before, after):
+            print(
+                f"{label:<22} before={before_latency * 1000:8.2f}ms "
+                f"after={after_latency * 1000:8.2f}ms"
+            )
+            print(f"{'':<22} before: {describe(before_scans)}")
+            print(f"{'':<22} after:  {describe(after_scans)}")
+            expected = HOT_PATH_INDEXES[table]
+            if any(
+                node_type == "Seq Scan" and relation in HOT_PATH_INDEXES
+                for node_type, relation, _ in after_scans
+            ):
+                failures.append(f"{label}: sequential scan ({describe(after_scans)})")
+            elif not any(index == expected for _, _, index in after_scans):
+                failures.append(f"{label}: {expected} is not used")
+    finally:
+        if not args.keep:
+            async with ddl_engine.connect() as connection:
+                await connection.execute(
+                    text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE')
+                )
+        await client.aclose()
+        await engine.dispose()
+
+    if failures:
+        print("\n".join(["FAILED"] + failures))
+        sys.exit(1)
+    print("OK: every hot path query uses its index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--schema", default="benchmark_query_plans")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=200000)
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,212 @@
+"""
+同期のredisクライアントでキャッシュを操作する旧実装と、redis.asyncio を使う RedisRepository で、
+キャッシュへのアクセスが多い状態で回答をストリーミングしたときのイベントループの遅延を比較する
+
+各ストリームはトークンごとにキャッシュの get と set を行い、最後に delete でキャッシュを無効化する。
+旧実装はコマンドの応答を待つ間イベントループを止めるので、他のストリームのトークン送信や
+ループの遅延を計測するタスクまで待たされる。--added-latency を指定すると、ネットワーク越しの
+Redisを模擬して、往復ごとに指定した秒数だけ遅らせるプロキシを経由して接続する。
+
+    cd backend && python -m benchmarks.redis_event_loop --streams 200
+    cd backend && python -m benchmarks.redis_event_loop --added-latency 0.001
+    cd backend && python -m benchmarks.redis_event_loop --redis-url redis://localhost:6379/0
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from typing import Any, List, Tuple
+
+import redis
+import redis.asyncio
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from infrastructure.cache.redis.redis_repository import RedisRepository
+import utilities.config as config
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def monitor_lag(interval: float, lags: List[float], stop: asyncio.Event):
+    """interval ごとに起きる予定のタスクが、実際にどれだけ遅れて起きたかを記録する"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(time.perf_counter() - expected, 0.0))
+
+
+class LegacyRedisRepository:
+    """同期クライアントを使っていた頃の RedisRepository と同じ操作"""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+
+    def set(self, key: str, value: Any, expiration: int):
+        self.client.set(key, json.dumps(value), ex=expiration)
+
+    def get(self, key: str) -> Any:
+        data = self.client.get(key)
+        if data is None:
+            raise KeyError(f"{key} not found in Redis")
+        return json.loads(data)
+
+    def delete(self, patterns: List[str]):
+        for pattern in patterns:
+            for key in self.client.scan_iter(match=pattern):
+                self.client.delete(key)
+
+
+def cached_value(args: argparse.Namespace) -> List[dict]:
+    return [
+        {"id": index, "content": "x" * args.value_size, "is_user": index % 2 == 0}
+        for index in range(args.value_items)
+    ]
+
+
+async def legacy_stream(
+    repository: LegacyRedisRepository, key: str, args: argparse.Namespace
+) -> float:
+    started = time.perf_counter()
+    value = cached_value(args)
+    for _ in range(args.tokens):
+        await asyncio.sleep(args.inter_token_delay)
+        try:
+            repository.get(key)
+        except KeyError:
+            pass
+        repository.set(key, value, 60)
+    repository.delete([key])
+    return time.perf_counter() - started
+
+
+async def async_stream(
+    repository: RedisRepository, key: str, args: argparse.Namespace
+) -> float:
+    started = time.perf_counter()
+    value = cached_value(args)
+    for _ in range(args.tokens):
+        await asyncio.sleep(args.inter_token_delay)
+        try:
+            await repository.get(key)
+        except Exception:
+            pass
+        await repository.set(key, value, 60)
+    await repository.delete([key])
+    return time.perf_counter() - started
+
+
+async def run(label: str, stream, repository, args: argparse.Namespace) -> None:
+    prefix = f"benchmark_{uuid.uuid4().hex[:8]}"
+    keys = [f"{prefix}_{index}" for index in range(args.streams)]
+    # コネクションの確立を計測から除く
+    await asyncio.gather(*(stream(repository, key, args) for key in keys[:10]))
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(args.lag_interval, lags, stop))
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(stream(repository, key, args) for key in keys))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    operations = args.streams * (args.tokens * 2 + 1)
+    print(
+        f"{label:<7} streams={args.streams:<4} elapsed={elapsed:.2f}s "
+        f"ops/s={operations / elapsed:.0f} "
+        f"loop_lag_p50={statistics.median(lags) * 1000:.1f}ms "
+        f"loop_lag_p99={percentile(lags, 0.99) * 1000:.1f}ms "
+        f"loop_lag_max={max(lags) * 1000:.1f}ms "
+        f"latency_p50={statistics.median(latencies) * 1000:.0f}ms "
+        f"latency_p99={percentile(latencies, 0.99) * 1000:.0f}ms"
+    )
+
+
+def start_latency_proxy(host: str, port: int, latency: float) -> Tuple[str, int]:
+    """
+    別スレッドのイベントループで、Redisとの間の各方向に latency / 2 ずつ遅延を入れるプロキシを起動する
+    """
+    ready = threading.Event()
+    address: List[Tuple[str, int]] = []
+
+    async def pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(latency / 2)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        await asyncio.gather(
+            pipe(client_reader, upstream_writer),
+            pipe(upstream_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        address.append(server.sockets[0].getsockname()[:2])
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+    return address[0]
+
+
+async def main(args: argparse.Namespace) -> None:
+    options = redis.connection.parse_url(args.redis_url)
+    if args.added_latency:
+        options["host"], options["port"] = start_latency_proxy(
+            options.get("host", "localhost"),
+            options.get("port", 6379),
+            args.added_latency,
+        )
+    options.update(decode_responses=True, max_connections=args.max_connections)
+
+    # 旧実装も接続の上限に達したらエラーにせず待つ
+    sync_pool = redis.BlockingConnectionPool(**options)
+    legacy = LegacyRedisRepository(redis.Redis(connection_pool=sync_pool))
+    async_pool = redis.asyncio.BlockingConnectionPool(**options)
+    async_client = redis.asyncio.Redis(connection_pool=async_pool)
+
+    try:
+        await run("sync", legacy_stream, legacy, args)
+        await run("async", async_stream, RedisRepository(async_client), args)
+    finally:
+        sync_pool.disconnect()
+        await async_client.aclose()
+        await async_pool.disconnect()
+
+
+def default_redis_url() -> str:
+    password = f":{config.REDIS_PASSWORD}@" if config.REDIS_PASSWORD else ""
+    return (
+        f"redis://{password}{config.REDIS_HOST or 'localhost'}:"
+        f"{config.REDIS_PORT or 6379}/{config.REDIS_DB}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--inter-token-delay", type=float, default=0.01)
+    parser.add_argument("--value-items", type=int, default=20)
+    parser.add_argument("--value-size", type=int, default=200)
+    parser.add_argument("--max-connections", type=int, default=50)
+    parser.add_argument("--lag-interval", type=float, default=0.005)
+    parser.add_argument("--added-latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
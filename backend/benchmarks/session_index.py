@@ -0,0 +1,174 @@
+"""
+セッションを作成するたびにユーザーのセッション一覧のキャッシュを削除する旧実装と、ソート済みセットのインデックスに
+追加する実装で、セッション一覧の読み込みの時間とDBクエリの数を比較する
+
+--sessions 個の有効なセッションがあるユーザーで、セッションを1つ作成するたびに一覧の最新のページを
+--reads 回読む。これを --creations 回繰り返す。
+
+- invalidate: 作成のたびにインデックスを削除する（次の読み込みで全件をDBから読み直す）
+- index: 作成したセッションをインデックスに追加する（一覧をDBから読み直さない）
+
+最後に、before カーソルで一覧の末尾までさかのぼる読み込みの時間を計る。
+ベンチマーク用のユーザーとセッションを作成し、終了時に削除する。
+
+    cd backend && python -m benchmarks.session_index --sessions 1000
+    cd backend && python -m benchmarks.session_index --database-url sqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+import redis.asyncio
+from sqlalchemy import delete, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from benchmarks.redis_event_loop import default_redis_url, percentile
+from infrastructure.cache.local_cache import local_cache
+from infrastructure.cache.redis.chat_session_index_cache import ChatSessionIndexCache
+from infrastructure.cache.redis.redis_repository import RedisRepository
+from infrastructure.database.connection import Base, to_async_url
+from infrastructure.database.models.chat_session import ChatSession
+from infrastructure.database.models.message import (
+    Message,
+)  # noqa: F401  リレーションの解決に必要
+from infrastructure.database.models.user import User
+from infrastructure.repositories.chat_session import ChatSessionRepositoryImpl
+import utilities.config as config
+import utilities.metrics as metrics
+
+
+def new_session(user_id: int, index: int) -> ChatSession:
+    now = datetime.utcnow()
+    return ChatSession(
+        user_id=user_id,
+        summary=f"benchmark {index}",
+        start_time=now,
+        end_time=now + timedelta(days=1),
+    )
+
+
+async def run(
+    label: str,
+    engine,
+    session_factory,
+    redis_repository: RedisRepository,
+    user_id: int,
+    args: argparse.Namespace,
+) -> None:
+    await ChatSessionIndexCache(redis_repository).discard(user_id)
+    before = metrics.snapshot()["counters"]
+    queries = 0
+
+    def count_query(conn, cursor, statement, *args) -> None:
+        nonlocal queries
+        if (
+            statement.lstrip().startswith("SELECT")
+            and "FROM chat_sessions" in statement
+        ):
+            queries += 1
+
+    latencies: List[float] = []
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+    for index in range(args.creations):
+        async with session_factory() as db:
+            repository = ChatSessionRepositoryImpl(db=db, redis=redis_repository)
+            chat_session = new_session(user_id, index)
+            db.add(chat_session)
+            await db.commit()
+            if label == "index":
+                await repository.add_to_session_index(chat_session)
+            else:
+                await ChatSessionIndexCache(redis_repository).discard(user_id)
+            for _ in range(args.reads):
+                started = time.perf_counter()
+                await repository.get_chat_session_by_user_id(user_id, limit=args.limit)
+                latencies.append(time.perf_counter() - started)
+    event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("chat_sessions_index_hits", 0) - before.get(
+        "chat_sessions_index_hits", 0
+    )
+    print(
+        f"{label:<10} creations={args.creations:<5} "
+        f"db_list_queries={queries:<5} "
+        f"redis_hit_ratio={hits / max(len(latencies), 1):.1%} "
+        f"read_p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"read_p99={percentile(latencies, 0.99) * 1000:.2f}ms"
+    )
+
+
+async def scroll_back(
+    session_factory, redis_repository: RedisRepository, user_id: int, limit: int
+) -> None:
+    """最新のページから before カーソルで一覧の末尾まで読む"""
+    pages, before, before_id = 0, None, None
+    started = time.perf_counter()
+    while True:
+        async with session_factory() as db:
+            repository = ChatSessionRepositoryImpl(db=db, redis=redis_repository)
+            chat_sessions = await repository.get_chat_session_by_user_id(
+                user_id, before=before, limit=limit, before_id=before_id
+            )
+        pages += 1
+        if len(chat_sessions) < limit:
+            break
+        before, before_id = chat_sessions[-1].start_time, chat_sessions[-1].id
+    elapsed = time.perf_counter() - started
+    print(
+        f"scroll_back pages={pages:<5} elapsed={elapsed:.2f}s "
+        f"per_page={elapsed / pages * 1000:.2f}ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(
+        bind=engine, autoflush=False, expire_on_commit=False
+    )
+    client = redis.asyncio.Redis.from_url(args.redis_url, decode_responses=True)
+    redis_repository = RedisRepository(client)
+    # Redisのキャッシュの効果だけを計るため、プロセス内のL1キャッシュは使わない
+    local_cache.enabled = False
+
+    async with session_factory() as db:
+        user = User(
+            username="benchmark", email=f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        db.add(user)
+        await db.flush()
+        db.add_all([new_session(user.id, index) for index in range(args.sessions)])
+        await db.commit()
+        try:
+            for label in ("invalidate", "index"):
+                await run(
+                    label, engine, session_factory, redis_repository, user.id, args
+                )
+            await scroll_back(session_factory, redis_repository, user.id, args.limit)
+        finally:
+            await ChatSessionIndexCache(redis_repository).discard(user.id)
+            await db.execute(delete(ChatSession).where(ChatSession.user_id == user.id))
+            await db.delete(user)
+            await db.commit()
+    await client.aclose()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.POSTGRES_URL)
+    parser.add_argument("--redis-url", default=default_redis_url())
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--creations", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""
+クライアントが回答の途中で切断した場合に、上流のLLMがどれだけトークンを生成し続けるかの比較
+
+送信時の例外でしか切断に気付かない旧実装と、受信側で切断を監視して
+ストリームをキャンセルする stream_to_websocket を、フェイクのOpenAI互換サーバーに対して実行する。
+サーバーが各ストリームで実際に送ったトークン数を記録しているので、切断後の無駄な生成量が分かる。
+
+    cd backend && python -m benchmarks.stream_cancellation --streams 20 --disconnect-after 0.3
+"""
+
+import argparse
+import asyncio
+import statistics
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Dict, List
+
+from fastapi import WebSocketDisconnect
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from application.services.stream_flush_policy import AdaptiveFlushPolicy, flush_chunks
+from application.services.websocket_stream import stream_to_websocket
+from infrastructure.llm.llm_client_registry import LLMClientRegistry
+from tools.fake_openai_server import FakeOpenAIServer
+
+API_KEY = "sk-fake"
+
+
+class DisconnectingWebSocket:
+    """指定した時間が経つとクライアントが切断したことになるWebSocketの代わり"""
+
+    def __init__(self, disconnect_after: float):
+        self._disconnected = asyncio.Event()
+        asyncio.get_running_loop().call_later(disconnect_after, self._disconnected.set)
+
+    async def send_json(self, data: Dict[str, Any]) -> None:
+        if self._disconnected.is_set():
+            raise WebSocketDisconnect(code=1001)
+        await asyncio.sleep(0)
+
+    async def receive(self) -> Dict[str, Any]:
+        await self._disconnected.wait()
+        return {"type": "websocket.disconnect", "code": 1001}
+
+
+async def legacy_chunks(registry: LLMClientRegistry) -> AsyncGenerator[str, None]:
+    # 旧実装: 内側のストリームを明示的には閉じない
+    llm = registry.get(model="gpt-4o", temperature=0.5)
+    tokens = (chunk.content async for chunk in llm.astream("hello"))
+    async for chunk in flush_chunks(tokens, AdaptiveFlushPolicy(), []):
+        yield chunk
+
+
+async def chunks(registry: LLMClientRegistry) -> AsyncGenerator[str, None]:
+    # AgentService と同じく、閉じられた場合は上流のレスポンスまで順に閉じる
+    llm = registry.get(model="gpt-4o", temperature=0.5)
+    stream = registry.cancellable_stream(llm.astream("hello"))
+    tokens = (chunk.content async for chunk in stream)
+    async with aclosing(stream), aclosing(tokens), aclosing(
+        flush_chunks(tokens, AdaptiveFlushPolicy(), [])
+    ) as flushed:
+        async for chunk in flushed:
+            yield chunk
+
+
+async def legacy(websocket: DisconnectingWebSocket, registry: LLMClientRegistry):
+    # 旧実装: 送信に失敗するまで切断に気付かない
+    async for chunk in legacy_chunks(registry):
+        await websocket.send_json({"content": chunk})
+
+
+async def cancelling(websocket: DisconnectingWebSocket, registry: LLMClientRegistry):
+    await stream_to_websocket(
+        websocket, chunks(registry), lambda chunk: {"content": chunk}
+    )
+
+
+async def bench(label: str, handler, args: argparse.Namespace) -> None:
+    async with FakeOpenAIServer(
+        ttft=args.ttft,
+        inter_token_delay=args.inter_token_delay,
+        token_count=args.tokens,
+    ) as server:
+        registry = LLMClientRegistry(api_key=API_KEY, base_url=server.base_url)
+        # クライアントの生成や接続のコストを計測から除く
+        async for _ in registry.get(model="gpt-4o", temperature=0.5).astream("warmup"):
+            pass
+        server.streams.clear()
+
+        async def one() -> None:
+            try:
+                await handler(DisconnectingWebSocket(args.disconnect_after), registry)
+            except WebSocketDisconnect:
+                pass
+
+        await asyncio.gather(*(one() for _ in range(args.streams)))
+        # 切断後もサーバーが送り続けたトークンが記録されるまで待つ
+        await asyncio.sleep(args.settle)
+        await registry.aclose()
+
+        sent: List[int] = [stream.tokens_sent for stream in server.streams]
+        print(
+            f"{label:<11} streams={len(sent):<4} "
+            f"tokens_sent_mean={statistics.mean(sent):.1f}/{args.tokens} "
+            f"tokens_sent_max={max(sent)}"
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    await bench("legacy", legacy, args)
+    await bench("cancelling", cancelling, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--inter-token-delay", type=float, default=0.01)
+    parser.add_argument("--disconnect-after", type=float, default=0.3)
+    parser.add_argument("--settle", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+"""
+ストリーミング時のチャンクのフラッシュ処理のマイクロベンチマーク
+
+合成した100kトークンを、旧実装（文字列連結 + 25文字/1秒）と flush_chunks の各ポリシーで処理し、
+処理時間・フラッシュ回数・最初のチャンクまでの時間を比較する。
+
+    cd backend && python -m benchmarks.stream_flush --tokens 100000 --send-latency 0.0005
+"""
+
+import argparse
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, Callable, List
+
+import benchmarks  # noqa: F401  app ディレクトリをパスに追加
+from application.services.stream_flush_policy import (
+    AdaptiveFlushPolicy,
+    FixedFlushPolicy,
+    flush_chunks,
+)
+
+
+async def synthetic_tokens(count: int) -> AsyncGenerator[str, None]:
+    for index in range(count):
+        yield f"tok{index % 10} "
+
+
+async def legacy_flush(contents: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+    """ベースラインの _process_llm と同じ処理"""
+    full_response = ""
+    accumulated_content = ""
+    chunk_size = 25
+    last_send_time = asyncio.get_event_loop().time()
+    time_threshold = 1.0
+    async for content in contents:
+        full_response += content
+        accumulated_content += content
+        current_time = asyncio.get_event_loop().time()
+        if (
+            len(accumulated_content) >= chunk_size
+            or (current_time - last_send_time) >= time_threshold
+        ):
+            yield accumulated_content
+            accumulated_content = ""
+            last_send_time = current_time
+    if accumulated_content:
+        yield accumulated_content
+
+
+async def run(
+    label: str,
+    make_stream: Callable[[AsyncIterator[str]], AsyncIterator[str]],
+    args: argparse.Namespace,
+) -> None:
+    start = time.perf_counter()
+    first_chunk = None
+    flushes = 0
+    async for _ in make_stream(synthetic_tokens(args.tokens)):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        flushes += 1
+        # WebSocketへの送信を模擬する
+        if args.send_latency:
+            await asyncio.sleep(args.send_latency)
+        else:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<10} total={elapsed * 1000:9.1f}ms flushes={flushes:<7} "
+        f"first_chunk={first_chunk * 1e6:8.1f}us"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    def with_policy(policy_factory):
+        def make_stream(contents: AsyncIterator[str]) -> AsyncIterator[str]:
+            collected: List[str] = []
+            return flush_chunks(contents, policy_factory(), collected)
+
+        return make_stream
+
+    await run("legacy", legacy_flush, args)
+    await run("fixed", with_policy(FixedFlushPolicy), args)
+    await run("adaptive", with_policy(AdaptiveFlushPolicy), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=100_000)
+    parser.add_argument("--send-latency", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,316 @@
+"""
+OpenAI互換のchat completions（SSEストリーミング）を返すローカル用のフェイクサーバー
+
+ネットワークやAPIキーなしで AgentService / ChatOpenAI を動かし、
+レイテンシやスループット、コネクションの再利用を再現性のある形で計測するために使う。
+TTFT・トークン間の遅延・トークン数に加えて、エラーの注入やストリーム途中での切断を設定できる。
+
+    cd backend && python -m tools.fake_openai_server --port 8100 --ttft 0.3 --tokens 200
+
+アプリケーションからは以下の環境変数で接続する。
+
+    OPENAI_BASE_URL=http://localhost:8100/v1
+    OPENAI_API_KEY=sk-fake
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamRecord:
+    """1回のストリーミングレスポンスで何トークン送ったかの記録"""
+
+    request_id: int
+    model: str
+    tokens_planned: int
+    tokens_sent: int = 0
+    completed: bool = False
+    server_disconnected: bool = False
+    client_disconnected: bool = False
+
+
+class FakeOpenAIServer:
+    """HTTP/1.1 keep-alive に対応した最小限のOpenAI互換サーバー"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ttft: float = 0.05,
+        inter_token_delay: float = 0.0,
+        token_count: int = 20,
+        token_text: str = "token ",
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        disconnect_rate: float = 0.0,
+        disconnect_after: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.ttft = ttft
+        self.inter_token_delay = inter_token_delay
+        self.token_count = token_count
+        self.token_text = token_text
+        # 指定した割合のリクエストにエラーを返す
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # 指定した割合のストリームを disconnect_after トークン送った時点で切断する
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_after = disconnect_after
+        self.connections_opened = 0
+        self.requests_served = 0
+        self.errors_injected = 0
+        self.streams: List[StreamRecord] = []
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake OpenAI server listening on {self.base_url}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # keep-alive中のコネクションも閉じる
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "FakeOpenAIServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections_opened += 1
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = await self._handle_request(writer, method, path, body)
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(
+        reader: asyncio.StreamReader,
+    ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    async def _handle_request(
+        self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes
+    ) -> bool:
+        """
+        リクエストを処理する
+
+        Returns:
+            bool: コネクションを維持できる場合はTrue
+        """
+        self.requests_served += 1
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            await self._write_json(writer, 404, {"error": {"message": "Not found"}})
+            return True
+
+        payload = json.loads(body or b"{}")
+        model = payload.get("model", "fake-model")
+        await asyncio.sleep(self.ttft)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors_injected += 1
+            await self._write_json(
+                writer,
+                self.error_status,
+                {
+                    "error": {
+                        "message": "Injected error from fake server",
+                        "type": "server_error",
+                    }
+                },
+            )
+            return True
+
+        if not payload.get("stream"):
+            content = self.token_text * self.token_count
+            await self._write_json(
+                writer,
+                200,
+                {
+                    "id": f"chatcmpl-fake-{self.requests_served}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": self.token_count,
+                        "total_tokens": self.token_count,
+                    },
+                },
+            )
+            return True
+
+        return await self._stream_response(writer, model)
+
+    async def _stream_response(self, writer: asyncio.StreamWriter, model: str) -> bool:
+        record = StreamRecord(self.requests_served, model, self.token_count)
+        self.streams.append(record)
+        disconnect_at = None
+        if self.disconnect_rate and self._random.random() < self.disconnect_rate:
+            disconnect_at = (
+                self.disconnect_after
+                if self.disconnect_after is not None
+                else self._random.randrange(self.token_count)
+            )
+
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/event-stream\r\n"
+                b"Transfer-Encoding: chunked\r\n"
+                b"Connection: keep-alive\r\n\r\n"
+            )
+            for index in range(self.token_count):
+                if index == disconnect_at:
+                    # 終端のチャンクを送らずに切断する
+                    record.server_disconnected = True
+                    return False
+                if index and self.inter_token_delay:
+                    await asyncio.sleep(self.inter_token_delay)
+                delta = {"content": self.token_text}
+                if index == 0:
+                    delta["role"] = "assistant"
+                self._write_chunk(writer, self._sse_event(model, delta, None))
+                await writer.drain()
+                record.tokens_sent += 1
+            self._write_chunk(writer, self._sse_event(model, {}, "stop"))
+            self._write_chunk(writer, b"data: [DONE]\n\n")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            record.completed = True
+            return True
+        except ConnectionError:
+            record.client_disconnected = True
+            return False
+        except asyncio.CancelledError:
+            record.client_disconnected = not record.completed
+            raise
+
+    def _sse_event(
+        self, model: str, delta: dict, finish_reason: Optional[str]
+    ) -> bytes:
+        event = {
+            "id": f"chatcmpl-fake-{self.requests_served}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(event)}\n\n".encode()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    @staticmethod
+    async def _write_json(
+        writer: asyncio.StreamWriter, status: int, body: dict
+    ) -> None:
+        data = json.dumps(body).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: keep-alive\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    server = FakeOpenAIServer(
+        host=args.host,
+        port=args.port,
+        ttft=args.ttft,
+        inter_token_delay=args.inter_token_delay,
+        token_count=args.tokens,
+        token_text=args.token_text,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        disconnect_rate=args.disconnect_rate,
+        disconnect_after=args.disconnect_after,
+        seed=args.seed,
+    )
+    async with server:
+        print(f"Fake OpenAI server listening on {server.base_url}")
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--inter-token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-text", default="token ")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-after", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
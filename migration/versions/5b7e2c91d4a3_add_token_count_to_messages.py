@@ -0,0 +1,32 @@
+"""add token_count to messages
+
+Revision ID: 5b7e2c91d4a3
+Revises: c50aad860463
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b7e2c91d4a3"
+down_revision: Union[str, None] = "c50aad860463"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "messages",
+        sa.Column("token_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    # 既存の行は文字数からの概算値で埋める（新しい行は挿入時に計算される）
+    op.execute("UPDATE messages SET token_count = CEIL(char_length(content) / 4.0)")
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "token_count")
@@ -0,0 +1,43 @@
+"""add client_id to messages
+
+Revision ID: 7f3b9d2e4c61
+Revises: cc29e507c175
+Create Date: 2026-10-18 18:05:52.604117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7f3b9d2e4c61"
+down_revision: Union[str, None] = "cc29e507c175"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("client_id", sa.String(64)))
+    # 書き込みを止めないよう CONCURRENTLY で作成する（既存の行は NULL なので重複しない）
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_client_id",
+            "messages",
+            ["client_id"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_messages_client_id",
+            table_name="messages",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("messages", "client_id")
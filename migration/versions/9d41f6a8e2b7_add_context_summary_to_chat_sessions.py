@@ -0,0 +1,31 @@
+"""add context_summary to chat_sessions
+
+Revision ID: 9d41f6a8e2b7
+Revises: 5b7e2c91d4a3
+Create Date: 2026-10-18 11:03:27.118904
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9d41f6a8e2b7"
+down_revision: Union[str, None] = "5b7e2c91d4a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chat_sessions", sa.Column("context_summary", sa.Text()))
+    op.add_column(
+        "chat_sessions", sa.Column("summarized_until_message_id", sa.Integer())
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("chat_sessions", "summarized_until_message_id")
+    op.drop_column("chat_sessions", "context_summary")
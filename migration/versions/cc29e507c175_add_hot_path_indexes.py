@@ -0,0 +1,60 @@
+"""add hot path indexes
+
+Revision ID: cc29e507c175
+Revises: e4a7c1d93b58
+Create Date: 2026-10-18 16:42:13.275916
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "cc29e507c175"
+down_revision: Union[str, None] = "e4a7c1d93b58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 書き込みを止めないよう CONCURRENTLY で作成する（トランザクションの外で実行する必要がある）
+    with op.get_context().autocommit_block():
+        # スレッドのメッセージをIDの順に読むクエリ用
+        # （token_count を含めて、トークン予算の計算を表を読まずに済ませる）
+        op.create_index(
+            "ix_messages_session_id_id",
+            "messages",
+            ["session_id", "id"],
+            unique=False,
+            postgresql_include=["token_count"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # ユーザーの有効なセッションを読むクエリ用
+        op.create_index(
+            "ix_chat_sessions_user_id_end_time",
+            "chat_sessions",
+            ["user_id", "end_time"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_chat_sessions_user_id_end_time",
+            table_name="chat_sessions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_messages_session_id_id",
+            table_name="messages",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,31 @@
+"""add interrupted to messages
+
+Revision ID: e4a7c1d93b58
+Revises: 9d41f6a8e2b7
+Create Date: 2026-10-18 14:21:09.531402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e4a7c1d93b58"
+down_revision: Union[str, None] = "9d41f6a8e2b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "messages",
+        sa.Column(
+            "interrupted", sa.Boolean(), nullable=False, server_default=sa.false()
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("messages", "interrupted")